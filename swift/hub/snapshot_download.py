@@ -113,12 +113,15 @@ def snapshot_download(model_id: str,
             ignore_file_pattern = []
         if isinstance(ignore_file_pattern, str):
             ignore_file_pattern = [ignore_file_pattern]
+        ignore_file_pattern = [
+            re.compile(pattern) for pattern in ignore_file_pattern
+        ]
 
         with tempfile.TemporaryDirectory(
                 dir=temporary_cache_dir) as temp_cache_dir:
             for model_file in model_files:
                 if model_file['Type'] == 'tree' or \
-                        any([re.search(pattern, model_file['Name']) is not None for pattern in ignore_file_pattern]):
+                        any(pattern.search(model_file['Name']) is not None for pattern in ignore_file_pattern):
                     continue
                 # check model_file is exist in cache, if existed, skip download, otherwise download
                 if cache.exists(model_file):
@@ -1,79 +1,121 @@
 # Copyright (c) Alibaba, Inc. and its affiliates.
 import datetime as dt
+import hashlib
 import os
 import shutil
-from typing import Any, Dict, Literal, Optional, Tuple
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (TYPE_CHECKING, Any, Dict, Iterable, Iterator, List,
+                    Literal, Optional, Tuple)
 
 import json
-import numpy as np
-import torch
-from modelscope import BitsAndBytesConfig, GenerationConfig
-from tqdm import tqdm
-from transformers import PreTrainedModel, PreTrainedTokenizerBase
-from transformers.utils import is_torch_npu_available
 
 from swift.tuners import Swift
 from swift.utils import (append_to_jsonl, get_logger, get_main, get_model_info,
                          read_multi_line, seed_everything, show_layers)
-from .utils import (InferArguments, Template, get_additional_saved_files,
-                    get_dataset, get_model_tokenizer, get_template, inference,
-                    inference_stream, is_adapter, set_generation_config)
+from .utils import (MODEL_MAPPING, History, InferArguments, Template,
+                    get_additional_saved_files, get_dataset,
+                    get_model_tokenizer, get_template, inference,
+                    inference_batch, inference_stream, is_adapter,
+                    set_generation_config)
+
+if TYPE_CHECKING:
+    from transformers import PreTrainedModel, PreTrainedTokenizerBase
 
 logger = get_logger()
 
 
-def save_checkpoint(model: Optional[PreTrainedModel],
-                    tokenizer: PreTrainedTokenizerBase,
+def save_checkpoint(model: Optional['PreTrainedModel'],
+                    tokenizer: 'PreTrainedTokenizerBase',
                     model_cache_dir: str,
                     ckpt_dir: Optional[str],
                     target_dir: str,
                     *,
                     save_safetensors: bool = True) -> None:
-    if model is not None:
-        model.save_pretrained(target_dir, safe_serialization=save_safetensors)
-    tokenizer.save_pretrained(target_dir)
-    model_type = getattr(tokenizer, 'model_type')
-    fname_list = ['generation_config.json', 'preprocessor_config.json']
-    if model_type is not None:
-        fname_list += get_additional_saved_files(model_type)
-
-    for fname in fname_list:
-        tgt_path = os.path.join(target_dir, fname)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        model_future = None
+        if model is not None:
+            # Write the weights in the background, overlapping with the tokenizer and config files.
+            model_future = executor.submit(
+                model.save_pretrained,
+                target_dir,
+                safe_serialization=save_safetensors)
+        tokenizer.save_pretrained(target_dir)
+        model_type = getattr(tokenizer, 'model_type')
+        fname_list = ['generation_config.json', 'preprocessor_config.json']
+        if model_type is not None:
+            fname_list += get_additional_saved_files(model_type)
+
+        copy_list = []
+        for fname in fname_list:
+            tgt_path = os.path.join(target_dir, fname)
+            for model_dir in [ckpt_dir, model_cache_dir]:
+                if model_dir is None:
+                    continue
+                src_path = os.path.join(model_dir, fname)
+                if os.path.isfile(src_path):
+                    copy_list.append((shutil.copyfile, src_path, tgt_path))
+                    break
+                elif os.path.isdir(src_path):
+                    copy_list.append((shutil.copytree, src_path, tgt_path))
+                    break
+        # configuration.json
+        configuration_fname = 'configuration.json'
+        new_configuration_path = os.path.join(target_dir, configuration_fname)
         for model_dir in [ckpt_dir, model_cache_dir]:
             if model_dir is None:
                 continue
-            src_path = os.path.join(model_dir, fname)
-            if os.path.isfile(src_path):
-                shutil.copy(src_path, tgt_path)
+            old_configuration_path = os.path.join(model_dir,
+                                                  configuration_fname)
+            if os.path.exists(old_configuration_path):
+                with open(old_configuration_path, 'r', encoding='utf-8') as f:
+                    res = json.load(f)
+                res.pop('adapter_cfg', None)
+                with open(new_configuration_path, 'w', encoding='utf-8') as f:
+                    json.dump(res, f, ensure_ascii=False, indent=4)
                 break
-            elif os.path.isdir(src_path):
-                shutil.copytree(src_path, tgt_path)
-                break
-    # configuration.json
-    configuration_fname = 'configuration.json'
-    new_configuration_path = os.path.join(target_dir, configuration_fname)
-    for model_dir in [ckpt_dir, model_cache_dir]:
-        if model_dir is None:
-            continue
-        old_configuration_path = os.path.join(model_dir, configuration_fname)
-        if os.path.exists(old_configuration_path):
-            with open(old_configuration_path, 'r', encoding='utf-8') as f:
-                res = json.load(f)
-            res.pop('adapter_cfg', None)
-            with open(new_configuration_path, 'w', encoding='utf-8') as f:
-                json.dump(res, f, ensure_ascii=False, indent=4)
-            break
-    if ckpt_dir is not None:
-        # sft_args.json
-        sft_args_fname = 'sft_args.json'
-        old_sft_args_path = os.path.join(ckpt_dir, sft_args_fname)
-        new_sft_args_path = os.path.join(target_dir, sft_args_fname)
-        if os.path.exists(old_sft_args_path):
-            with open(old_sft_args_path, 'r', encoding='utf-8') as f:
-                res = json.load(f)
-            res['sft_type'] = 'full'
-            with open(new_sft_args_path, 'w', encoding='utf-8') as f:
-                json.dump(res, f, ensure_ascii=False, indent=2)
+        if ckpt_dir is not None:
+            # sft_args.json
+            sft_args_fname = 'sft_args.json'
+            old_sft_args_path = os.path.join(ckpt_dir, sft_args_fname)
+            new_sft_args_path = os.path.join(target_dir, sft_args_fname)
+            if os.path.exists(old_sft_args_path):
+                with open(old_sft_args_path, 'r', encoding='utf-8') as f:
+                    res = json.load(f)
+                res['sft_type'] = 'full'
+                with open(new_sft_args_path, 'w', encoding='utf-8') as f:
+                    json.dump(res, f, ensure_ascii=False, indent=2)
+        if model_future is not None:
+            model_future.result()
+        # The copied files (e.g. generation_config.json) must overwrite the ones written by `save_pretrained`.
+        # shutil.copyfile uses os.sendfile on Linux (zero-copy).
+        futures = [
+            executor.submit(copy_func, src_path, tgt_path)
+            for copy_func, src_path, tgt_path in copy_list
+        ]
+        for future in futures:
+            future.result()
+
+
+def _get_merge_fingerprint(args: InferArguments) -> str:
+    """A cheap fingerprint of the merge: the base model, the merge dtype
+    and the (path, size, mtime) of the files in the checkpoint."""
+    ckpt_dir = args.ckpt_dir
+    h = hashlib.blake2b(digest_size=16)
+    h.update(
+        f'{args.model_type}:{args.model_id_or_path}:{args.model_revision}:{args.dtype};'
+        .encode('utf-8'))
+    for root, dirs, files in os.walk(ckpt_dir):
+        dirs.sort()
+        for fname in sorted(files):
+            fpath = os.path.join(root, fname)
+            stat = os.stat(fpath)
+            h.update(
+                f'{os.path.relpath(fpath, ckpt_dir)}:{stat.st_size}:{stat.st_mtime_ns};'
+                .encode('utf-8'))
+    return h.hexdigest()
 
 
 def merge_lora(args: InferArguments,
@@ -83,20 +125,34 @@ def merge_lora(args: InferArguments,
     logger.info(f'replace_if_exists: {replace_if_exists}')
     assert args.ckpt_dir is not None, 'args.ckpt_dir is not specified.'
     assert args.sft_type == 'lora', "Only supports sft_type == 'lora'"
-    for s in ['int4', 'int8', 'awq']:
-        assert s not in args.model_type, f'{s} model is not supported'
+    quant_method = MODEL_MAPPING[args.model_type].get('quant_method')
+    assert quant_method not in ('gptq', 'bnb', 'awq'), (
+        f'{quant_method} model is not supported')
     if args.quantization_bit != 0:
         logger.warning('It is not recommended to merge quantized models, '
                        'as this can result in performance degradation')
     ckpt_dir, ckpt_name = os.path.split(args.ckpt_dir)
     merged_lora_path = os.path.join(ckpt_dir, f'{ckpt_name}-merged')
     logger.info(f'merged_lora_path: `{merged_lora_path}`')
+    fingerprint_path = os.path.join(merged_lora_path, '.merge_fingerprint')
     if os.path.exists(merged_lora_path) and not replace_if_exists:
         logger.info(
             f'The weight directory for the merged LoRA already exists in {args.ckpt_dir}, '
             'skipping the saving process. '
             'you can pass `replace_if_exists=True` to overwrite it.')
+        if os.path.isfile(fingerprint_path):
+            with open(fingerprint_path, 'r', encoding='utf-8') as f:
+                is_merged = f.read().strip() == _get_merge_fingerprint(args)
+            if not is_merged:
+                logger.warning(
+                    f'The merged LoRA in {merged_lora_path} is out of date with {args.ckpt_dir} '
+                    'or the base model. Please pass `replace_if_exists=True` to merge it again.'
+                )
     else:
+        # A fingerprint left by an earlier merge must not outlive a failed save.
+        if os.path.isfile(fingerprint_path):
+            os.remove(fingerprint_path)
+        fingerprint = _get_merge_fingerprint(args)
         model, template = prepare_model_template(
             args, device_map=args.merge_device_map, verbose=False)
         logger.info('Merge LoRA...')
@@ -110,6 +166,11 @@ def merge_lora(args: InferArguments,
             args.ckpt_dir,
             merged_lora_path,
             save_safetensors=args.save_safetensors)
+        # written last, once all the files of the merged model are saved.
+        tmp_path = f'{fingerprint_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(fingerprint)
+        os.replace(tmp_path, fingerprint_path)
         logger.info(
             f'Successfully merged LoRA and saved in {merged_lora_path}.')
     logger.info("Setting args.sft_type: 'full'")
@@ -119,27 +180,62 @@ def merge_lora(args: InferArguments,
     return merged_lora_path
 
 
+def _get_generation_config_kwargs(
+        args: InferArguments,
+        tokenizer: 'PreTrainedTokenizerBase') -> Dict[str, Any]:
+    # pad_token_id/eos_token_id are properties of the tokenizer, read them once.
+    pad_token_id, eos_token_id = tokenizer.pad_token_id, tokenizer.eos_token_id
+    generation_config_kwargs = {
+        'max_new_tokens': args.max_new_tokens,
+        'temperature': args.temperature,
+        'top_k': args.top_k,
+        'top_p': args.top_p,
+        'do_sample': args.do_sample,
+        'repetition_penalty': args.repetition_penalty,
+        'num_beams': args.num_beams,
+        'pad_token_id': pad_token_id,
+        'eos_token_id': eos_token_id
+    }
+    if not args.do_sample and args.num_beams == 1:
+        # greedy search: the sampling params are unused, keep the defaults of GenerationConfig.
+        for key in ['temperature', 'top_k', 'top_p']:
+            generation_config_kwargs.pop(key)
+    return generation_config_kwargs
+
+
 def prepare_model_template(
         args: InferArguments,
         *,
         device_map: Optional[str] = None,
         verbose: bool = True,
-        automodel_class=None) -> Tuple[PreTrainedModel, Template]:
+        automodel_class=None) -> Tuple['PreTrainedModel', Template]:
+    # Heavy dependencies are imported lazily to keep the CLI startup fast.
+    import torch
+    from modelscope import BitsAndBytesConfig, GenerationConfig
+    from transformers.utils import is_torch_npu_available
 
     model_kwargs = {}
-    if is_torch_npu_available():
-        logger.info(f'device_count: {torch.npu.device_count()}')
-        if device_map is None:
-            device_map = 'npu:0'
-    else:
-        logger.info(f'device_count: {torch.cuda.device_count()}')
-        if device_map is None:
+    # Probing the device count initializes CUDA/NPU,
+    # so it is only done when the device_map needs to be inferred.
+    if device_map is None or device_map == 'auto':
+        if is_torch_npu_available():
+            logger.info(f'device_count: {torch.npu.device_count()}')
+            if device_map is None:
+                device_map = 'npu:0'
+        else:
+            logger.info(f'device_count: {torch.cuda.device_count()}')
             device_map = 'auto'
     if device_map == 'auto':
         model_kwargs['low_cpu_mem_usage'] = True
     model_kwargs['device_map'] = device_map
 
     # Loading Model and Tokenizer
+    if args.load_in_8bit:
+        logger.warning(
+            'bnb int8 kernels are designed for training and are usually slower than fp16 at inference. '
+            'It is recommended to use a GPTQ/AWQ int4 model instead, e.g. the `*-int4`/`*-awq` model_type, '
+            'or quantize it with `swift export --quant_bits 4 --quant_method awq`.'
+        )
     if args.load_in_8bit or args.load_in_4bit:
         quantization_config = BitsAndBytesConfig(
             args.load_in_8bit,
@@ -173,15 +269,7 @@ def prepare_model_template(
         logger.info(f'model_config: {model.config}')
 
     generation_config = GenerationConfig(
-        max_new_tokens=args.max_new_tokens,
-        temperature=args.temperature,
-        top_k=args.top_k,
-        top_p=args.top_p,
-        do_sample=args.do_sample,
-        repetition_penalty=args.repetition_penalty,
-        num_beams=args.num_beams,
-        pad_token_id=tokenizer.pad_token_id,
-        eos_token_id=tokenizer.eos_token_id)
+        **_get_generation_config_kwargs(args, tokenizer))
     logger.info(f'generation_config: {generation_config}')
     set_generation_config(model, generation_config)
 
@@ -219,24 +307,114 @@ def prepare_model_template(
     return model, template
 
 
+class _StreamPrinter:
+    """Write the incremental part of a streaming response to stdout.
+
+    stdout is flushed at most once every `flush_interval` seconds instead of on every chunk.
+    """
+
+    def __init__(self, flush_interval: float = 0.016) -> None:
+        self.flush_interval = flush_interval
+        self.print_idx = 0
+        self.last_flush_time = time.perf_counter()
+
+    def write(self, response: str) -> None:
+        if len(response) <= self.print_idx:
+            return
+        sys.stdout.write(response[self.print_idx:])
+        self.print_idx = len(response)
+        cur_time = time.perf_counter()
+        if cur_time - self.last_flush_time >= self.flush_interval:
+            sys.stdout.flush()
+            self.last_flush_time = cur_time
+
+    def end(self) -> None:
+        sys.stdout.write('\n')
+        sys.stdout.flush()
+
+
+def _print_stream(gen: Iterator[Tuple[str, History]],
+                  verbose: bool = True) -> Tuple[str, History]:
+    """Consume a streaming generator, printing the response if verbose.
+
+    return: the final response and history.
+    """
+    stream_printer = _StreamPrinter()
+    response, history = '', None
+    for response, history in gen:
+        if verbose:
+            stream_printer.write(response)
+    stream_printer.end()
+    return response, history
+
+
+def _unpack_vllm_stream(
+        gen: Iterator[List[Dict[str, Any]]]) -> Iterator[Tuple[str, History]]:
+    # single request
+    for resp_list in gen:
+        yield resp_list[0]['response'], resp_list[0]['history']
+
+
+def _iter_encoded_dataset(
+    template: Template,
+    dataset: Iterable[Dict[str, Any]],
+    optional_keys: List[str],
+    prefetch_factor: int = 4
+) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any], Optional[Future]]]:
+    """Yield (data, inference kwargs, future of `template.encode`).
+
+    The upcoming text-only examples are encoded in a background thread,
+    so that the tokenization overlaps with the generation of the current example.
+    """
+    # Templates that override `encode` may run the model (e.g. xcomposer2's encode_img)
+    # or load media found in the query (e.g. qwen-audio), which is not thread-safe.
+    if type(template).encode is not Template.encode:
+        prefetch_factor = 0
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        queue = deque()
+        for data in dataset:
+            kwargs = {'query': data['query']}
+            for key in optional_keys:
+                value = data[key]
+                if value is not None:
+                    kwargs[key] = value
+            future = None
+            if prefetch_factor > 0 and 'images' not in kwargs:
+                example = {
+                    'query': kwargs['query'],
+                    'history': kwargs.get('history', []),
+                    'system': kwargs.get('system'),
+                    'images': None
+                }
+                future = executor.submit(template.encode, example)
+            queue.append((data, kwargs, future))
+            if len(queue) > prefetch_factor:
+                yield queue.popleft()
+        while len(queue) > 0:
+            yield queue.popleft()
+
+
 def read_media_file(
         infer_kwargs: Dict[str, Any],
         infer_media_type: Literal['none', 'round', 'dialogue']) -> None:
-    text = 'Input a media path or URL <<< '
-    images = infer_kwargs.get('images', [])
     if infer_media_type == 'none':
         return
-    if infer_media_type == 'round' or len(images) == 0:
+    text = 'Input a media path or URL <<< '
+    images = infer_kwargs.get('images')
+    if infer_media_type == 'round' or images is None:
         image = input(text)
         if len(image) > 0:
-            images += [image]
-    if len(images) > 0:
-        infer_kwargs['images'] = images
+            infer_kwargs.setdefault('images', []).append(image)
 
 
 def llm_infer(args: InferArguments) -> None:
+    import numpy as np
+    import torch
+    from tqdm import tqdm
     logger.info(f'args: {args}')
-    seed_everything(args.seed)
+    if args.do_sample:
+        # Greedy decoding is deterministic and the dataset sampling uses `dataset_seed`.
+        seed_everything(args.seed)
     if args.merge_lora:
         merge_lora(args, device_map=args.merge_device_map)
     if args.infer_backend == 'vllm':
@@ -263,215 +441,257 @@ def llm_infer(args: InferArguments) -> None:
             os.makedirs(result_dir, exist_ok=True)
             time = dt.datetime.now().strftime('%Y%m%d-%H%M%S')
             jsonl_path = os.path.join(result_dir, f'{time}.jsonl')
-    if args.eval_human:
-        input_mode: Literal['S', 'M'] = 'S'
-        logger.info('Input `exit` or `quit` to exit the conversation.')
-        logger.info('Input `multi-line` to switch to multi-line input mode.')
-        logger.info(
-            'Input `reset-system` to reset the system and clear the history.')
-        if template.support_multi_round:
-            logger.info('Input `clear` to clear the history.')
-        else:
+    # `inference_mode` is scoped to this command, where the model is never trained.
+    with torch.inference_mode():
+        if args.eval_human:
+            input_mode: Literal['S', 'M'] = 'S'
+            logger.info('Input `exit` or `quit` to exit the conversation.')
             logger.info(
-                'The current template only supports single-round dialogues.')
-        history = []
-        infer_kwargs = {}
-        if args.infer_media_type != 'none':
-            logger.info('Please enter the conversation content first, '
-                        'followed by the path to the multimedia file.')
-        system = None
-        read_system = False
-        while True:
-            if input_mode == 'S':
-                addi_prompt = ''
-                if read_system:
-                    addi_prompt = '[S]'
-                query = input(f'<<<{addi_prompt} ')
+                'Input `multi-line` to switch to multi-line input mode.')
+            logger.info(
+                'Input `reset-system` to reset the system and clear the history.'
+            )
+            if template.support_multi_round:
+                logger.info('Input `clear` to clear the history.')
             else:
-                addi_prompt = '[M]'
-                if read_system:
-                    addi_prompt = '[MS]'
-                query = read_multi_line(addi_prompt)
-            if query.strip().lower() in {'exit', 'quit'}:
-                break
-            elif query.strip().lower() == 'clear':
-                history = []
-                infer_kwargs = {}
-                continue
-            elif query.strip() == '':
-                continue
-            elif query.strip().lower() == 'reset-system':
-                read_system = True
-                continue
-            if read_system:
-                system = query
-                read_system = False
-                continue
-            if input_mode == 'S' and query.strip().lower() == 'multi-line':
-                input_mode = 'M'
-                logger.info('End multi-line input with `#`.')
                 logger.info(
-                    'Input `single-line` to switch to single-line input mode.')
-                continue
-            if input_mode == 'M' and query.strip().lower() == 'single-line':
-                input_mode = 'S'
-                continue
-            if not template.support_multi_round:
-                history = []
-                infer_kwargs = {}
+                    'The current template only supports single-round dialogues.'
+                )
+            history = []
+            infer_kwargs = {}
+            if args.infer_media_type != 'none':
+                logger.info('Please enter the conversation content first, '
+                            'followed by the path to the multimedia file.')
+            system = None
+            read_system = False
+            # loop invariants
+            use_vllm = args.infer_backend == 'vllm'
+            stream = args.stream
+            support_multi_round = template.support_multi_round
+            stop_words = args.stop_words
+            infer_media_type = args.infer_media_type
+            while True:
+                if input_mode == 'S':
+                    addi_prompt = ''
+                    if read_system:
+                        addi_prompt = '[S]'
+                    query = input(f'<<<{addi_prompt} ')
+                else:
+                    addi_prompt = '[M]'
+                    if read_system:
+                        addi_prompt = '[MS]'
+                    query = read_multi_line(addi_prompt)
+                command = query.strip().lower()
+                if command in {'exit', 'quit'}:
+                    break
+                elif command == 'clear':
+                    history = []
+                    infer_kwargs = {}
+                    continue
+                elif command == '':
+                    continue
+                elif command == 'reset-system':
+                    read_system = True
+                    continue
+                if read_system:
+                    system = query
+                    read_system = False
+                    continue
+                if input_mode == 'S' and command == 'multi-line':
+                    input_mode = 'M'
+                    logger.info('End multi-line input with `#`.')
+                    logger.info(
+                        'Input `single-line` to switch to single-line input mode.'
+                    )
+                    continue
+                if input_mode == 'M' and command == 'single-line':
+                    input_mode = 'S'
+                    continue
+                if not support_multi_round:
+                    history = []
+                    infer_kwargs = {}
 
-            read_media_file(infer_kwargs, args.infer_media_type)
-            if args.infer_backend == 'vllm':
-                request_list = [{
-                    'query': query,
-                    'history': history,
-                    'system': system
-                }]
-                if args.stream:
-                    gen = inference_stream_vllm(
-                        llm_engine,
-                        template,
-                        request_list,
-                        lora_request=lora_request)
-                    print_idx = 0
-                    for resp_list in gen:
+                if infer_media_type != 'none':
+                    read_media_file(infer_kwargs, infer_media_type)
+                if use_vllm:
+                    request_list = [{
+                        'query': query,
+                        'history': history,
+                        'system': system
+                    }]
+                    if stream:
+                        gen = inference_stream_vllm(
+                            llm_engine,
+                            template,
+                            request_list,
+                            lora_request=lora_request)
+                        response, new_history = _print_stream(
+                            _unpack_vllm_stream(gen))
+                    else:
+                        resp_list = inference_vllm(
+                            llm_engine,
+                            template,
+                            request_list,
+                            lora_request=lora_request)
                         response = resp_list[0]['response']
                         new_history = resp_list[0]['history']
-                        if len(response) > print_idx:
-                            print(response[print_idx:], end='', flush=True)
-                            print_idx = len(response)
-                    print()
-                else:
-                    resp_list = inference_vllm(
-                        llm_engine,
-                        template,
-                        request_list,
-                        lora_request=lora_request)
-                    response = resp_list[0]['response']
-                    new_history = resp_list[0]['history']
-                    print(response)
-            else:
-                if args.stop_words:
-                    infer_kwargs['stop_words'] = args.stop_words
-                if args.stream:
-                    gen = inference_stream(model, template, query, history,
-                                           system, **infer_kwargs)
-                    print_idx = 0
-                    for response, new_history in gen:
-                        if len(response) > print_idx:
-                            print(response[print_idx:], end='', flush=True)
-                            print_idx = len(response)
-                    print()
+                        print(response)
                 else:
-                    response, new_history = inference(model, template, query,
-                                                      history, system,
-                                                      **infer_kwargs)
-                    print(response)
-            print('-' * 50)
-            obj = {
-                'query': query,
-                'response': response,
-                'history': history,
-            }
-            history = new_history
-            if jsonl_path is not None:
-                append_to_jsonl(jsonl_path, obj)
-            result.append(obj)
-    else:
-        random_state = np.random.RandomState(args.dataset_seed)
-        _, val_dataset = get_dataset(
-            args.dataset,
-            args.dataset_test_ratio,
-            random_state,
-            check_dataset_strategy=args.check_dataset_strategy)
-        if args.val_dataset_sample >= 0 and val_dataset.shape[
-                0] > args.val_dataset_sample:
-            logger.info(f'val_dataset_sample: {args.val_dataset_sample}')
-            val_idxs = random_state.permutation(args.val_dataset_sample)
-            val_dataset = val_dataset.select(val_idxs)
-
-        logger.info(f'val_dataset: {val_dataset}')
-        if args.verbose is None:
-            if len(val_dataset) >= 100:
-                args.verbose = False
-            else:
-                args.verbose = True
-            logger.info(f'Setting args.verbose: {args.verbose}')
-        if not args.verbose and args.stream:
-            args.stream = False
-            logger.info(f'Setting args.stream: {args.stream}')
-
-        if args.infer_backend == 'vllm' and not args.stream:
-            if args.verbose:
-                args.verbose = False
-                logger.info('Setting args.verbose: False')
-            label_list = None
-            if 'response' in val_dataset.features:
-                label_list = val_dataset['response']
-            val_dataset = val_dataset.remove_columns('response')
-            request_list = val_dataset.to_list()
-            resp_list = inference_vllm(
-                llm_engine, template, request_list, use_tqdm=True)
-            result = []
-            if label_list is not None:
-                for request, label in zip(request_list, label_list):
-                    request['label'] = label
-            for request, resp in zip(request_list, resp_list):
-                obj = {'response': resp['response'], **request}
+                    if stop_words:
+                        infer_kwargs['stop_words'] = stop_words
+                    if stream:
+                        gen = inference_stream(model, template, query, history,
+                                               system, **infer_kwargs)
+                        response, new_history = _print_stream(gen)
+                    else:
+                        response, new_history = inference(
+                            model, template, query, history, system,
+                            **infer_kwargs)
+                        print(response)
+                print('-' * 50)
+                obj = {
+                    'query': query,
+                    'response': response,
+                    'history': history,
+                }
+                history = new_history
                 if jsonl_path is not None:
                     append_to_jsonl(jsonl_path, obj)
                 result.append(obj)
         else:
-            if not args.verbose:
-                val_dataset = tqdm(val_dataset)
-            for data in val_dataset:
-                kwargs = {'query': data['query']}
-                history = data.get('history')
-                system = data.get('system')
-                images = data.get('images')
-                if args.verbose and system is not None:
-                    print(f'[SYSTEM]{system}')
-                if history is not None:
-                    kwargs['history'] = history
-                if system is not None:
-                    kwargs['system'] = system
-                if images is not None:
-                    kwargs['images'] = images
-                if args.infer_backend == 'vllm':
-                    assert args.stream is True
-                    if args.verbose:
-                        print(f"[QUERY]{data['query']}\n[RESPONSE]", end='')
-                    gen = inference_stream_vllm(
-                        llm_engine,
-                        template, [kwargs],
-                        lora_request=lora_request)
-                    print_idx = 0
-                    for resp_list in gen:
-                        response = resp_list[0]['response']
-                        if args.verbose and len(response) > print_idx:
-                            print(response[print_idx:], end='', flush=True)
-                            print_idx = len(response)
-                    print()
+            random_state = np.random.RandomState(args.dataset_seed)
+            _, val_dataset = get_dataset(
+                args.dataset,
+                args.dataset_test_ratio,
+                random_state,
+                check_dataset_strategy=args.check_dataset_strategy)
+            if args.val_dataset_sample >= 0 and val_dataset.shape[
+                    0] > args.val_dataset_sample:
+                logger.info(f'val_dataset_sample: {args.val_dataset_sample}')
+                rng = np.random.default_rng(args.dataset_seed)
+                val_idxs = rng.choice(
+                    val_dataset.shape[0],
+                    size=args.val_dataset_sample,
+                    replace=False)
+                val_dataset = val_dataset.select(val_idxs)
+
+            logger.info(f'val_dataset: {val_dataset}')
+            if args.verbose is None:
+                if len(val_dataset) >= 100:
+                    args.verbose = False
                 else:
-                    response, _ = inference(
-                        model,
-                        template,
-                        stream=args.stream and args.verbose,
-                        verbose=args.verbose,
-                        **kwargs)
-                label = data.pop('response')
-                if label is not None:
-                    kwargs['label'] = label
-                obj = {'response': response, **kwargs}
-                if jsonl_path is not None:
-                    append_to_jsonl(jsonl_path, obj)
-                result.append(obj)
+                    args.verbose = True
+                logger.info(f'Setting args.verbose: {args.verbose}')
+            if not args.verbose and args.stream:
+                args.stream = False
+                logger.info(f'Setting args.stream: {args.stream}')
+
+            if args.infer_backend == 'vllm' and not args.stream:
                 if args.verbose:
-                    print()
-                    print(f'[LABELS]{label}')
-                    if images is not None:
-                        print(f'[IMAGES]{images}')
-                    print('-' * 50)
+                    args.verbose = False
+                    logger.info('Setting args.verbose: False')
+                result = []
+                # Read the arrow table in chunks instead of `to_list()`,
+                # so that only the rows being generated are converted to python objects.
+                chunk_size = 1024
+                # Use vllm's progress bar when there is only one chunk, otherwise a single outer progress bar.
+                use_tqdm = len(val_dataset) <= chunk_size
+                prog_bar = tqdm(
+                    total=len(val_dataset),
+                    dynamic_ncols=True,
+                    disable=use_tqdm)
+                for batched_data in val_dataset.iter(batch_size=chunk_size):
+                    label_list = batched_data.pop('response', None)
+                    keys = list(batched_data.keys())
+                    request_list = [
+                        dict(zip(keys, values))
+                        for values in zip(*batched_data.values())
+                    ]
+                    resp_list = inference_vllm(
+                        llm_engine, template, request_list, use_tqdm=use_tqdm)
+                    prog_bar.update(len(request_list))
+                    if label_list is not None:
+                        for request, label in zip(request_list, label_list):
+                            request['label'] = label
+                    for request, resp in zip(request_list, resp_list):
+                        obj = {'response': resp['response'], **request}
+                        if jsonl_path is not None:
+                            append_to_jsonl(jsonl_path, obj)
+                        result.append(obj)
+                prog_bar.close()
+            elif (args.infer_backend != 'vllm' and not args.verbose
+                  and args.eval_batch_size > 1):
+                label_list = None
+                if 'response' in val_dataset.features:
+                    label_list = val_dataset['response']
+                    val_dataset = val_dataset.remove_columns('response')
+                request_list = val_dataset.to_list()
+                if label_list is not None:
+                    for request, label in zip(request_list, label_list):
+                        request['label'] = label
+                result = []
+                batch_size = args.eval_batch_size
+                for i in tqdm(range(0, len(request_list), batch_size)):
+                    batched_request = request_list[i:i + batch_size]
+                    resp_list = inference_batch(
+                        model, template,
+                        [{k: v
+                          for k, v in request.items() if k != 'label'}
+                         for request in batched_request])
+                    for request, resp in zip(batched_request, resp_list):
+                        obj = {'response': resp['response'], **request}
+                        if jsonl_path is not None:
+                            append_to_jsonl(jsonl_path, obj)
+                        result.append(obj)
+            else:
+                # The columns are the same for all rows, resolve them once.
+                optional_keys = [
+                    key for key in ['history', 'system', 'images']
+                    if key in val_dataset.features
+                ]
+                if args.infer_backend != 'vllm' and not args.verbose:
+                    val_dataset = tqdm(val_dataset)
+                # vllm encodes the requests itself.
+                prefetch_factor = 0 if args.infer_backend == 'vllm' else 4
+                for data, kwargs, encoded_future in _iter_encoded_dataset(
+                        template, val_dataset, optional_keys, prefetch_factor):
+                    if args.verbose and 'system' in kwargs:
+                        print(f"[SYSTEM]{kwargs['system']}")
+                    if args.infer_backend == 'vllm':
+                        assert args.stream is True
+                        if args.verbose:
+                            print(
+                                f"[QUERY]{data['query']}\n[RESPONSE]", end='')
+                        gen = inference_stream_vllm(
+                            llm_engine,
+                            template, [kwargs],
+                            lora_request=lora_request)
+                        response, _ = _print_stream(
+                            _unpack_vllm_stream(gen), args.verbose)
+                    else:
+                        encoded_inputs = None
+                        if encoded_future is not None:
+                            encoded_inputs = encoded_future.result()
+                        response, _ = inference(
+                            model,
+                            template,
+                            stream=args.stream and args.verbose,
+                            verbose=args.verbose,
+                            encoded_inputs=encoded_inputs,
+                            **kwargs)
+                    label = data.pop('response')
+                    if label is not None:
+                        kwargs['label'] = label
+                    obj = {'response': response, **kwargs}
+                    if jsonl_path is not None:
+                        append_to_jsonl(jsonl_path, obj)
+                    result.append(obj)
+                    if args.verbose:
+                        print()
+                        print(f'[LABELS]{label}')
+                        if 'images' in kwargs:
+                            print(f"[IMAGES]{kwargs['images']}")
+                        print('-' * 50)
     if jsonl_path is not None:
         logger.info(f'save_result_path: {jsonl_path}')
     if args.val_dataset_sample == 10:  # is default
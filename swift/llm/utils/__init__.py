@@ -33,10 +33,11 @@ from .template import (DEFAULT_SYSTEM, TEMPLATE_MAPPING, History, Prompt,
 from .utils import (LazyLLMDataset, LLMDataset, dataset_map, download_dataset,
                     find_all_linears, find_embedding, find_ln,
                     get_max_model_len, get_time_info, history_to_messages,
-                    inference, inference_stream, is_vllm_available,
-                    limit_history_length, messages_to_history, print_example,
-                    safe_tokenizer_decode, set_generation_config,
-                    sort_by_max_length, stat_dataset, to_device)
+                    inference, inference_batch, inference_stream,
+                    is_vllm_available, limit_history_length,
+                    messages_to_history, print_example, safe_tokenizer_decode,
+                    set_generation_config, sort_by_max_length, stat_dataset,
+                    to_device)
 
 try:
     if is_vllm_available():
@@ -26,7 +26,8 @@ from swift.utils import (add_version_to_work_dir, get_dist_setting, get_logger,
 from .dataset import (DATASET_MAPPING, get_custom_dataset, get_dataset,
                       register_dataset)
 from .model import (MODEL_MAPPING, dtype_mapping, get_additional_saved_files,
-                    get_default_lora_target_modules, get_default_template_type)
+                    get_default_lora_target_modules, get_default_template_type,
+                    get_model_type_by_id)
 from .template import TEMPLATE_MAPPING
 from .utils import is_vllm_available
 
@@ -229,13 +230,9 @@ class ArgumentsBase:
             self.model_cache_dir = None
 
         if self.model_id_or_path is not None:
-            model_mapping_reversed = {
-                v['model_id_or_path'].lower(): k
-                for k, v in MODEL_MAPPING.items()
-            }
             model_id_or_path = self.model_id_or_path
-            model_id_or_path_lower = model_id_or_path.lower()
-            if model_id_or_path_lower not in model_mapping_reversed:
+            model_type = get_model_type_by_id(model_id_or_path)
+            if model_type is None:
                 if (isinstance(self, InferArguments)
                         and 'checkpoint' in model_id_or_path
                         and 'merged' not in model_id_or_path
@@ -249,7 +246,6 @@ class ArgumentsBase:
                         'Please set `--model_type <model_type>` additionally.')
                 assert self.model_cache_dir is None
             else:
-                model_type = model_mapping_reversed[model_id_or_path_lower]
                 assert self.model_type is None or self.model_type == model_type
                 self.model_type = model_type
                 logger.info(f'Setting args.model_type: {model_type}')
@@ -670,7 +666,8 @@ class SftArguments(ArgumentsBase):
             assert len(self.additional_trainable_parameters) == 0, (
                 'lora does not support `additional_trainable_parameters`, please set `--sft_type full`'
             )
-            if 'int4' in self.model_type or 'int8' in self.model_type or 'awq' in self.model_type:
+            quant_method = MODEL_MAPPING[self.model_type].get('quant_method')
+            if quant_method in ('gptq', 'bnb', 'awq'):
                 assert self.quantization_bit == 0, 'int4, int8 or awq models do not need to be quantized again.'
             if self.learning_rate is None:
                 self.learning_rate = 1e-4
@@ -794,6 +791,13 @@ class SftArguments(ArgumentsBase):
         kwargs = {}
         if self.neftune_backend != 'swift':
             kwargs['neftune_noise_alpha'] = self.neftune_noise_alpha
+        if (self.gradient_checkpointing and version.parse(
+                transformers.__version__) >= version.parse('4.35')
+                and version.parse(torch.__version__) >= version.parse('2.1')):
+            # non-reentrant checkpointing avoids the extra autograd.Function
+            # boundary per layer; torch 2.0 keeps the reentrant variant
+            # (see fix_gradient_checkpointing_warning).
+            kwargs['gradient_checkpointing_kwargs'] = {'use_reentrant': False}
 
         training_args = Seq2SeqTrainingArguments(
             output_dir=self.output_dir,
@@ -936,6 +940,8 @@ class InferArguments(ArgumentsBase):
     repetition_penalty: float = 1.
     num_beams: int = 1
     stop_words: List[str] = None
+    # batch inference, only used for the non-vllm, non-verbose dataset evaluation.
+    eval_batch_size: int = 1
 
     # other
     use_flash_attn: Optional[bool] = None
@@ -2,28 +2,27 @@
 import inspect
 import os
 import sys
-from contextlib import nullcontext
-from functools import partial, update_wrapper, wraps
+import threading
+from contextlib import contextmanager, nullcontext
+from copy import copy, deepcopy
+from functools import lru_cache, partial, update_wrapper, wraps
 from types import MethodType
-from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+from typing import (Any, Callable, ClassVar, Dict, FrozenSet, List, NamedTuple,
+                    Optional, Sequence, Tuple, Type)
+from weakref import WeakKeyDictionary, WeakSet
 
 import torch
 import torch.distributed as dist
 import torch.nn.functional as F
 import torch.utils.checkpoint
 import transformers
-from modelscope import (AutoConfig, AutoModelForCausalLM, AutoTokenizer,
-                        BitsAndBytesConfig, GenerationConfig, GPTQConfig,
-                        snapshot_download)
-from modelscope.hub.utils.utils import get_cache_dir
 from packaging import version
 from torch import Tensor
 from torch import dtype as Dtype
 from transformers import (PretrainedConfig, PreTrainedModel,
                           PreTrainedTokenizerBase)
-from transformers.dynamic_module_utils import get_class_from_dynamic_module
-from transformers.models.auto.tokenization_auto import get_tokenizer_config
-from transformers.utils import strtobool
+from transformers.integrations import is_deepspeed_zero3_enabled
+from transformers.utils import is_torch_bf16_gpu_available, strtobool
 from transformers.utils.versions import require_version
 
 from swift import get_logger
@@ -34,8 +33,68 @@ from .utils import get_max_model_len
 
 logger = get_logger()
 
+_TRANSFORMERS_VERSION = version.parse(transformers.__version__)
+_TORCH_VERSION = version.parse(torch.__version__)
+
+
+@lru_cache()
+def _transformers_version_ge(min_version: str) -> bool:
+    return _TRANSFORMERS_VERSION >= version.parse(min_version)
+
+
+@lru_cache()
+def _torch_version_ge(min_version: str) -> bool:
+    return _TORCH_VERSION >= version.parse(min_version)
+
+
+@lru_cache()
+def _require_version(requirement: str) -> None:
+    # only successful checks are cached, a failing one raises every time
+    require_version(requirement)
+
+
+_LAZY_MODELSCOPE_ATTRS = ('AutoConfig', 'AutoModelForCausalLM',
+                          'AutoTokenizer', 'BitsAndBytesConfig',
+                          'GenerationConfig', 'GPTQConfig',
+                          'snapshot_download')
+
+
+def __getattr__(name: str) -> Any:
+    # compat: these names used to be imported at module level.
+    if name in _LAZY_MODELSCOPE_ATTRS:
+        import modelscope
+        return getattr(modelscope, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+# str -> torch.dtype, used to normalize `torch_dtype` given as a string
+_DTYPE_MAP: Dict[str, Dtype] = {
+    'float16': torch.float16,
+    'fp16': torch.float16,
+    'half': torch.float16,
+    'bfloat16': torch.bfloat16,
+    'bf16': torch.bfloat16,
+    'float32': torch.float32,
+    'fp32': torch.float32,
+    'float': torch.float32,
+}
+if hasattr(torch, 'float8_e4m3fn'):  # torch>=2.1
+    _DTYPE_MAP['float8_e4m3fn'] = torch.float8_e4m3fn
+    _DTYPE_MAP['fp8'] = torch.float8_e4m3fn
+
+
+def _to_torch_dtype(dtype: Any) -> Any:
+    if isinstance(dtype, str):
+        if dtype in _DTYPE_MAP:
+            return _DTYPE_MAP[dtype]
+        return getattr(torch, dtype)
+    return dtype
+
+
 # Model Home: 'https://modelscope.cn/models/{model_id_or_path}/summary'
 MODEL_MAPPING: Dict[str, Dict[str, Any]] = {}
+# model_id_or_path.lower() -> model_type, maintained by register_model
+_MODEL_ID_MAPPING: Dict[str, str] = {}
 
 
 class ModelType:
@@ -341,62 +400,106 @@ class ModelType:
     c4ai_command_r_v01 = 'c4ai-command-r-v01'
     c4ai_command_r_plus = 'c4ai-command-r-plus'
 
+    _MODEL_NAME_LIST: Tuple[str, ...] = ()
+    _MODEL_NAME_SET: FrozenSet[str] = frozenset()
+
     @classmethod
-    def get_model_name_list(cls) -> List[str]:
-        res = []
-        for k in cls.__dict__.keys():
-            if k.startswith('__') or k == 'get_model_name_list':
-                continue
-            res.append(cls.__dict__[k])
-        return res
+    def get_model_name_list(cls) -> Tuple[str, ...]:
+        return cls._MODEL_NAME_LIST
+
+    @classmethod
+    def contains(cls, model_type: str) -> bool:
+        return model_type in cls._MODEL_NAME_SET
+
+
+# computed once at import, the model types are constants.
+ModelType._MODEL_NAME_LIST = tuple(
+    v for k, v in vars(ModelType).items()
+    if not k.startswith('_') and isinstance(v, str))
+ModelType._MODEL_NAME_SET = frozenset(ModelType._MODEL_NAME_LIST)
 
 
 class LoRATM(NamedTuple):
     # default lora target modules. qkv
-    baichuan = ['W_pack']
-    chatglm = ['query_key_value']
-    llama2 = ['q_proj', 'k_proj', 'v_proj']
-    qwen = ['c_attn']
+    baichuan = ('W_pack', )
+    chatglm = ('query_key_value', )
+    llama2 = ('q_proj', 'k_proj', 'v_proj')
+    qwen = ('c_attn', )
     qwen1half = llama2
-    polylm = ['c_attn']
-    bloom = ['query_key_value']
-    cogagent = [
-        'vision_expert_query_key_value', 'vision_expert_dense',
-        'language_expert_query_key_value', 'language_expert_dense', 'query',
-        'key_value', 'dense'
-    ]
-    cogvlm = [
-        'vision_expert_query_key_value', 'vision_expert_dense',
-        'language_expert_query_key_value', 'language_expert_dense'
-    ]
-    phi = ['Wqkv']
-    phi3 = ['qkv_proj']
-    internlm2 = ['wqkv']
-    mamba = ['in_proj', 'x_proj', 'embeddings', 'out_proj']
-    telechat = ['key_value', 'query']
-    grok_1 = ['q_proj', 'k_proj', 'v_proj']
-    dbrx = ['attn.Wqkv']
-    mplug_owl2 = [
+    polylm = ('c_attn', )
+    bloom = ('query_key_value', )
+    cogagent = ('vision_expert_query_key_value', 'vision_expert_dense',
+                'language_expert_query_key_value', 'language_expert_dense',
+                'query', 'key_value', 'dense')
+    cogvlm = ('vision_expert_query_key_value', 'vision_expert_dense',
+              'language_expert_query_key_value', 'language_expert_dense')
+    phi = ('Wqkv', )
+    phi3 = ('qkv_proj', )
+    internlm2 = ('wqkv', )
+    mamba = ('in_proj', 'x_proj', 'embeddings', 'out_proj')
+    telechat = ('key_value', 'query')
+    grok_1 = ('q_proj', 'k_proj', 'v_proj')
+    dbrx = ('attn.Wqkv', )
+    mplug_owl2 = (
         'q_proj',
         'k_proj.multiway.0',
         'k_proj.multiway.1',
         'v_proj.multiway.0',
         'v_proj.multiway.1',
-    ]
-    mplug_owl2d1 = [
+    )
+    mplug_owl2d1 = (
         'c_attn.multiway.0',
         'c_attn.multiway.1',
-    ]
+    )
 
 
 GetModelTokenizerFunction = Callable[..., Tuple[Optional[PreTrainedModel],
                                                 PreTrainedTokenizerBase]]
 
 
+def _get_quant_info(
+        model_type: str,
+        function_kwargs: Dict[str,
+                              Any]) -> Tuple[Optional[str], Optional[int]]:
+    """return (quant_method, quant_bits) of a pre-quantized model"""
+    if function_kwargs.get('is_awq', False):
+        return 'awq', 4
+    if function_kwargs.get('is_aqlm', False):
+        return 'aqlm', None
+    gptq_bits = function_kwargs.get('gptq_bits', 0)
+    if gptq_bits > 0:
+        return 'gptq', gptq_bits
+    for quant_bits in [4, 8]:
+        if f'int{quant_bits}' in model_type:  # e.g. baichuan2-7b-chat-int4
+            return 'bnb', quant_bits
+    if 'awq' in model_type:
+        return 'awq', 4
+    if 'aqlm' in model_type:
+        return 'aqlm', None
+    return None, None
+
+
+def _add_model_info(model_type: str, model_info: Dict[str, Any]) -> None:
+    old_model_info = MODEL_MAPPING.get(model_type)
+    if old_model_info is not None and old_model_info[
+            'model_id_or_path'] is not None:
+        old_model_id = old_model_info['model_id_or_path'].lower()
+        if _MODEL_ID_MAPPING.get(old_model_id) == model_type:
+            _MODEL_ID_MAPPING.pop(old_model_id)
+    MODEL_MAPPING[model_type] = model_info
+    if model_info['model_id_or_path'] is not None:
+        _MODEL_ID_MAPPING[model_info['model_id_or_path'].lower()] = model_type
+
+
+def get_model_type_by_id(model_id_or_path: str) -> Optional[str]:
+    """Return the registered model_type of a model_id_or_path (case insensitive)"""
+    return _MODEL_ID_MAPPING.get(model_id_or_path.lower())
+
+
 def register_model(
     model_type: str,
     model_id_or_path: Optional[str],
-    lora_target_modules: Optional[List[str]] = None,
+    lora_target_modules: Optional[Sequence[str]] = None,
     template: str = TemplateType.default,
     get_function: Optional[GetModelTokenizerFunction] = None,
     *,
@@ -415,12 +518,21 @@ def register_model(
         raise ValueError(
             f'The `{model_type}` has already been registered in the MODEL_MAPPING.'
         )
+    # model_type and template strings are shared across many entries and lookups
+    model_type = sys.intern(model_type)
+    if lora_target_modules is not None:
+        # shared across registrations, keep it immutable
+        lora_target_modules = tuple(lora_target_modules)
+    if template is not None:
+        template = sys.intern(template)
+    torch_dtype = _to_torch_dtype(torch_dtype)
     if requires is None:
         requires = []
     if function_kwargs is None:
         function_kwargs = {}
     if revision is None:
         revision = 'master'
+    quant_method, quant_bits = _get_quant_info(model_type, function_kwargs)
     model_info = {
         'model_id_or_path': model_id_or_path,
         'lora_target_modules': lora_target_modules,
@@ -431,29 +543,53 @@ def register_model(
         'hf_model_id': hf_model_id,
         'revision': revision,
         'eos_token': eos_token,
+        'function_kwargs': function_kwargs,
+        'quant_method': quant_method,
+        'quant_bits': quant_bits,
         **kwargs
     }
 
     if get_function is not None:
-        if len(function_kwargs) > 0:
-            get_function = partial(get_function, **function_kwargs)
         model_info['get_function'] = get_function
-        MODEL_MAPPING[model_type] = model_info
+        _add_model_info(model_type, model_info)
         return
 
     def _register_model(
             get_function: GetModelTokenizerFunction
     ) -> GetModelTokenizerFunction:
-        _old_get_function = get_function
-        if len(function_kwargs) > 0:
-            get_function = partial(get_function, **function_kwargs)
         model_info['get_function'] = get_function
-        MODEL_MAPPING[model_type] = model_info
-        return _old_get_function
+        _add_model_info(model_type, model_info)
+        return get_function
 
     return _register_model
 
 
+class ModelEntry(NamedTuple):
+    model_type: str
+    model_id_or_path: Optional[str]
+    lora_target_modules: Optional[Sequence[str]]
+    template: str
+    kwargs: Dict[str, Any]
+
+
+class ModelFamily:
+    """Subclasses register their `entries` into MODEL_MAPPING with `get_function`
+    when the class is created."""
+    get_function: ClassVar[Optional[GetModelTokenizerFunction]] = None
+    entries: ClassVar[Tuple[ModelEntry, ...]] = ()
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        for entry in cls.entries:
+            register_model(
+                entry.model_type,
+                entry.model_id_or_path,
+                entry.lora_target_modules,
+                entry.template,
+                get_function=cls.get_function,
+                **entry.kwargs)
+
+
 def _check_awq_ext() -> None:
     try:
         from awq.utils.packing_utils import dequantize_gemm
@@ -466,8 +602,9 @@ def _check_awq_ext() -> None:
 
 
 def _check_gptq_model(bits: int, model_kwargs: Dict[str, Any]) -> None:
+    from modelscope import GPTQConfig
     assert model_kwargs.get('quantization_config') is None
-    if version.parse(transformers.__version__) >= version.parse('4.35'):
+    if _transformers_version_ge('4.35'):
         model_kwargs['quantization_config'] = GPTQConfig(
             bits=bits, use_exllama=False)
     else:
@@ -476,328 +613,294 @@ def _check_gptq_model(bits: int, model_kwargs: Dict[str, Any]) -> None:
 
     # fix quantlinear bug
     from auto_gptq.nn_modules.qlinear.qlinear_cuda_old import QuantLinear
-    __old_forward = QuantLinear.forward
+    if getattr(QuantLinear, '_swift_patched', False):  # avoid double patching
+        return
 
-    def _new_forward(self, x):
-        if not self.training or not self.autogptq_cuda_available:
-            return self.__old_forward(x)
-        # fix sft no grad
-        self.autogptq_cuda_available = False
-        res = self.__old_forward(x)
-        self.autogptq_cuda_available = True
-        return res
+    def _new_train(self, mode: bool = True):
+        # fix sft no grad: the cuda kernel is only used outside training.
+        # Switched at train()/eval() time instead of on every forward.
+        if '_autogptq_cuda_available' not in self.__dict__:
+            self._autogptq_cuda_available = self.autogptq_cuda_available
+        self.autogptq_cuda_available = (
+            self._autogptq_cuda_available and not mode)
+        return self._orig_train(mode)
 
-    if not hasattr(QuantLinear, '__old_forward'):  # avoid double patching
-        QuantLinear.__old_forward = __old_forward
-        QuantLinear.forward = _new_forward
+    QuantLinear._orig_train = QuantLinear.train
+    QuantLinear.train = _new_train
+    QuantLinear._swift_patched = True
+
+
+def _is_local_model_dir(model_dir: str) -> bool:
+    # An already-downloaded model: no hub probe is needed to load it.
+    return os.path.isabs(model_dir) and os.path.isfile(
+        os.path.join(model_dir, 'config.json'))
+
+
+def _get_mtime(model_dir: str, fname: str) -> Optional[int]:
+    # part of the cache keys below, so that editing the file invalidates them.
+    try:
+        return os.stat(os.path.join(model_dir, fname)).st_mtime_ns
+    except OSError:
+        return None
+
+
+@lru_cache(maxsize=32)
+def _load_config(model_dir: str, trust_remote_code: bool,
+                 mtime: Optional[int]) -> PretrainedConfig:
+    from modelscope import AutoConfig
+    return AutoConfig.from_pretrained(
+        model_dir,
+        trust_remote_code=trust_remote_code,
+        local_files_only=_is_local_model_dir(model_dir))
+
+
+def _load_tokenizer(model_dir: str,
+                    trust_remote_code: bool) -> PreTrainedTokenizerBase:
+    from modelscope import AutoTokenizer
+    return AutoTokenizer.from_pretrained(
+        model_dir,
+        trust_remote_code=trust_remote_code,
+        local_files_only=_is_local_model_dir(model_dir))
+
+
+@lru_cache(maxsize=32)
+def _load_tokenizer_config(model_dir: str,
+                           mtime: Optional[int]) -> Dict[str, Any]:
+    from transformers.models.auto.tokenization_auto import get_tokenizer_config
+    return get_tokenizer_config(model_dir)
+
+
+@lru_cache(maxsize=16)
+def _load_dynamic_class(class_ref: str, model_dir: str,
+                        mtime: Optional[int]) -> Type:
+    # exec of the remote code is slow, and each call creates a new class.
+    from transformers.dynamic_module_utils import get_class_from_dynamic_module
+    return get_class_from_dynamic_module(class_ref, model_dir)
+
+
+def _get_cached_config(model_dir: str,
+                       trust_remote_code: bool = True) -> PretrainedConfig:
+    # The callers mutate the config (torch_dtype, ...), so hand out a copy.
+    mtime = _get_mtime(model_dir, 'config.json')
+    return deepcopy(_load_config(model_dir, trust_remote_code, mtime))
+
+
+# The containers updated in place by `tokenizer.eos_token = ...` and friends.
+_MUTABLE_TOKENIZER_ATTRS = ('init_kwargs', '_special_tokens_map',
+                            '_additional_special_tokens')
+
+
+def _copy_tokenizer(
+        tokenizer: PreTrainedTokenizerBase) -> PreTrainedTokenizerBase:
+    # The vocab and the (rust/tiktoken/sentencepiece) backend are shared, the callers only read them.
+    # `copy.copy` is not used: it goes through `__getstate__`/`__setstate__`,
+    # which rebuild the backend for some tokenizers (qwen, llama).
+    tokenizer_cls = tokenizer.__class__
+    new_tokenizer = tokenizer_cls.__new__(tokenizer_cls)
+    new_tokenizer.__dict__.update(tokenizer.__dict__)
+    for key in _MUTABLE_TOKENIZER_ATTRS:
+        value = tokenizer.__dict__.get(key)
+        if value is not None:
+            new_tokenizer.__dict__[key] = copy(value)
+    return new_tokenizer
+
+
+# (model_dir, trust_remote_code, mtime) -> the tokenizer as loaded, never handed out.
+_CACHED_TOKENIZERS: Dict[Tuple[str, bool, Optional[int]],
+                         PreTrainedTokenizerBase] = {}
+
+
+def _get_cached_tokenizer(
+        model_dir: str,
+        trust_remote_code: bool = True) -> PreTrainedTokenizerBase:
+    # The callers set attributes of the tokenizer (eos_token, model_type, ...), so each
+    # gets its own copy. The loaders that call `add_tokens` need to deepcopy it themselves.
+    key = (model_dir, trust_remote_code,
+           _get_mtime(model_dir, 'tokenizer_config.json'))
+    tokenizer = _CACHED_TOKENIZERS.get(key)
+    if tokenizer is not None:
+        return _copy_tokenizer(tokenizer)
+    tokenizer = _load_tokenizer(model_dir, trust_remote_code)
+    _CACHED_TOKENIZERS[key] = _copy_tokenizer(tokenizer)
+    return tokenizer
+
+
+def _get_cached_tokenizer_config(model_dir: str) -> Dict[str, Any]:
+    mtime = _get_mtime(model_dir, 'tokenizer_config.json')
+    return deepcopy(_load_tokenizer_config(model_dir, mtime))
+
+
+def _get_cached_dynamic_class(class_ref: str, model_dir: str) -> Type:
+    # 'tokenization_qwen.QWenTokenizer' is defined in 'tokenization_qwen.py'
+    module_name = class_ref.split('--')[-1].rsplit('.', 1)[0]
+    mtime = _get_mtime(model_dir, f'{module_name}.py')
+    return _load_dynamic_class(class_ref, model_dir, mtime)
+
+
+_WEIGHT_SUFFIXES = ('.safetensors', '.bin', '.pt', '.pth')
+
+
+def _get_fast_load_device(device_map: Any) -> Optional[str]:
+    # The fast path materializes the whole model on one device.
+    if isinstance(device_map, dict):
+        if set(device_map.keys()) != {''}:
+            return None
+        device_map = device_map['']
+    if device_map is None:
+        return 'cpu'
+    if isinstance(device_map, int):
+        return f'cuda:{device_map}'
+    device_map = str(device_map)
+    if device_map == 'auto':
+        if torch.cuda.device_count() > 1:
+            return None
+        return 'cuda:0' if torch.cuda.is_available() else 'cpu'
+    if device_map in {'balanced', 'balanced_low_0', 'sequential'}:
+        return None
+    return device_map
+
+
+def _get_fast_load_path(model_dir: str, torch_dtype: Optional[Dtype]) -> str:
+    import hashlib
+    # any change to the weight files produces a new cache file.
+    weights_mtime = 0
+    for fname in os.listdir(model_dir):
+        if fname.endswith(_WEIGHT_SUFFIXES):
+            mtime = os.stat(os.path.join(model_dir, fname)).st_mtime_ns
+            weights_mtime = max(weights_mtime, mtime)
+    key = f'{model_dir}|{torch_dtype}|{weights_mtime}'
+    cache_dir = os.path.expanduser(
+        os.environ.get('SWIFT_FAST_LOAD_CACHE', '~/.cache/swift/fast_load'))
+    fname = f'{hashlib.sha256(key.encode()).hexdigest()}.pt'
+    return os.path.join(cache_dir, fname)
+
+
+def _fast_load_model(automodel_class: Type, model_config: PretrainedConfig,
+                     torch_dtype: Optional[Dtype], cache_path: str,
+                     device: str, model_dir: str) -> PreTrainedModel:
+    from modelscope import GenerationConfig
+    state = torch.load(cache_path, map_location='cpu', mmap=True)
+    config_kwargs = {'trust_remote_code': True}
+    if torch_dtype is not None:
+        config_kwargs['torch_dtype'] = torch_dtype
+    with torch.device('meta'):
+        model = automodel_class.from_config(model_config, **config_kwargs)
+    model.load_state_dict(state['state_dict'], assign=True)
+    # non-persistent buffers (e.g. rotary inv_freq) are not in the state_dict
+    for name, buffer in state['buffers'].items():
+        module_name, _, buffer_name = name.rpartition('.')
+        model.get_submodule(module_name)._buffers[buffer_name] = buffer
+    model.tie_weights()
+    # from_config only derives the generation_config from config.json
+    if os.path.isfile(os.path.join(model_dir, 'generation_config.json')):
+        model.generation_config = GenerationConfig.from_pretrained(model_dir)
+    return model.to(device).eval()
+
+
+def _save_fast_load_cache(model: PreTrainedModel, cache_path: str) -> None:
+    state_dict = model.state_dict()
+    buffers = {
+        name: buffer
+        for name, buffer in model.named_buffers() if name not in state_dict
+    }
+    state = {'state_dict': state_dict, 'buffers': buffers}
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    torch.save(state, tmp_path, _use_new_zipfile_serialization=True)
+    os.replace(tmp_path, cache_path)
+    logger.info(f'Saving the fast_load cache: {cache_path}')
+
+
+# Tokenizer classes whose read-only `eos_token_id` has already been removed.
+_EOS_PATCHED_TOKENIZER_CLASSES: 'WeakSet[Type]' = WeakSet()
+
+
+def _set_eos_token(tokenizer: PreTrainedTokenizerBase, eos_token: str) -> None:
+    # Some remote tokenizers (internlm) define `eos_token_id` as a property
+    # without a setter, which shadows `eos_token`. Drop it once per class.
+    tokenizer_cls = tokenizer.__class__
+    if tokenizer_cls not in _EOS_PATCHED_TOKENIZER_CLASSES:
+        if getattr(tokenizer_cls.eos_token_id, 'fset', None) is None:
+            del tokenizer_cls.eos_token_id
+        _EOS_PATCHED_TOKENIZER_CLASSES.add(tokenizer_cls)
+    tokenizer.eos_token = eos_token
 
 
-@register_model(
-    ModelType.atom_7b,
-    'FlagAlpha/Atom-7B',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='FlagAlpha/Atom-7B')
-@register_model(
-    ModelType.atom_7b_chat,
-    'FlagAlpha/Atom-7B-Chat',
-    LoRATM.llama2,
-    TemplateType.atom,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='FlagAlpha/Atom-7B-Chat')
-@register_model(
-    ModelType.internlm_20b,
-    'Shanghai_AI_Laboratory/internlm-20b',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    support_vllm=True,
-    hf_model_id='internlm/internlm2-20b')
-@register_model(
-    ModelType.internlm_7b,
-    'Shanghai_AI_Laboratory/internlm-7b',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    support_vllm=True,
-    hf_model_id='internlm/internlm-7b')
-@register_model(
-    ModelType.bluelm_7b_chat_32k,
-    'vivo-ai/BlueLM-7B-Chat-32K',
-    LoRATM.llama2,
-    TemplateType.bluelm,
-    hf_model_id='vivo-ai/BlueLM-7B-Chat-32K')
-@register_model(
-    ModelType.bluelm_7b_chat,
-    'vivo-ai/BlueLM-7B-Chat',
-    LoRATM.llama2,
-    TemplateType.bluelm,
-    hf_model_id='vivo-ai/BlueLM-7B-Chat')
-@register_model(
-    ModelType.bluelm_7b_32k,
-    'vivo-ai/BlueLM-7B-Base-32K',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    hf_model_id='vivo-ai/BlueLM-7B-Base-32K')
-@register_model(
-    ModelType.bluelm_7b,
-    'vivo-ai/BlueLM-7B-Base',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    hf_model_id='vivo-ai/BlueLM-7B-Base')
-@register_model(
-    ModelType.seqgpt_560m,
-    'damo/nlp_seqgpt-560m',
-    LoRATM.bloom,
-    TemplateType.default_generation,
-    support_vllm=True,
-    hf_model_id='DAMO-NLP/SeqGPT-560M')
-@register_model(
-    ModelType.xverse_13b_chat,
-    'xverse/XVERSE-13B-Chat',
-    LoRATM.llama2,
-    TemplateType.xverse,
-    support_vllm=True,
-    hf_model_id='xverse/XVERSE-13B-Chat')
-@register_model(
-    ModelType.xverse_13b,
-    'xverse/XVERSE-13B',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_vllm=True,
-    hf_model_id='xverse/XVERSE-13B')
-@register_model(
-    ModelType.xverse_65b,
-    'xverse/XVERSE-65B',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_vllm=True,
-    hf_model_id='xverse/XVERSE-65B')
-@register_model(
-    ModelType.xverse_65b_v2,
-    'xverse/XVERSE-65B-2',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_vllm=True,
-    hf_model_id='xverse/XVERSE-65B-2')
-@register_model(
-    ModelType.xverse_65b_chat,
-    'xverse/XVERSE-65B-Chat',
-    LoRATM.llama2,
-    TemplateType.xverse,
-    support_vllm=True,
-    hf_model_id='xverse/XVERSE-65B-Chat')
-@register_model(
-    ModelType.xverse_13b_256k,
-    'xverse/XVERSE-13B-256K',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    revision='v1.0.0',
-    support_vllm=True,
-    hf_model_id='xverse/XVERSE-13B-256K')
-@register_model(
-    ModelType.xverse_7b_chat,
-    'xverse/XVERSE-7B-Chat',
-    LoRATM.llama2,
-    TemplateType.xverse,
-    support_vllm=True,
-    hf_model_id='xverse/XVERSE-7B-Chat')
-@register_model(
-    ModelType.xverse_7b,
-    'xverse/XVERSE-7B',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_vllm=True,
-    hf_model_id='xverse/XVERSE-7B')
-@register_model(
-    ModelType.xverse_moe_a4_2b,
-    'xverse/XVERSE-MoE-A4.2B',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    hf_model_id='xverse/XVERSE-MoE-A4.2B')
-@register_model(
-    ModelType.baichuan_13b_chat,
-    'baichuan-inc/Baichuan-13B-Chat',
-    LoRATM.baichuan,
-    TemplateType.baichuan,
-    requires=['transformers<4.34'],
-    support_vllm=True,
-    hf_model_id='baichuan-inc/Baichuan-13B-Chat')
-@register_model(
-    ModelType.baichuan_7b,
-    'baichuan-inc/baichuan-7B',
-    LoRATM.baichuan,
-    TemplateType.default_generation,
-    requires=['transformers<4.34'],
-    support_vllm=True,
-    hf_model_id='baichuan-inc/Baichuan-7B')
-@register_model(
-    ModelType.mengzi3_13b_base,
-    'langboat/Mengzi3-13B-Base',
-    LoRATM.llama2,
-    TemplateType.mengzi,
-    support_vllm=True,
-    support_flash_attn=True,
-    hf_model_id='Langboat/Mengzi3-13B-Base')
-@register_model(
-    ModelType.c4ai_command_r_v01,
-    'AI-ModelScope/c4ai-command-r-v01',
-    LoRATM.llama2,
-    TemplateType.c4ai,
-    requires=['transformers>=4.39.1'],
-    support_vllm=False,
-    support_flash_attn=True,
-    hf_model_id='CohereForAI/c4ai-command-r-v01')
-@register_model(
-    ModelType.c4ai_command_r_plus,
-    'AI-ModelScope/c4ai-command-r-plus',
-    LoRATM.llama2,
-    TemplateType.c4ai,
-    requires=['transformers>4.39'],
-    support_vllm=False,
-    support_flash_attn=True,
-    hf_model_id='CohereForAI/c4ai-command-r-plus')
-@register_model(
-    ModelType.chinese_llama_2_1_3b,
-    'AI-ModelScope/chinese-llama-2-1.3b',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_vllm=True,
-    support_flash_attn=True,
-    hf_model_id='hfl/chinese-llama-2-1.3b')
-@register_model(
-    ModelType.chinese_llama_2_7b,
-    'AI-ModelScope/chinese-llama-2-7b',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_vllm=True,
-    support_flash_attn=True,
-    hf_model_id='hfl/chinese-llama-2-7b')
-@register_model(
-    ModelType.chinese_llama_2_7b_16k,
-    'AI-ModelScope/chinese-llama-2-7b-16k',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_vllm=True,
-    support_flash_attn=True,
-    hf_model_id='hfl/chinese-llama-2-7b-16k')
-@register_model(
-    ModelType.chinese_llama_2_7b_64k,
-    'AI-ModelScope/chinese-llama-2-7b-64k',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_vllm=True,
-    support_flash_attn=True,
-    hf_model_id='hfl/chinese-llama-2-7b-64k')
-@register_model(
-    ModelType.chinese_llama_2_13b,
-    'AI-ModelScope/chinese-llama-2-13b',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_vllm=True,
-    support_flash_attn=True,
-    hf_model_id='hfl/chinese-llama-2-13b')
-@register_model(
-    ModelType.chinese_llama_2_13b_16k,
-    'AI-ModelScope/chinese-llama-2-13b-16k',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_vllm=True,
-    support_flash_attn=True,
-    hf_model_id='hfl/chinese-llama-2-13b-16k')
-@register_model(
-    ModelType.chinese_alpaca_2_1_3b,
-    'AI-ModelScope/chinese-alpaca-2-1.3b',
-    LoRATM.llama2,
-    TemplateType.llama,
-    support_vllm=True,
-    support_flash_attn=True,
-    hf_model_id='hfl/chinese-alpaca-2-1.3b')
-@register_model(
-    ModelType.chinese_alpaca_2_7b,
-    'AI-ModelScope/chinese-alpaca-2-7b',
-    LoRATM.llama2,
-    TemplateType.llama,
-    support_vllm=True,
-    support_flash_attn=True,
-    hf_model_id='hfl/chinese-alpaca-2-7b')
-@register_model(
-    ModelType.chinese_alpaca_2_7b_16k,
-    'AI-ModelScope/chinese-alpaca-2-7b-16k',
-    LoRATM.llama2,
-    TemplateType.llama,
-    support_vllm=True,
-    support_flash_attn=True,
-    hf_model_id='hfl/chinese-alpaca-2-7b-16k')
-@register_model(
-    ModelType.chinese_alpaca_2_7b_64k,
-    'AI-ModelScope/chinese-alpaca-2-7b-64k',
-    LoRATM.llama2,
-    TemplateType.llama,
-    support_vllm=True,
-    support_flash_attn=True,
-    hf_model_id='hfl/chinese-alpaca-2-7b-64k')
-@register_model(
-    ModelType.chinese_alpaca_2_13b,
-    'AI-ModelScope/chinese-alpaca-2-13b',
-    LoRATM.llama2,
-    TemplateType.llama,
-    support_vllm=True,
-    support_flash_attn=True,
-    hf_model_id='hfl/chinese-alpaca-2-13b')
-@register_model(
-    ModelType.chinese_alpaca_2_13b_16k,
-    'AI-ModelScope/chinese-alpaca-2-13b-16k',
-    LoRATM.llama2,
-    TemplateType.llama,
-    support_vllm=True,
-    support_flash_attn=True,
-    hf_model_id='hfl/chinese-alpaca-2-13b-16k')
 def get_model_tokenizer_from_repo(model_dir: str,
                                   torch_dtype: Optional[Dtype],
                                   model_kwargs: Dict[str, Any],
                                   load_model: bool = True,
                                   model_config=None,
                                   tokenizer=None,
-                                  automodel_class=AutoModelForCausalLM,
+                                  automodel_class=None,
                                   **kwargs):
     """load from an independent repository"""
+    from modelscope import AutoModelForCausalLM
+    if automodel_class is None:
+        automodel_class = AutoModelForCausalLM
     is_awq = kwargs.pop('is_awq', False)
     is_aqlm = kwargs.pop('is_aqlm', False)
     gptq_bits = kwargs.pop('gptq_bits', 0)
     is_training = kwargs.pop('is_training', False)
+    fast_load = kwargs.pop('fast_load', False)
     if is_awq and is_training:
         _check_awq_ext()
     if gptq_bits > 0 and is_training:
         _check_gptq_model(gptq_bits, model_kwargs)
     context = kwargs.get('context', None)
     if is_aqlm and is_training:
-        require_version('transformers>=4.39')
+        _require_version('transformers>=4.39')
         import aqlm
         context = aqlm.optimize_for_training()
     if context is None:
         context = nullcontext()
     if model_config is None:
-        model_config = AutoConfig.from_pretrained(
-            model_dir, trust_remote_code=True)
+        model_config = _get_cached_config(model_dir)
     if torch_dtype is not None:
         model_config.torch_dtype = torch_dtype
     if tokenizer is None:
-        tokenizer = AutoTokenizer.from_pretrained(
-            model_dir, trust_remote_code=True)
+        tokenizer = _get_cached_tokenizer(model_dir)
     eos_token = kwargs.get('eos_token')
     if eos_token is not None:
         tokenizer.eos_token = eos_token
     model = None
     if load_model:
-        with context:
-            model = automodel_class.from_pretrained(
-                model_dir,
-                config=model_config,
-                torch_dtype=torch_dtype,
-                trust_remote_code=True,
-                **model_kwargs)
+        if not is_deepspeed_zero3_enabled():
+            # skip the random init of the weights that are overwritten anyway
+            model_kwargs.setdefault('low_cpu_mem_usage', True)
+        if _is_local_model_dir(model_dir):
+            model_kwargs.setdefault('local_files_only', True)
+        fast_load_path = None
+        if fast_load:
+            # opt-in: after the first load, the model is restored from a
+            # memory-mapped state_dict instead of re-parsing the shards.
+            fast_load_device = None
+            if (_is_local_model_dir(model_dir) and _torch_version_ge('2.1')
+                    and not is_deepspeed_zero3_enabled() and not is_awq
+                    and not is_aqlm and gptq_bits == 0
+                    and 'quantization_config' not in model_kwargs):
+                fast_load_device = _get_fast_load_device(
+                    model_kwargs.get('device_map'))
+            if fast_load_device is None:
+                logger.warning('fast_load is not supported for this model '
+                               'setting, using from_pretrained.')
+            else:
+                fast_load_path = _get_fast_load_path(model_dir, torch_dtype)
+        if fast_load_path is not None and os.path.isfile(fast_load_path):
+            with context:
+                model = _fast_load_model(automodel_class, model_config,
+                                         torch_dtype, fast_load_path,
+                                         fast_load_device, model_dir)
+        else:
+            with context:
+                model = automodel_class.from_pretrained(
+                    model_dir,
+                    config=model_config,
+                    torch_dtype=torch_dtype,
+                    trust_remote_code=True,
+                    **model_kwargs)
+            if fast_load_path is not None and is_local_master():
+                _save_fast_load_cache(model, fast_load_path)
     if load_model and is_awq:
         model.is_awq = is_awq
     if load_model and gptq_bits > 0:
@@ -805,35 +908,30 @@ def get_model_tokenizer_from_repo(model_dir: str,
     return model, tokenizer
 
 
-@register_model(
-    ModelType.grok_1,
-    'colossalai/grok-1-pytorch',
-    LoRATM.grok_1,
-    TemplateType.default_generation,
-    support_vllm=False,
-    support_flash_attn=False,
-    hf_model_id='hpcai-tech/grok-1')
 def get_model_tokenizer_grok(model_dir: str,
                              torch_dtype: Optional[Dtype],
                              model_kwargs: Dict[str, Any],
                              load_model: bool = True,
                              model_config=None,
                              tokenizer=None,
-                             automodel_class=AutoModelForCausalLM,
+                             automodel_class=None,
                              **kwargs):
+    from modelscope import AutoModelForCausalLM
+    if automodel_class is None:
+        automodel_class = AutoModelForCausalLM
     if model_config is None:
-        model_config = AutoConfig.from_pretrained(
-            model_dir, trust_remote_code=True)
+        model_config = _get_cached_config(model_dir)
     if torch_dtype is not None:
         model_config.torch_dtype = torch_dtype
     if tokenizer is None:
-        tokenizer = AutoTokenizer.from_pretrained(
-            'AI-ModelScope/grok-1-tokenizer', trust_remote_code=True)
+        tokenizer = _get_cached_tokenizer('AI-ModelScope/grok-1-tokenizer')
     eos_token = kwargs.get('eos_token')
     if eos_token is not None:
         tokenizer.eos_token = eos_token
     model = None
     if load_model:
+        if not is_deepspeed_zero3_enabled():
+            model_kwargs.setdefault('low_cpu_mem_usage', True)
         model = automodel_class.from_pretrained(
             model_dir,
             config=model_config,
@@ -843,54 +941,6 @@ def get_model_tokenizer_grok(model_dir: str,
     return model, tokenizer
 
 
-@register_model(
-    ModelType.mamba_130m,
-    'AI-ModelScope/mamba-130m-hf',
-    LoRATM.mamba,
-    TemplateType.default_generation,
-    requires=['transformers>=4.39.0'],
-    support_vllm=False,
-    hf_model_id='state-spaces/mamba-130m-hf')
-@register_model(
-    ModelType.mamba_370m,
-    'AI-ModelScope/mamba-370m-hf',
-    LoRATM.mamba,
-    TemplateType.default_generation,
-    requires=['transformers>=4.39.0'],
-    support_vllm=False,
-    hf_model_id='state-spaces/mamba-370m-hf')
-@register_model(
-    ModelType.mamba_390m,
-    'AI-ModelScope/mamba-390m-hf',
-    LoRATM.mamba,
-    TemplateType.default_generation,
-    requires=['transformers>=4.39.0'],
-    support_vllm=False,
-    hf_model_id='state-spaces/mamba-390m-hf')
-@register_model(
-    ModelType.mamba_790m,
-    'AI-ModelScope/mamba-790m-hf',
-    LoRATM.mamba,
-    TemplateType.default_generation,
-    requires=['transformers>=4.39.0'],
-    support_vllm=False,
-    hf_model_id='state-spaces/mamba-790m-hf')
-@register_model(
-    ModelType.mamba_1_4b,
-    'AI-ModelScope/mamba-1.4b-hf',
-    LoRATM.mamba,
-    TemplateType.default_generation,
-    requires=['transformers>=4.39.0'],
-    support_vllm=False,
-    hf_model_id='state-spaces/mamba-1.4b-hf')
-@register_model(
-    ModelType.mamba_2_8b,
-    'AI-ModelScope/mamba-2.8b-hf',
-    LoRATM.mamba,
-    TemplateType.default_generation,
-    requires=['transformers>=4.39.0'],
-    support_vllm=False,
-    hf_model_id='state-spaces/mamba-2.8b-hf')
 def get_model_tokenizer_mamba(model_dir: str,
                               torch_dtype: Optional[Dtype],
                               model_kwargs: Dict[str, Any],
@@ -903,39 +953,279 @@ def get_model_tokenizer_mamba(model_dir: str,
                                          load_model, **kwargs)
 
 
-@register_model(
-    ModelType.cogvlm_17b_instruct,
-    'ZhipuAI/cogvlm-chat',
-    LoRATM.cogvlm,
-    TemplateType.cogvlm_instruct,
-    support_gradient_checkpointing=False,
-    tags=['multi-modal', 'vision'],
-    hf_model_id='THUDM/cogvlm-chat-hf')
-@register_model(
-    ModelType.cogagent_18b_chat,
-    'ZhipuAI/cogagent-chat',
-    LoRATM.cogagent,
-    TemplateType.cogagent_chat,
-    support_gradient_checkpointing=False,
-    tags=['multi-modal', 'vision'],
-    hf_model_id='THUDM/cogagent-chat-hf')
-@register_model(
-    ModelType.cogagent_18b_instruct,
-    'ZhipuAI/cogagent-vqa',
-    LoRATM.cogagent,
-    TemplateType.cogagent_instruct,
-    support_gradient_checkpointing=False,
-    tags=['multi-modal', 'vision'],
-    hf_model_id='THUDM/cogagent-vqa-hf')
+class _RepoModels(ModelFamily):
+    get_function = get_model_tokenizer_from_repo
+    entries = (
+        ModelEntry(
+            ModelType.atom_7b, 'FlagAlpha/Atom-7B', LoRATM.llama2,
+            TemplateType.default_generation_bos,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='FlagAlpha/Atom-7B')),
+        ModelEntry(
+            ModelType.atom_7b_chat, 'FlagAlpha/Atom-7B-Chat', LoRATM.llama2,
+            TemplateType.atom,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='FlagAlpha/Atom-7B-Chat')),
+        ModelEntry(
+            ModelType.internlm_20b, 'Shanghai_AI_Laboratory/internlm-20b',
+            LoRATM.llama2, TemplateType.default_generation_bos,
+            dict(support_vllm=True, hf_model_id='internlm/internlm2-20b')),
+        ModelEntry(ModelType.internlm_7b, 'Shanghai_AI_Laboratory/internlm-7b',
+                   LoRATM.llama2, TemplateType.default_generation_bos,
+                   dict(support_vllm=True,
+                        hf_model_id='internlm/internlm-7b')),
+        ModelEntry(ModelType.bluelm_7b_chat_32k, 'vivo-ai/BlueLM-7B-Chat-32K',
+                   LoRATM.llama2, TemplateType.bluelm,
+                   dict(hf_model_id='vivo-ai/BlueLM-7B-Chat-32K')),
+        ModelEntry(ModelType.bluelm_7b_chat, 'vivo-ai/BlueLM-7B-Chat',
+                   LoRATM.llama2, TemplateType.bluelm,
+                   dict(hf_model_id='vivo-ai/BlueLM-7B-Chat')),
+        ModelEntry(ModelType.bluelm_7b_32k, 'vivo-ai/BlueLM-7B-Base-32K',
+                   LoRATM.llama2, TemplateType.default_generation_bos,
+                   dict(hf_model_id='vivo-ai/BlueLM-7B-Base-32K')),
+        ModelEntry(ModelType.bluelm_7b, 'vivo-ai/BlueLM-7B-Base',
+                   LoRATM.llama2, TemplateType.default_generation_bos,
+                   dict(hf_model_id='vivo-ai/BlueLM-7B-Base')),
+        ModelEntry(ModelType.seqgpt_560m, 'damo/nlp_seqgpt-560m', LoRATM.bloom,
+                   TemplateType.default_generation,
+                   dict(support_vllm=True,
+                        hf_model_id='DAMO-NLP/SeqGPT-560M')),
+        ModelEntry(
+            ModelType.xverse_13b_chat, 'xverse/XVERSE-13B-Chat', LoRATM.llama2,
+            TemplateType.xverse,
+            dict(support_vllm=True, hf_model_id='xverse/XVERSE-13B-Chat')),
+        ModelEntry(ModelType.xverse_13b, 'xverse/XVERSE-13B', LoRATM.llama2,
+                   TemplateType.default_generation,
+                   dict(support_vllm=True, hf_model_id='xverse/XVERSE-13B')),
+        ModelEntry(ModelType.xverse_65b, 'xverse/XVERSE-65B', LoRATM.llama2,
+                   TemplateType.default_generation,
+                   dict(support_vllm=True, hf_model_id='xverse/XVERSE-65B')),
+        ModelEntry(ModelType.xverse_65b_v2, 'xverse/XVERSE-65B-2',
+                   LoRATM.llama2, TemplateType.default_generation,
+                   dict(support_vllm=True, hf_model_id='xverse/XVERSE-65B-2')),
+        ModelEntry(
+            ModelType.xverse_65b_chat, 'xverse/XVERSE-65B-Chat', LoRATM.llama2,
+            TemplateType.xverse,
+            dict(support_vllm=True, hf_model_id='xverse/XVERSE-65B-Chat')),
+        ModelEntry(
+            ModelType.xverse_13b_256k, 'xverse/XVERSE-13B-256K', LoRATM.llama2,
+            TemplateType.default_generation,
+            dict(
+                revision='v1.0.0',
+                support_vllm=True,
+                hf_model_id='xverse/XVERSE-13B-256K')),
+        ModelEntry(
+            ModelType.xverse_7b_chat, 'xverse/XVERSE-7B-Chat', LoRATM.llama2,
+            TemplateType.xverse,
+            dict(support_vllm=True, hf_model_id='xverse/XVERSE-7B-Chat')),
+        ModelEntry(ModelType.xverse_7b, 'xverse/XVERSE-7B', LoRATM.llama2,
+                   TemplateType.default_generation,
+                   dict(support_vllm=True, hf_model_id='xverse/XVERSE-7B')),
+        ModelEntry(ModelType.xverse_moe_a4_2b, 'xverse/XVERSE-MoE-A4.2B',
+                   LoRATM.llama2, TemplateType.default_generation,
+                   dict(hf_model_id='xverse/XVERSE-MoE-A4.2B')),
+        ModelEntry(
+            ModelType.baichuan_13b_chat, 'baichuan-inc/Baichuan-13B-Chat',
+            LoRATM.baichuan, TemplateType.baichuan,
+            dict(
+                requires=['transformers<4.34'],
+                support_vllm=True,
+                hf_model_id='baichuan-inc/Baichuan-13B-Chat')),
+        ModelEntry(
+            ModelType.baichuan_7b, 'baichuan-inc/baichuan-7B', LoRATM.baichuan,
+            TemplateType.default_generation,
+            dict(
+                requires=['transformers<4.34'],
+                support_vllm=True,
+                hf_model_id='baichuan-inc/Baichuan-7B')),
+        ModelEntry(
+            ModelType.mengzi3_13b_base, 'langboat/Mengzi3-13B-Base',
+            LoRATM.llama2, TemplateType.mengzi,
+            dict(
+                support_vllm=True,
+                support_flash_attn=True,
+                hf_model_id='Langboat/Mengzi3-13B-Base')),
+        ModelEntry(
+            ModelType.c4ai_command_r_v01, 'AI-ModelScope/c4ai-command-r-v01',
+            LoRATM.llama2, TemplateType.c4ai,
+            dict(
+                requires=['transformers>=4.39.1'],
+                support_vllm=False,
+                support_flash_attn=True,
+                hf_model_id='CohereForAI/c4ai-command-r-v01')),
+        ModelEntry(
+            ModelType.c4ai_command_r_plus, 'AI-ModelScope/c4ai-command-r-plus',
+            LoRATM.llama2, TemplateType.c4ai,
+            dict(
+                requires=['transformers>4.39'],
+                support_vllm=False,
+                support_flash_attn=True,
+                hf_model_id='CohereForAI/c4ai-command-r-plus')),
+        ModelEntry(
+            ModelType.chinese_llama_2_1_3b,
+            'AI-ModelScope/chinese-llama-2-1.3b', LoRATM.llama2,
+            TemplateType.default_generation,
+            dict(
+                support_vllm=True,
+                support_flash_attn=True,
+                hf_model_id='hfl/chinese-llama-2-1.3b')),
+        ModelEntry(
+            ModelType.chinese_llama_2_7b, 'AI-ModelScope/chinese-llama-2-7b',
+            LoRATM.llama2, TemplateType.default_generation,
+            dict(
+                support_vllm=True,
+                support_flash_attn=True,
+                hf_model_id='hfl/chinese-llama-2-7b')),
+        ModelEntry(
+            ModelType.chinese_llama_2_7b_16k,
+            'AI-ModelScope/chinese-llama-2-7b-16k', LoRATM.llama2,
+            TemplateType.default_generation,
+            dict(
+                support_vllm=True,
+                support_flash_attn=True,
+                hf_model_id='hfl/chinese-llama-2-7b-16k')),
+        ModelEntry(
+            ModelType.chinese_llama_2_7b_64k,
+            'AI-ModelScope/chinese-llama-2-7b-64k', LoRATM.llama2,
+            TemplateType.default_generation,
+            dict(
+                support_vllm=True,
+                support_flash_attn=True,
+                hf_model_id='hfl/chinese-llama-2-7b-64k')),
+        ModelEntry(
+            ModelType.chinese_llama_2_13b, 'AI-ModelScope/chinese-llama-2-13b',
+            LoRATM.llama2, TemplateType.default_generation,
+            dict(
+                support_vllm=True,
+                support_flash_attn=True,
+                hf_model_id='hfl/chinese-llama-2-13b')),
+        ModelEntry(
+            ModelType.chinese_llama_2_13b_16k,
+            'AI-ModelScope/chinese-llama-2-13b-16k', LoRATM.llama2,
+            TemplateType.default_generation,
+            dict(
+                support_vllm=True,
+                support_flash_attn=True,
+                hf_model_id='hfl/chinese-llama-2-13b-16k')),
+        ModelEntry(
+            ModelType.chinese_alpaca_2_1_3b,
+            'AI-ModelScope/chinese-alpaca-2-1.3b', LoRATM.llama2,
+            TemplateType.llama,
+            dict(
+                support_vllm=True,
+                support_flash_attn=True,
+                hf_model_id='hfl/chinese-alpaca-2-1.3b')),
+        ModelEntry(
+            ModelType.chinese_alpaca_2_7b, 'AI-ModelScope/chinese-alpaca-2-7b',
+            LoRATM.llama2, TemplateType.llama,
+            dict(
+                support_vllm=True,
+                support_flash_attn=True,
+                hf_model_id='hfl/chinese-alpaca-2-7b')),
+        ModelEntry(
+            ModelType.chinese_alpaca_2_7b_16k,
+            'AI-ModelScope/chinese-alpaca-2-7b-16k', LoRATM.llama2,
+            TemplateType.llama,
+            dict(
+                support_vllm=True,
+                support_flash_attn=True,
+                hf_model_id='hfl/chinese-alpaca-2-7b-16k')),
+        ModelEntry(
+            ModelType.chinese_alpaca_2_7b_64k,
+            'AI-ModelScope/chinese-alpaca-2-7b-64k', LoRATM.llama2,
+            TemplateType.llama,
+            dict(
+                support_vllm=True,
+                support_flash_attn=True,
+                hf_model_id='hfl/chinese-alpaca-2-7b-64k')),
+        ModelEntry(
+            ModelType.chinese_alpaca_2_13b,
+            'AI-ModelScope/chinese-alpaca-2-13b', LoRATM.llama2,
+            TemplateType.llama,
+            dict(
+                support_vllm=True,
+                support_flash_attn=True,
+                hf_model_id='hfl/chinese-alpaca-2-13b')),
+        ModelEntry(
+            ModelType.chinese_alpaca_2_13b_16k,
+            'AI-ModelScope/chinese-alpaca-2-13b-16k', LoRATM.llama2,
+            TemplateType.llama,
+            dict(
+                support_vllm=True,
+                support_flash_attn=True,
+                hf_model_id='hfl/chinese-alpaca-2-13b-16k')),
+    )
+
+
+class _GrokModels(ModelFamily):
+    get_function = get_model_tokenizer_grok
+    entries = (ModelEntry(
+        ModelType.grok_1, 'colossalai/grok-1-pytorch', LoRATM.grok_1,
+        TemplateType.default_generation,
+        dict(
+            support_vllm=False,
+            support_flash_attn=False,
+            hf_model_id='hpcai-tech/grok-1')), )
+
+
+class _MambaModels(ModelFamily):
+    get_function = get_model_tokenizer_mamba
+    entries = (
+        ModelEntry(
+            ModelType.mamba_130m, 'AI-ModelScope/mamba-130m-hf', LoRATM.mamba,
+            TemplateType.default_generation,
+            dict(
+                requires=['transformers>=4.39.0'],
+                support_vllm=False,
+                hf_model_id='state-spaces/mamba-130m-hf')),
+        ModelEntry(
+            ModelType.mamba_370m, 'AI-ModelScope/mamba-370m-hf', LoRATM.mamba,
+            TemplateType.default_generation,
+            dict(
+                requires=['transformers>=4.39.0'],
+                support_vllm=False,
+                hf_model_id='state-spaces/mamba-370m-hf')),
+        ModelEntry(
+            ModelType.mamba_390m, 'AI-ModelScope/mamba-390m-hf', LoRATM.mamba,
+            TemplateType.default_generation,
+            dict(
+                requires=['transformers>=4.39.0'],
+                support_vllm=False,
+                hf_model_id='state-spaces/mamba-390m-hf')),
+        ModelEntry(
+            ModelType.mamba_790m, 'AI-ModelScope/mamba-790m-hf', LoRATM.mamba,
+            TemplateType.default_generation,
+            dict(
+                requires=['transformers>=4.39.0'],
+                support_vllm=False,
+                hf_model_id='state-spaces/mamba-790m-hf')),
+        ModelEntry(
+            ModelType.mamba_1_4b, 'AI-ModelScope/mamba-1.4b-hf', LoRATM.mamba,
+            TemplateType.default_generation,
+            dict(
+                requires=['transformers>=4.39.0'],
+                support_vllm=False,
+                hf_model_id='state-spaces/mamba-1.4b-hf')),
+        ModelEntry(
+            ModelType.mamba_2_8b, 'AI-ModelScope/mamba-2.8b-hf', LoRATM.mamba,
+            TemplateType.default_generation,
+            dict(
+                requires=['transformers>=4.39.0'],
+                support_vllm=False,
+                hf_model_id='state-spaces/mamba-2.8b-hf')),
+    )
+
+
 def get_model_tokenizer_cogagent(model_dir: str,
                                  torch_dtype: Dtype,
                                  model_kwargs: Dict[str, Any],
                                  load_model: bool = True,
                                  **kwargs):
-    tokenizer = AutoTokenizer.from_pretrained(
-        'AI-ModelScope/vicuna-7b-v1.5',
-        revision='master',
-        trust_remote_code=True)
+    tokenizer = _get_cached_tokenizer('AI-ModelScope/vicuna-7b-v1.5')
     if load_model is True:
         logger.warning(
             'CogAgent with FusedLayerNorm will cause an training loss of NAN, '
@@ -951,26 +1241,33 @@ def get_model_tokenizer_cogagent(model_dir: str,
     return model, tokenizer
 
 
-@register_model(
-    ModelType.internlm_20b_chat,
-    'Shanghai_AI_Laboratory/internlm-chat-20b',
-    LoRATM.llama2,
-    TemplateType.internlm,
-    support_vllm=True,
-    hf_model_id='internlm/internlm2-chat-20b')
-@register_model(
-    ModelType.internlm_7b_chat_8k,
-    'Shanghai_AI_Laboratory/internlm-chat-7b-8k',
-    LoRATM.llama2,
-    TemplateType.internlm,
-    support_vllm=True)
-@register_model(
-    ModelType.internlm_7b_chat,
-    'Shanghai_AI_Laboratory/internlm-chat-7b',
-    LoRATM.llama2,
-    TemplateType.internlm,
-    support_vllm=True,
-    hf_model_id='internlm/internlm-chat-7b')
+class _CogAgentModels(ModelFamily):
+    get_function = get_model_tokenizer_cogagent
+    entries = (
+        ModelEntry(
+            ModelType.cogvlm_17b_instruct, 'ZhipuAI/cogvlm-chat',
+            LoRATM.cogvlm, TemplateType.cogvlm_instruct,
+            dict(
+                support_gradient_checkpointing=False,
+                tags=['multi-modal', 'vision'],
+                hf_model_id='THUDM/cogvlm-chat-hf')),
+        ModelEntry(
+            ModelType.cogagent_18b_chat, 'ZhipuAI/cogagent-chat',
+            LoRATM.cogagent, TemplateType.cogagent_chat,
+            dict(
+                support_gradient_checkpointing=False,
+                tags=['multi-modal', 'vision'],
+                hf_model_id='THUDM/cogagent-chat-hf')),
+        ModelEntry(
+            ModelType.cogagent_18b_instruct, 'ZhipuAI/cogagent-vqa',
+            LoRATM.cogagent, TemplateType.cogagent_instruct,
+            dict(
+                support_gradient_checkpointing=False,
+                tags=['multi-modal', 'vision'],
+                hf_model_id='THUDM/cogagent-vqa-hf')),
+    )
+
+
 def get_model_tokenizer_internlm_chat(model_dir: str,
                                       torch_dtype: Dtype,
                                       model_kwargs: Dict[str, Any],
@@ -979,20 +1276,34 @@ def get_model_tokenizer_internlm_chat(model_dir: str,
     model, tokenizer = get_model_tokenizer_from_repo(model_dir, torch_dtype,
                                                      model_kwargs, load_model,
                                                      **kwargs)
-    if getattr(tokenizer.__class__.eos_token_id, 'fset', None) is None:
-        del tokenizer.__class__.eos_token_id
-    tokenizer.eos_token = '<eoa>'
+    _set_eos_token(tokenizer, '<eoa>')
     return model, tokenizer
 
 
-@register_model(
-    ModelType.baichuan_13b,
-    'baichuan-inc/Baichuan-13B-Base',
-    LoRATM.baichuan,
-    TemplateType.default_generation,
-    requires=['transformers<4.34'],
-    support_vllm=True,
-    hf_model_id='baichuan-inc/Baichuan-13B-Base')
+class _InternLMChatModels(ModelFamily):
+    get_function = get_model_tokenizer_internlm_chat
+    entries = (
+        ModelEntry(
+            ModelType.internlm_20b_chat,
+            'Shanghai_AI_Laboratory/internlm-chat-20b', LoRATM.llama2,
+            TemplateType.internlm,
+            dict(support_vllm=True,
+                 hf_model_id='internlm/internlm2-chat-20b')),
+        ModelEntry(ModelType.internlm_7b_chat_8k,
+                   'Shanghai_AI_Laboratory/internlm-chat-7b-8k', LoRATM.llama2,
+                   TemplateType.internlm, dict(support_vllm=True)),
+        ModelEntry(
+            ModelType.internlm_7b_chat,
+            'Shanghai_AI_Laboratory/internlm-chat-7b', LoRATM.llama2,
+            TemplateType.internlm,
+            dict(support_vllm=True, hf_model_id='internlm/internlm-chat-7b')),
+    )
+
+
+# Model classes whose `get_input_embeddings` has already been checked.
+_CHECKED_MODEL_CLASSES: 'WeakSet[Type]' = WeakSet()
+
+
 def get_model_tokenizer_baichuan_13b(model_dir: str,
                                      torch_dtype: Dtype,
                                      model_kwargs: Dict[str, Any],
@@ -1003,35 +1314,33 @@ def get_model_tokenizer_baichuan_13b(model_dir: str,
                                                      **kwargs)
     # baichuan-13b does not implement the `get_input_embeddings` function
     # fix gradient_checkpointing bug
-    try:
-        model.get_input_embeddings()
-    except NotImplementedError:
-        model.__class__.get_input_embeddings = lambda self: self.model.embed_tokens
+    if model is not None and model.__class__ not in _CHECKED_MODEL_CLASSES:
+        try:
+            model.get_input_embeddings()
+        except NotImplementedError:
+            model.__class__.get_input_embeddings = lambda self: self.model.embed_tokens
+        _CHECKED_MODEL_CLASSES.add(model.__class__)
     return model, tokenizer
 
 
-@register_model(
-    ModelType.baichuan2_13b_chat,
-    'baichuan-inc/Baichuan2-13B-Chat',
-    LoRATM.baichuan,
-    TemplateType.baichuan,
-    support_vllm=True,
-    hf_model_id='baichuan-inc/Baichuan2-13B-Chat')
-@register_model(
-    ModelType.baichuan2_13b,
-    'baichuan-inc/Baichuan2-13B-Base',
-    LoRATM.baichuan,
-    TemplateType.default_generation,
-    support_vllm=True,
-    hf_model_id='baichuan-inc/Baichuan2-13B-Base')
+class _Baichuan13BModels(ModelFamily):
+    get_function = get_model_tokenizer_baichuan_13b
+    entries = (ModelEntry(
+        ModelType.baichuan_13b, 'baichuan-inc/Baichuan-13B-Base',
+        LoRATM.baichuan, TemplateType.default_generation,
+        dict(
+            requires=['transformers<4.34'],
+            support_vllm=True,
+            hf_model_id='baichuan-inc/Baichuan-13B-Base')), )
+
+
 def get_model_tokenizer_baichuan2_13b(model_dir: str,
                                       torch_dtype: Dtype,
                                       model_kwargs: Dict[str, Any],
                                       load_model: bool = True,
                                       **kwargs):
     # patch: baichuan2_13b configuration_baichuan.py bug
-    model_config = AutoConfig.from_pretrained(
-        model_dir, trust_remote_code=True)
+    model_config = _get_cached_config(model_dir)
     gradient_checkpointing = model_config.gradient_checkpointing
     if isinstance(gradient_checkpointing, (tuple, list)):
         model_config.gradient_checkpointing = gradient_checkpointing[0]
@@ -1044,33 +1353,99 @@ def get_model_tokenizer_baichuan2_13b(model_dir: str,
         **kwargs)
 
 
+class _Baichuan2_13BModels(ModelFamily):
+    get_function = get_model_tokenizer_baichuan2_13b
+    entries = (
+        ModelEntry(
+            ModelType.baichuan2_13b_chat, 'baichuan-inc/Baichuan2-13B-Chat',
+            LoRATM.baichuan, TemplateType.baichuan,
+            dict(
+                support_vllm=True,
+                hf_model_id='baichuan-inc/Baichuan2-13B-Chat')),
+        ModelEntry(
+            ModelType.baichuan2_13b, 'baichuan-inc/Baichuan2-13B-Base',
+            LoRATM.baichuan, TemplateType.default_generation,
+            dict(
+                support_vllm=True,
+                hf_model_id='baichuan-inc/Baichuan2-13B-Base')),
+    )
+
+
+class _NormHeadLinear(torch.autograd.Function):
+    """F.linear(x, F.normalize(weight)) without materializing the normalized
+    vocab x hidden weight: the logits are rescaled by the inverse row norms
+    `rnorm` instead, and the backward recomputes from the row norms only."""
+
+    @staticmethod
+    def forward(ctx, hidden_states: Tensor, weight: Tensor,
+                rnorm: Tensor) -> Tensor:
+        ctx.save_for_backward(hidden_states, weight, rnorm)
+        logits = F.linear(hidden_states, weight)
+        return logits.mul_(rnorm.to(logits.dtype))
+
+    @staticmethod
+    def backward(ctx, grad_output: Tensor) -> Tuple[Optional[Tensor], ...]:
+        hidden_states, weight, rnorm = ctx.saved_tensors
+        grad_output = grad_output.to(weight.dtype)
+        grad_hidden_states = grad_weight = None
+        if ctx.needs_input_grad[0]:
+            grad_hidden_states = (grad_output
+                                  * rnorm.to(weight.dtype)) @ weight
+            grad_hidden_states = grad_hidden_states.to(hidden_states.dtype)
+        if ctx.needs_input_grad[1]:
+            # d/dW of (x @ W.T) * r, with r = 1 / ||W||_row
+            hidden_size = hidden_states.shape[-1]
+            grad_weight = grad_output.reshape(-1, grad_output.shape[-1]).T @ (
+                hidden_states.reshape(-1, hidden_size).to(weight.dtype))
+            # at least fp32 (bf16/fp16 weights), without downcasting fp64
+            row_dot = torch.sum(
+                grad_weight * weight,
+                dim=1,
+                dtype=torch.promote_types(weight.dtype, torch.float32))
+            grad_weight.mul_(rnorm.to(weight.dtype)[:, None])
+            grad_weight.sub_(weight *
+                             (rnorm**3 * row_dot).to(weight.dtype)[:, None])
+        return grad_hidden_states, grad_weight, None
+
+
+def _get_lm_head_rnorm(lm_head) -> Tensor:
+    # The weight only changes at optimizer.step() (an in-place update that
+    # bumps its version counter), so the row norms are shared by all the
+    # micro-batches of a step, and by every step when lm_head is frozen.
+    weight = lm_head.weight
+    key = (weight.data_ptr(), weight._version)
+    cache = getattr(lm_head, '_rnorm_cache', None)
+    if cache is None or cache[0] != key:
+        with torch.no_grad():
+            rnorm = torch.linalg.vector_norm(
+                weight, dim=1,
+                dtype=torch.float32).clamp_min_(1e-12).reciprocal_()
+        cache = (key, rnorm)
+        lm_head._rnorm_cache = cache
+    return cache[1]
+
+
+_PATCHED_LM_HEAD_CLASSES: 'WeakSet[Type]' = WeakSet()
+
+
 def patch_baichuan2_lm_head_forward(self, hidden_states: Tensor) -> Tensor:
     # patch: baichuan2 lm_head (fp32 bug)
+    # `weight` lives in `_parameters` and goes through nn.Module.__getattr__,
+    # so it is looked up once.
+    weight = self.weight
     if self.training:
-        norm_weight = F.normalize(self.weight).to(self.weight.dtype)
+        return _NormHeadLinear.apply(hidden_states, weight,
+                                     _get_lm_head_rnorm(self))
     elif self.first_flag:
         self.first_flag = False
-        self.weight.data = F.normalize(self.weight).to(self.weight.dtype)
-        norm_weight = self.weight
-    else:
-        norm_weight = self.weight
-    return F.linear(hidden_states, norm_weight)
-
-
-@register_model(
-    ModelType.baichuan2_7b_chat,
-    'baichuan-inc/Baichuan2-7B-Chat',
-    LoRATM.baichuan,
-    TemplateType.baichuan,
-    support_vllm=True,
-    hf_model_id='baichuan-inc/Baichuan2-7B-Chat')
-@register_model(
-    ModelType.baichuan2_7b,
-    'baichuan-inc/Baichuan2-7B-Base',
-    LoRATM.baichuan,
-    TemplateType.default_generation,
-    support_vllm=True,
-    hf_model_id='baichuan-inc/Baichuan2-7B-Base')
+        # normalize in place: keep the storage instead of allocating a copy
+        with torch.no_grad():
+            norm = torch.linalg.vector_norm(
+                weight, dim=1, keepdim=True, dtype=torch.float32)
+            weight.div_(norm.clamp_min_(1e-12).to(weight.dtype))
+    return F.linear(hidden_states, weight)
+
+
 def get_model_tokenizer_baichuan2(model_dir: str,
                                   torch_dtype: Dtype,
                                   model_kwargs: Dict[str, Any],
@@ -1078,8 +1453,7 @@ def get_model_tokenizer_baichuan2(model_dir: str,
                                   model_config=None,
                                   **kwargs):
     if model_config is None:
-        model_config = AutoConfig.from_pretrained(
-            model_dir, trust_remote_code=True)
+        model_config = _get_cached_config(model_dir)
     if not hasattr(model_config, 'z_loss_weight'):
         model_config.z_loss_weight = 0
     model, tokenizer = get_model_tokenizer_from_repo(
@@ -1093,55 +1467,76 @@ def get_model_tokenizer_baichuan2(model_dir: str,
     if model is not None:
         if not hasattr(model, 'lm_head'):  # fix awq
             model = model.model
-        new_forward = MethodType(patch_baichuan2_lm_head_forward,
-                                 model.lm_head)
+        lm_head = model.lm_head
+        lm_head_cls = type(lm_head)
         if hasattr(model, '_old_forward'):  # device_map
-            model.lm_head._old_forward = new_forward
-        else:
-            model.lm_head.forward = new_forward
+            lm_head._old_forward = patch_baichuan2_lm_head_forward.__get__(
+                lm_head, lm_head_cls)
+        elif 'forward' in lm_head.__dict__:
+            lm_head.forward = patch_baichuan2_lm_head_forward.__get__(
+                lm_head, lm_head_cls)
+        elif lm_head_cls not in _PATCHED_LM_HEAD_CLASSES:
+            # NormHead of the remote code: patch the class once
+            lm_head_cls.forward = patch_baichuan2_lm_head_forward
+            _PATCHED_LM_HEAD_CLASSES.add(lm_head_cls)
     return model_ori, tokenizer
 
 
-@register_model(
-    ModelType.baichuan2_13b_chat_int4,
-    'baichuan-inc/Baichuan2-13B-Chat-4bits',
-    LoRATM.baichuan,
-    TemplateType.baichuan,
-    function_kwargs={
-        'get_baichuan2_function': get_model_tokenizer_baichuan2_13b
-    },
-    torch_dtype=torch.bfloat16,
-    requires=['bitsandbytes<0.41.2', 'accelerate<0.26'],
-    hf_model_id='baichuan-inc/Baichuan2-13B-Chat-4bits')
-@register_model(
-    ModelType.baichuan2_7b_chat_int4,
-    'baichuan-inc/Baichuan2-7B-Chat-4bits',
-    LoRATM.baichuan,
-    TemplateType.baichuan,
-    torch_dtype=torch.bfloat16,
-    requires=['bitsandbytes<0.41.2', 'accelerate<0.26'],
-    hf_model_id='baichuan-inc/Baichuan2-7B-Chat-4bits')
+class _Baichuan2Models(ModelFamily):
+    get_function = get_model_tokenizer_baichuan2
+    entries = (
+        ModelEntry(
+            ModelType.baichuan2_7b_chat, 'baichuan-inc/Baichuan2-7B-Chat',
+            LoRATM.baichuan, TemplateType.baichuan,
+            dict(
+                support_vllm=True,
+                hf_model_id='baichuan-inc/Baichuan2-7B-Chat')),
+        ModelEntry(
+            ModelType.baichuan2_7b, 'baichuan-inc/Baichuan2-7B-Base',
+            LoRATM.baichuan, TemplateType.default_generation,
+            dict(
+                support_vllm=True,
+                hf_model_id='baichuan-inc/Baichuan2-7B-Base')),
+    )
+
+
+_infer_auto_device_map_lock = threading.Lock()
+
+
+@contextmanager
+def _fixed_infer_auto_device_map(device_map: Any):
+    # The remote code of the int4 models plans its own device_map via
+    # accelerate.infer_auto_device_map, ignoring the one passed in.
+    import accelerate
+    with _infer_auto_device_map_lock:
+        _old_infer_auto_device_map = accelerate.infer_auto_device_map
+        accelerate.infer_auto_device_map = lambda *args, **kwargs: device_map
+        try:
+            yield
+        finally:
+            accelerate.infer_auto_device_map = _old_infer_auto_device_map
+
+
 def get_model_tokenizer_baichuan2_int4(model_dir: str,
                                        torch_dtype: Dtype,
                                        model_kwargs: Dict[str, Any],
                                        load_model: bool = True,
                                        **kwargs):
+    from modelscope import BitsAndBytesConfig
     logger.info('use `model_config.quantization_config`, ignore bnb arguments')
     model_kwargs.pop('quantization_config', None)
 
     # fix device_map bug
-    import accelerate
-    _old_infer_auto_device_map = accelerate.infer_auto_device_map
     device_map = model_kwargs.get('device_map', None)
+    context = nullcontext()
     if device_map != 'auto':
-        accelerate.infer_auto_device_map = lambda *args, **kwargs: device_map
+        context = _fixed_infer_auto_device_map(device_map)
     get_baichuan2_function = kwargs.pop('get_baichuan2_function',
                                         get_model_tokenizer_baichuan2)
-    model, tokenizer = get_baichuan2_function(model_dir, torch_dtype,
-                                              model_kwargs, load_model,
-                                              **kwargs)
-    if device_map != 'auto':
-        accelerate.infer_auto_device_map = _old_infer_auto_device_map
+    with context:
+        model, tokenizer = get_baichuan2_function(model_dir, torch_dtype,
+                                                  model_kwargs, load_model,
+                                                  **kwargs)
     if model is not None:
         model.config.quantization_config = BitsAndBytesConfig(
             **model.config.quantization_config)
@@ -1151,74 +1546,39 @@ def get_model_tokenizer_baichuan2_int4(model_dir: str,
     return model, tokenizer
 
 
+class _Baichuan2Int4Models(ModelFamily):
+    get_function = get_model_tokenizer_baichuan2_int4
+    entries = (
+        ModelEntry(
+            ModelType.baichuan2_13b_chat_int4,
+            'baichuan-inc/Baichuan2-13B-Chat-4bits', LoRATM.baichuan,
+            TemplateType.baichuan,
+            dict(
+                function_kwargs={
+                    'get_baichuan2_function': get_model_tokenizer_baichuan2_13b
+                },
+                torch_dtype=torch.bfloat16,
+                requires=['bitsandbytes<0.41.2', 'accelerate<0.26'],
+                hf_model_id='baichuan-inc/Baichuan2-13B-Chat-4bits')),
+        ModelEntry(
+            ModelType.baichuan2_7b_chat_int4,
+            'baichuan-inc/Baichuan2-7B-Chat-4bits', LoRATM.baichuan,
+            TemplateType.baichuan,
+            dict(
+                torch_dtype=torch.bfloat16,
+                requires=['bitsandbytes<0.41.2', 'accelerate<0.26'],
+                hf_model_id='baichuan-inc/Baichuan2-7B-Chat-4bits')),
+    )
+
+
 def remove_property(tokenizer_cls: Type[PreTrainedTokenizerBase],
                     tokenizer_config: Dict[str, Any]) -> None:
-    for k, v in tokenizer_cls.__dict__.items():
-        if k.endswith('_token') and isinstance(
-                v, property) and k in tokenizer_config:
-            setattr(tokenizer_cls, k, tokenizer_config[k])
-
-
-@register_model(
-    ModelType.codefuse_codegeex2_6b_chat,
-    'codefuse-ai/CodeFuse-CodeGeeX2-6B',
-    LoRATM.chatglm,
-    TemplateType.codefuse,
-    requires=['transformers<4.34'],
-    support_vllm=True,
-    tags=['coding'],
-    hf_model_id='codefuse-ai/CodeFuse-CodeGeeX2-6B')
-@register_model(
-    ModelType.chatglm3_6b_32k,
-    'ZhipuAI/chatglm3-6b-32k',
-    LoRATM.chatglm,
-    TemplateType.chatglm3,
-    support_vllm=True,
-    hf_model_id='THUDM/chatglm3-6b-32k')
-@register_model(
-    ModelType.chatglm3_6b_128k,
-    'ZhipuAI/chatglm3-6b-128k',
-    LoRATM.chatglm,
-    TemplateType.chatglm3,
-    support_vllm=True,
-    hf_model_id='THUDM/chatglm3-6b-128k')
-@register_model(
-    ModelType.chatglm3_6b,
-    'ZhipuAI/chatglm3-6b',
-    LoRATM.chatglm,
-    TemplateType.chatglm3,
-    support_vllm=True,
-    hf_model_id='THUDM/chatglm3-6b')
-@register_model(
-    ModelType.chatglm3_6b_base,
-    'ZhipuAI/chatglm3-6b-base',
-    LoRATM.chatglm,
-    TemplateType.chatglm_generation,
-    support_vllm=True,
-    hf_model_id='THUDM/chatglm3-6b-base')
-@register_model(
-    ModelType.chatglm2_6b_32k,
-    'ZhipuAI/chatglm2-6b-32k',
-    LoRATM.chatglm,
-    TemplateType.chatglm2,
-    support_vllm=True,
-    hf_model_id='THUDM/chatglm2-6b-32k')
-@register_model(
-    ModelType.chatglm2_6b,
-    'ZhipuAI/chatglm2-6b',
-    LoRATM.chatglm,
-    TemplateType.chatglm2,
-    support_vllm=True,
-    hf_model_id='THUDM/chatglm2-6b')
-@register_model(
-    ModelType.codegeex2_6b,
-    'ZhipuAI/codegeex2-6b',
-    LoRATM.chatglm,
-    TemplateType.chatglm_generation,
-    requires=['transformers<4.34'],
-    support_vllm=True,
-    tags=['coding'],
-    hf_model_id='THUDM/codegeex2-6b')
+    cls_dict = tokenizer_cls.__dict__
+    for k, v in tokenizer_config.items():
+        if k.endswith('_token') and isinstance(cls_dict.get(k), property):
+            setattr(tokenizer_cls, k, v)
+
+
 def get_model_tokenizer_chatglm(model_dir: str,
                                 torch_dtype: Dtype,
                                 model_kwargs: Dict[str, Any],
@@ -1229,609 +1589,104 @@ def get_model_tokenizer_chatglm(model_dir: str,
             'output_layer'
         ]
     # fix transformers>=4.34 bug
-    if version.parse(transformers.__version__) >= version.parse('4.34'):
-        tokenizer_config = get_tokenizer_config(model_dir)
+    if _transformers_version_ge('4.34'):
+        tokenizer_config = _get_cached_tokenizer_config(model_dir)
         class_ref = tokenizer_config['auto_map']['AutoTokenizer'][0]
-        tokenizer_cls = get_class_from_dynamic_module(class_ref, model_dir)
-        tokenizer_cls._auto_class = 'AutoTokenizer'
-        remove_property(tokenizer_cls, tokenizer_config)
+        tokenizer_cls = _get_cached_dynamic_class(class_ref, model_dir)
+        if tokenizer_cls.__dict__.get('_swift_props_removed') != model_dir:
+            tokenizer_cls._auto_class = 'AutoTokenizer'
+            remove_property(tokenizer_cls, tokenizer_config)
+            tokenizer_cls._swift_props_removed = model_dir
         kwargs['tokenizer'] = tokenizer_cls.from_pretrained(
             model_dir, trust_remote_code=True)
     model, tokenizer = get_model_tokenizer_from_repo(model_dir, torch_dtype,
                                                      model_kwargs, load_model,
                                                      **kwargs)
     if model is not None:
-        from torch.nn import CrossEntropyLoss
-        __old_forward = CrossEntropyLoss.forward
+        # fix device_map: the loss is computed on the device of the logits
+        output_layer = model.transformer.output_layer
+
+        def _move_labels_pre_hook(module, args, kwargs):
+            labels = kwargs.get('labels')
+            if labels is not None:
+                # an offloaded (cpu/disk) weight is on `meta`, and runs on the execution_device
+                hf_hook = getattr(output_layer, '_hf_hook', None)
+                device = getattr(hf_hook, 'execution_device', None)
+                if device is None:
+                    device = output_layer.weight.device
+                kwargs['labels'] = labels.to(device)
+            return args, kwargs
+
+        if _torch_version_ge('2'):
+            model.register_forward_pre_hook(
+                _move_labels_pre_hook, with_kwargs=True)
+        else:  # torch<2 has no kwargs in forward pre-hooks
+            from torch.nn import CrossEntropyLoss
+            __old_forward = CrossEntropyLoss.forward
+
+            def cross_entropy_forward(self, inputs: Tensor,
+                                      target: Tensor) -> Tensor:
+                target = target.to(device=inputs.device)
+                return __old_forward(self, inputs, target)
+
+            CrossEntropyLoss.forward = cross_entropy_forward
+    return model, tokenizer
 
-        def cross_entropy_forward(self, inputs: Tensor,
-                                  target: Tensor) -> Tensor:
-            target = target.to(device=inputs.device)
-            return __old_forward(self, inputs, target)
 
-        CrossEntropyLoss.forward = cross_entropy_forward
-    return model, tokenizer
+class _ChatGLMModels(ModelFamily):
+    get_function = get_model_tokenizer_chatglm
+    entries = (
+        ModelEntry(
+            ModelType.codefuse_codegeex2_6b_chat,
+            'codefuse-ai/CodeFuse-CodeGeeX2-6B', LoRATM.chatglm,
+            TemplateType.codefuse,
+            dict(
+                requires=['transformers<4.34'],
+                support_vllm=True,
+                tags=['coding'],
+                hf_model_id='codefuse-ai/CodeFuse-CodeGeeX2-6B')),
+        ModelEntry(
+            ModelType.chatglm3_6b_32k, 'ZhipuAI/chatglm3-6b-32k',
+            LoRATM.chatglm, TemplateType.chatglm3,
+            dict(support_vllm=True, hf_model_id='THUDM/chatglm3-6b-32k')),
+        ModelEntry(
+            ModelType.chatglm3_6b_128k, 'ZhipuAI/chatglm3-6b-128k',
+            LoRATM.chatglm, TemplateType.chatglm3,
+            dict(support_vllm=True, hf_model_id='THUDM/chatglm3-6b-128k')),
+        ModelEntry(ModelType.chatglm3_6b, 'ZhipuAI/chatglm3-6b',
+                   LoRATM.chatglm, TemplateType.chatglm3,
+                   dict(support_vllm=True, hf_model_id='THUDM/chatglm3-6b')),
+        ModelEntry(
+            ModelType.chatglm3_6b_base, 'ZhipuAI/chatglm3-6b-base',
+            LoRATM.chatglm, TemplateType.chatglm_generation,
+            dict(support_vllm=True, hf_model_id='THUDM/chatglm3-6b-base')),
+        ModelEntry(
+            ModelType.chatglm2_6b_32k, 'ZhipuAI/chatglm2-6b-32k',
+            LoRATM.chatglm, TemplateType.chatglm2,
+            dict(support_vllm=True, hf_model_id='THUDM/chatglm2-6b-32k')),
+        ModelEntry(ModelType.chatglm2_6b, 'ZhipuAI/chatglm2-6b',
+                   LoRATM.chatglm, TemplateType.chatglm2,
+                   dict(support_vllm=True, hf_model_id='THUDM/chatglm2-6b')),
+        ModelEntry(
+            ModelType.codegeex2_6b, 'ZhipuAI/codegeex2-6b', LoRATM.chatglm,
+            TemplateType.chatglm_generation,
+            dict(
+                requires=['transformers<4.34'],
+                support_vllm=True,
+                tags=['coding'],
+                hf_model_id='THUDM/codegeex2-6b')),
+    )
+
+
+def _set_flash_attn(model_config: PretrainedConfig,
+                    use_flash_attn: bool) -> None:
+    if _transformers_version_ge('4.36'):
+        if use_flash_attn:
+            model_config._attn_implementation = 'flash_attention_2'
+    else:
+        model_config._flash_attn_2_enabled = use_flash_attn
 
 
-@register_model(
-    ModelType.phi3_4b_128k_instruct,
-    'LLM-Research/Phi-3-mini-128k-instruct',
-    LoRATM.phi3,
-    TemplateType.phi3,
-    requires=['transformers>=4.36'],
-    support_flash_attn=True,
-    support_vllm=False,  # https://github.com/vllm-project/vllm/pull/4298
-    tags=['general'],
-    hf_model_id='microsoft/Phi-3-mini-128k-instruct')
-@register_model(
-    ModelType.phi3_4b_4k_instruct,
-    'LLM-Research/Phi-3-mini-4k-instruct',
-    LoRATM.phi3,
-    TemplateType.phi3,
-    requires=['transformers>=4.36'],
-    support_flash_attn=True,
-    support_vllm=False,
-    tags=['general'],
-    hf_model_id='microsoft/Phi-3-mini-4k-instruct')
-@register_model(
-    ModelType.wizardlm2_8x22b,
-    'AI-ModelScope/WizardLM-2-8x22B',
-    LoRATM.llama2,
-    TemplateType.wizardlm2,
-    requires=['transformers>=4.36'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='alpindale/WizardLM-2-8x22B')
-@register_model(
-    ModelType.wizardlm2_7b_awq,
-    'AI-ModelScope/WizardLM-2-7B-AWQ',
-    LoRATM.llama2,
-    TemplateType.wizardlm2_awq,
-    requires=['transformers>=4.34'],
-    torch_dtype=torch.float16,
-    support_flash_attn=True,
-    support_vllm=True,
-    function_kwargs={'is_awq': True},
-    hf_model_id='MaziyarPanahi/WizardLM-2-7B-AWQ')
-@register_model(
-    ModelType.gemma_2b,
-    'AI-ModelScope/gemma-2b',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    requires=['transformers>=4.38'],
-    ignore_file_pattern=[r'.+\.gguf$'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='google/gemma-2b')
-@register_model(
-    ModelType.gemma_7b,
-    'AI-ModelScope/gemma-7b',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    requires=['transformers>=4.38'],
-    ignore_file_pattern=[r'.+\.gguf$'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='google/gemma-7b')
-@register_model(
-    ModelType.gemma_2b_instruct,
-    'AI-ModelScope/gemma-2b-it',
-    LoRATM.llama2,
-    TemplateType.gemma,
-    requires=['transformers>=4.38'],
-    ignore_file_pattern=[r'.+\.gguf$'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='google/gemma-2b-it')
-@register_model(
-    ModelType.gemma_7b_instruct,
-    'AI-ModelScope/gemma-7b-it',
-    LoRATM.llama2,
-    TemplateType.gemma,
-    requires=['transformers>=4.38'],
-    ignore_file_pattern=[r'.+\.gguf$'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='google/gemma-7b-it')
-@register_model(
-    ModelType.deepseek_math_7b_instruct,
-    'deepseek-ai/deepseek-math-7b-instruct',
-    LoRATM.llama2,
-    TemplateType.deepseek,
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['math'],
-    hf_model_id='deepseek-ai/deepseek-math-7b-instruct')
-@register_model(
-    ModelType.deepseek_math_7b_chat,
-    'deepseek-ai/deepseek-math-7b-rl',
-    LoRATM.llama2,
-    TemplateType.deepseek,
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['math'],
-    hf_model_id='deepseek-ai/deepseek-math-7b-rl')
-@register_model(
-    ModelType.deepseek_math_7b,
-    'deepseek-ai/deepseek-math-7b-base',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['math'],
-    hf_model_id='deepseek-ai/deepseek-math-7b-base')
-@register_model(
-    ModelType.qwen1half_0_5b,
-    'qwen/Qwen1.5-0.5B',
-    LoRATM.qwen1half,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/Qwen1.5-0.5B')
-@register_model(
-    ModelType.qwen1half_1_8b,
-    'qwen/Qwen1.5-1.8B',
-    LoRATM.qwen1half,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/Qwen1.5-1.8B')
-@register_model(
-    ModelType.qwen1half_4b,
-    'qwen/Qwen1.5-4B',
-    LoRATM.qwen1half,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/Qwen1.5-4B')
-@register_model(
-    ModelType.qwen1half_7b,
-    'qwen/Qwen1.5-7B',
-    LoRATM.qwen1half,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/Qwen1.5-7B')
-@register_model(
-    ModelType.qwen1half_14b,
-    'qwen/Qwen1.5-14B',
-    LoRATM.qwen1half,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/Qwen1.5-14B')
-@register_model(
-    ModelType.qwen1half_32b,
-    'qwen/Qwen1.5-32B',
-    LoRATM.qwen1half,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/Qwen1.5-32B')
-@register_model(
-    ModelType.qwen1half_72b,
-    'qwen/Qwen1.5-72B',
-    LoRATM.qwen1half,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/Qwen1.5-72B')
-@register_model(
-    ModelType.codeqwen1half_7b,
-    'qwen/CodeQwen1.5-7B',
-    LoRATM.qwen1half,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/CodeQwen1.5-7B')
-@register_model(
-    ModelType.qwen1half_moe_a2_7b,
-    'qwen/Qwen1.5-MoE-A2.7B',
-    LoRATM.qwen1half,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.40'],
-    hf_model_id='Qwen/Qwen1.5-MoE-A2.7B')
-@register_model(
-    ModelType.deepseek_coder_1_3b,
-    'deepseek-ai/deepseek-coder-1.3b-base',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['coding'],
-    hf_model_id='deepseek-ai/deepseek-coder-1.3b-base')
-@register_model(
-    ModelType.deepseek_coder_6_7b,
-    'deepseek-ai/deepseek-coder-6.7b-base',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['coding'],
-    hf_model_id='deepseek-ai/deepseek-coder-6.7b-base')
-@register_model(
-    ModelType.deepseek_coder_33b,
-    'deepseek-ai/deepseek-coder-33b-base',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['coding'],
-    hf_model_id='deepseek-ai/deepseek-coder-33b-base')
-@register_model(
-    ModelType.deepseek_coder_1_3b_instruct,
-    'deepseek-ai/deepseek-coder-1.3b-instruct',
-    LoRATM.llama2,
-    TemplateType.deepseek_coder,
-    eos_token='<|EOT|>',
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['coding'],
-    hf_model_id='deepseek-ai/deepseek-coder-1.3b-instruct')
-@register_model(
-    ModelType.deepseek_coder_6_7b_instruct,
-    'deepseek-ai/deepseek-coder-6.7b-instruct',
-    LoRATM.llama2,
-    TemplateType.deepseek_coder,
-    eos_token='<|EOT|>',
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['coding'],
-    hf_model_id='deepseek-ai/deepseek-coder-6.7b-instruct')
-@register_model(
-    ModelType.deepseek_coder_33b_instruct,
-    'deepseek-ai/deepseek-coder-33b-instruct',
-    LoRATM.llama2,
-    TemplateType.deepseek_coder,
-    eos_token='<|EOT|>',
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['coding'],
-    hf_model_id='deepseek-ai/deepseek-coder-33b-instruct')
-@register_model(
-    ModelType.openbuddy_deepseek_67b_chat,
-    'OpenBuddy/openbuddy-deepseek-67b-v15.2',
-    LoRATM.llama2,
-    TemplateType.openbuddy,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='OpenBuddy/openbuddy-deepseek-67b-v15.2')
-@register_model(
-    ModelType.deepseek_67b_chat,
-    'deepseek-ai/deepseek-llm-67b-chat',
-    LoRATM.llama2,
-    TemplateType.deepseek,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='deepseek-ai/deepseek-llm-67b-chat')
-@register_model(
-    ModelType.deepseek_67b,
-    'deepseek-ai/deepseek-llm-67b-base',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='deepseek-ai/deepseek-llm-67b-base')
-@register_model(
-    ModelType.deepseek_7b_chat,
-    'deepseek-ai/deepseek-llm-7b-chat',
-    LoRATM.llama2,
-    TemplateType.deepseek,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='deepseek-ai/deepseek-llm-7b-chat')
-@register_model(
-    ModelType.deepseek_7b,
-    'deepseek-ai/deepseek-llm-7b-base',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='deepseek-ai/deepseek-llm-7b-base')
-@register_model(
-    ModelType.sus_34b_chat,
-    'SUSTC/SUS-Chat-34B',
-    LoRATM.llama2,
-    TemplateType.sus,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='SUSTech/SUS-Chat-34B')
-@register_model(
-    ModelType.openbuddy_zephyr_7b_chat,
-    'OpenBuddy/openbuddy-zephyr-7b-v14.1',
-    LoRATM.llama2,
-    TemplateType.openbuddy,
-    requires=['transformers>=4.34'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='OpenBuddy/openbuddy-zephyr-7b-v14.1')
-@register_model(
-    ModelType.zephyr_7b_beta_chat,
-    'modelscope/zephyr-7b-beta',
-    LoRATM.llama2,
-    TemplateType.zephyr,
-    requires=['transformers>=4.34'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='HuggingFaceH4/zephyr-7b-beta')
-@register_model(
-    ModelType.yi_6b_chat,
-    '01ai/Yi-6B-Chat',
-    LoRATM.llama2,
-    TemplateType.yi,
-    eos_token='<|im_end|>',
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='01-ai/Yi-6B-Chat')
-@register_model(
-    ModelType.yi_6b_chat_awq,
-    '01ai/Yi-6B-Chat-4bits',
-    LoRATM.llama2,
-    TemplateType.yi,
-    eos_token='<|im_end|>',
-    requires=['autoawq'],
-    torch_dtype=torch.float16,
-    function_kwargs={'is_awq': True},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='01-ai/Yi-6B-Chat-4bits')
-@register_model(
-    ModelType.yi_6b_chat_int8,
-    '01ai/Yi-6B-Chat-8bits',
-    LoRATM.llama2,
-    TemplateType.yi,
-    eos_token='<|im_end|>',
-    requires=['auto_gptq'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 8},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='01-ai/Yi-6B-Chat-8bits')
-@register_model(
-    ModelType.yi_34b_chat,
-    '01ai/Yi-34B-Chat',
-    LoRATM.llama2,
-    TemplateType.yi,
-    eos_token='<|im_end|>',
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='01-ai/Yi-34B-Chat')
-@register_model(
-    ModelType.yi_34b_chat_awq,
-    '01ai/Yi-34B-Chat-4bits',
-    LoRATM.llama2,
-    TemplateType.yi,
-    eos_token='<|im_end|>',
-    requires=['autoawq'],
-    torch_dtype=torch.float16,
-    function_kwargs={'is_awq': True},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='01-ai/Yi-34B-Chat-4bits')
-@register_model(
-    ModelType.yi_34b_chat_int8,
-    '01ai/Yi-34B-Chat-8bits',
-    LoRATM.llama2,
-    TemplateType.yi,
-    eos_token='<|im_end|>',
-    requires=['auto_gptq'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 8},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='01-ai/Yi-34B-Chat-8bits')
-@register_model(
-    ModelType.yi_34b_200k,
-    '01ai/Yi-34B-200K',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='01-ai/Yi-34B-200K')
-@register_model(
-    ModelType.yi_34b,
-    '01ai/Yi-34B',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='01-ai/Yi-34B')
-@register_model(
-    ModelType.yi_6b_200k,
-    '01ai/Yi-6B-200K',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='01-ai/Yi-6B-200K')
-@register_model(
-    ModelType.yi_9b,
-    '01ai/Yi-9B',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='01-ai/Yi-9B')
-@register_model(
-    ModelType.yi_9b_200k,
-    '01ai/Yi-9B-200K',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='01-ai/Yi-9B-200K')
-@register_model(
-    ModelType.yi_6b,
-    '01ai/Yi-6B',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='01-ai/Yi-6B')
-@register_model(
-    ModelType.ziya2_13b_chat,
-    'Fengshenbang/Ziya2-13B-Chat',
-    LoRATM.llama2,
-    TemplateType.ziya,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='IDEA-CCNL/Ziya2-13B-Chat')
-@register_model(
-    ModelType.ziya2_13b,
-    'Fengshenbang/Ziya2-13B-Base',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='IDEA-CCNL/Ziya2-13B-Base')
-@register_model(
-    ModelType.openbuddy_mixtral_moe_7b_chat,
-    'OpenBuddy/openbuddy-mixtral-7bx8-v18.1-32k',
-    LoRATM.llama2,
-    TemplateType.openbuddy,
-    requires=['transformers>=4.36'],
-    support_flash_attn=True,
-    support_vllm=True,
-    support_gradient_checkpointing=False,
-    hf_model_id='OpenBuddy/openbuddy-mixtral-7bx8-v18.1-32k')
-@register_model(
-    ModelType.openbuddy_mistral_7b_chat,
-    'OpenBuddy/openbuddy-mistral-7b-v17.1-32k',
-    LoRATM.llama2,
-    TemplateType.openbuddy,
-    requires=['transformers>=4.34'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='OpenBuddy/openbuddy-mistral-7b-v17.1-32k')
-@register_model(
-    ModelType.openbuddy_llama2_70b_chat,
-    'OpenBuddy/openbuddy-llama2-70b-v10.1-bf16',
-    LoRATM.llama2,
-    TemplateType.openbuddy,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='OpenBuddy/openbuddy-llama2-70b-v10.1-bf16')
-@register_model(
-    ModelType.openbuddy_llama2_65b_chat,
-    'OpenBuddy/openbuddy-llama-65b-v8-bf16',
-    LoRATM.llama2,
-    TemplateType.openbuddy,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='OpenBuddy/openbuddy-llama-65b-v8-bf16')
-@register_model(
-    ModelType.openbuddy_llama3_8b_chat,
-    'OpenBuddy/openbuddy-llama3-8b-v21.1-8k',
-    LoRATM.llama2,
-    TemplateType.openbuddy2,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='OpenBuddy/openbuddy-llama3-8b-v21.1-8k')
-@register_model(
-    ModelType.openbuddy_llama2_13b_chat,
-    'OpenBuddy/openbuddy-llama2-13b-v8.1-fp16',
-    LoRATM.llama2,
-    TemplateType.openbuddy,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='OpenBuddy/openbuddy-llama2-13b-v8.1-fp16')
-@register_model(
-    ModelType.mistral_7b_instruct,
-    'AI-ModelScope/Mistral-7B-Instruct-v0.1',
-    LoRATM.llama2,
-    TemplateType.llama,
-    requires=['transformers>=4.34'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='mistralai/Mistral-7B-Instruct-v0.1')
-@register_model(
-    ModelType.mistral_7b_instruct_v2,
-    'AI-ModelScope/Mistral-7B-Instruct-v0.2',
-    LoRATM.llama2,
-    TemplateType.llama,
-    requires=['transformers>=4.34'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='mistralai/Mistral-7B-Instruct-v0.2')
-@register_model(
-    ModelType.mistral_7b,
-    'AI-ModelScope/Mistral-7B-v0.1',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    requires=['transformers>=4.34'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='mistralai/Mistral-7B-v0.1')
-@register_model(
-    ModelType.mistral_7b_v2,
-    'AI-ModelScope/Mistral-7B-v0.2-hf',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    requires=['transformers>=4.34'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='alpindale/Mistral-7B-v0.2-hf')
-@register_model(
-    ModelType.mixtral_moe_7b,
-    'AI-ModelScope/Mixtral-8x7B-v0.1',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    requires=['transformers>=4.36'],
-    ignore_file_pattern=[r'.+\.pt$'],
-    support_flash_attn=True,
-    support_vllm=True,
-    support_gradient_checkpointing=False,
-    hf_model_id='mistralai/Mixtral-8x7B-v0.1')
-@register_model(
-    ModelType.mixtral_moe_7b_instruct,
-    'AI-ModelScope/Mixtral-8x7B-Instruct-v0.1',
-    LoRATM.llama2,
-    TemplateType.llama,
-    requires=['transformers>=4.36'],
-    ignore_file_pattern=[r'.+\.pt$'],
-    support_flash_attn=True,
-    support_vllm=True,
-    support_gradient_checkpointing=False,
-    hf_model_id='mistralai/Mixtral-8x7B-Instruct-v0.1')
-@register_model(
-    ModelType.mixtral_moe_8x22b_v1,
-    'AI-ModelScope/Mixtral-8x22B-v0.1',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    requires=['transformers>=4.36'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='mistral-community/Mixtral-8x22B-v0.1')
-@register_model(
-    ModelType.dbrx_base,
-    'AI-ModelScope/dbrx-base',
-    LoRATM.dbrx,
-    TemplateType.dbrx,
-    requires=['transformers>=4.36'],
-    support_flash_attn=True,
-    support_vllm=True,
-    support_gradient_checkpointing=False,
-    hf_model_id='databricks/dbrx-base')
-@register_model(
-    ModelType.dbrx_instruct,
-    'AI-ModelScope/dbrx-instruct',
-    LoRATM.dbrx,
-    TemplateType.dbrx,
-    requires=['transformers>=4.36'],
-    support_flash_attn=True,
-    support_vllm=True,
-    support_gradient_checkpointing=False,
-    hf_model_id='databricks/dbrx-instruct')
 def get_model_tokenizer_with_flash_attn(model_dir: str,
                                         torch_dtype: Dtype,
                                         model_kwargs: Dict[str, Any],
@@ -1839,14 +1694,8 @@ def get_model_tokenizer_with_flash_attn(model_dir: str,
                                         model_config=None,
                                         **kwargs):
     if model_config is None:
-        model_config = AutoConfig.from_pretrained(
-            model_dir, trust_remote_code=True)
-    use_flash_attn = kwargs.pop('use_flash_attn', False)
-    if version.parse(transformers.__version__) >= version.parse('4.36'):
-        if use_flash_attn:
-            model_config._attn_implementation = 'flash_attention_2'
-    else:
-        model_config._flash_attn_2_enabled = use_flash_attn
+        model_config = _get_cached_config(model_dir)
+    _set_flash_attn(model_config, kwargs.pop('use_flash_attn', False))
     return get_model_tokenizer_from_repo(
         model_dir,
         torch_dtype,
@@ -1856,497 +1705,895 @@ def get_model_tokenizer_with_flash_attn(model_dir: str,
         **kwargs)
 
 
-@register_model(
-    ModelType.qwen1half_0_5b_chat_awq,
-    'qwen/Qwen1.5-0.5B-Chat-AWQ',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    function_kwargs={'is_awq': True},
-    requires=['transformers>=4.37', 'autoawq'],
-    torch_dtype=torch.float16,
-    hf_model_id='Qwen/Qwen1.5-0.5B-Chat-AWQ')
-@register_model(
-    ModelType.qwen1half_1_8b_chat_awq,
-    'qwen/Qwen1.5-1.8B-Chat-AWQ',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    function_kwargs={'is_awq': True},
-    requires=['transformers>=4.37', 'autoawq'],
-    torch_dtype=torch.float16,
-    hf_model_id='Qwen/Qwen1.5-1.8B-Chat-AWQ')
-@register_model(
-    ModelType.qwen1half_4b_chat_awq,
-    'qwen/Qwen1.5-4B-Chat-AWQ',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    function_kwargs={'is_awq': True},
-    requires=['transformers>=4.37', 'autoawq'],
-    torch_dtype=torch.float16,
-    hf_model_id='Qwen/Qwen1.5-4B-Chat-AWQ')
-@register_model(
-    ModelType.qwen1half_7b_chat_awq,
-    'qwen/Qwen1.5-7B-Chat-AWQ',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    function_kwargs={'is_awq': True},
-    requires=['transformers>=4.37', 'autoawq'],
-    torch_dtype=torch.float16,
-    hf_model_id='Qwen/Qwen1.5-7B-Chat-AWQ')
-@register_model(
-    ModelType.qwen1half_14b_chat_awq,
-    'qwen/Qwen1.5-14B-Chat-AWQ',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    function_kwargs={'is_awq': True},
-    requires=['transformers>=4.37', 'autoawq'],
-    torch_dtype=torch.float16,
-    hf_model_id='Qwen/Qwen1.5-14B-Chat-AWQ')
-@register_model(
-    ModelType.qwen1half_32b_chat_awq,
-    'qwen/Qwen1.5-32B-Chat-AWQ',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    function_kwargs={'is_awq': True},
-    requires=['transformers>=4.37', 'autoawq'],
-    torch_dtype=torch.float16,
-    hf_model_id='Qwen/Qwen1.5-32B-Chat-AWQ')
-@register_model(
-    ModelType.qwen1half_72b_chat_awq,
-    'qwen/Qwen1.5-72B-Chat-AWQ',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    function_kwargs={'is_awq': True},
-    requires=['transformers>=4.37', 'autoawq'],
-    torch_dtype=torch.float16,
-    hf_model_id='Qwen/Qwen1.5-72B-Chat-AWQ')
-@register_model(
-    ModelType.codeqwen1half_7b_chat_awq,
-    'qwen/CodeQwen1.5-7B-Chat-AWQ',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    function_kwargs={'is_awq': True},
-    requires=['transformers>=4.37', 'autoawq'],
-    torch_dtype=torch.float16,
-    hf_model_id='Qwen/CodeQwen1.5-7B-Chat-AWQ')
-@register_model(
-    ModelType.qwen1half_0_5b_chat,
-    'qwen/Qwen1.5-0.5B-Chat',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/Qwen1.5-0.5B-Chat')
-@register_model(
-    ModelType.qwen1half_1_8b_chat,
-    'qwen/Qwen1.5-1.8B-Chat',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/Qwen1.5-1.8B-Chat')
-@register_model(
-    ModelType.qwen1half_4b_chat,
-    'qwen/Qwen1.5-4B-Chat',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/Qwen1.5-4B-Chat')
-@register_model(
-    ModelType.qwen1half_7b_chat,
-    'qwen/Qwen1.5-7B-Chat',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/Qwen1.5-7B-Chat')
-@register_model(
-    ModelType.qwen1half_14b_chat,
-    'qwen/Qwen1.5-14B-Chat',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/Qwen1.5-14B-Chat')
-@register_model(
-    ModelType.qwen1half_32b_chat,
-    'qwen/Qwen1.5-32B-Chat',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/Qwen1.5-32B-Chat')
-@register_model(
-    ModelType.qwen1half_72b_chat,
-    'qwen/Qwen1.5-72B-Chat',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/Qwen1.5-72B-Chat')
-@register_model(
-    ModelType.qwen1half_moe_a2_7b_chat,
-    'qwen/Qwen1.5-MoE-A2.7B-Chat',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.40'],
-    hf_model_id='Qwen/Qwen1.5-MoE-A2.7B-Chat')
-@register_model(
-    ModelType.codeqwen1half_7b_chat,
-    'qwen/CodeQwen1.5-7B-Chat',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    requires=['transformers>=4.37'],
-    hf_model_id='Qwen/CodeQwen1.5-7B-Chat')
-def get_model_tokenizer_qwen1half(model_dir: str,
-                                  torch_dtype: Dtype,
-                                  model_kwargs: Dict[str, Any],
-                                  load_model: bool = True,
-                                  **kwargs):
-    kwargs['eos_token'] = '<|im_end|>'
-    return get_model_tokenizer_with_flash_attn(model_dir, torch_dtype,
-                                               model_kwargs, load_model,
-                                               **kwargs)
-
-
-@register_model(
-    ModelType.qwen1half_0_5b_chat_int4,
-    'qwen/Qwen1.5-0.5B-Chat-GPTQ-Int4',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5', 'transformers>=4.37'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 4},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen1.5-0.5B-Chat-GPTQ-Int4')
-@register_model(
-    ModelType.qwen1half_0_5b_chat_int8,
-    'qwen/Qwen1.5-0.5B-Chat-GPTQ-Int8',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5', 'transformers>=4.37'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 8},
-    support_flash_attn=True,
-    hf_model_id='Qwen/Qwen1.5-0.5B-Chat-GPTQ-Int8')
-@register_model(
-    ModelType.qwen1half_1_8b_chat_int4,
-    'qwen/Qwen1.5-1.8B-Chat-GPTQ-Int4',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5', 'transformers>=4.37'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 4},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen1.5-1.8B-Chat-GPTQ-Int4')
-@register_model(
-    ModelType.qwen1half_1_8b_chat_int8,
-    'qwen/Qwen1.5-1.8B-Chat-GPTQ-Int8',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5', 'transformers>=4.37'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 8},
-    support_flash_attn=True,
-    hf_model_id='Qwen/Qwen1.5-1.8B-Chat-GPTQ-Int8')
-@register_model(
-    ModelType.qwen1half_4b_chat_int4,
-    'qwen/Qwen1.5-4B-Chat-GPTQ-Int4',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5', 'transformers>=4.37'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 4},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen1.5-4B-Chat-GPTQ-Int4')
-@register_model(
-    ModelType.qwen1half_4b_chat_int8,
-    'qwen/Qwen1.5-4B-Chat-GPTQ-Int8',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5', 'transformers>=4.37'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 8},
-    support_flash_attn=True,
-    hf_model_id='Qwen/Qwen1.5-4B-Chat-GPTQ-Int8')
-@register_model(
-    ModelType.qwen1half_7b_chat_int4,
-    'qwen/Qwen1.5-7B-Chat-GPTQ-Int4',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5', 'transformers>=4.37'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 4},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen1.5-7B-Chat-GPTQ-Int4')
-@register_model(
-    ModelType.qwen1half_7b_chat_int8,
-    'qwen/Qwen1.5-7B-Chat-GPTQ-Int8',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5', 'transformers>=4.37'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 8},
-    support_flash_attn=True,
-    hf_model_id='Qwen/Qwen1.5-7B-Chat-GPTQ-Int8')
-@register_model(
-    ModelType.qwen1half_14b_chat_int4,
-    'qwen/Qwen1.5-14B-Chat-GPTQ-Int4',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5', 'transformers>=4.37'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 4},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen1.5-14B-Chat-GPTQ-Int4')
-@register_model(
-    ModelType.qwen1half_14b_chat_int8,
-    'qwen/Qwen1.5-14B-Chat-GPTQ-Int8',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5', 'transformers>=4.37'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 8},
-    support_flash_attn=True,
-    hf_model_id='Qwen/Qwen1.5-14B-Chat-GPTQ-Int8')
-@register_model(
-    ModelType.qwen1half_32b_chat_int4,
-    'qwen/Qwen1.5-32B-Chat-GPTQ-Int4',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5', 'transformers>=4.37'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 4},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen1.5-32B-Chat-GPTQ-Int4')
-@register_model(
-    ModelType.qwen1half_72b_chat_int4,
-    'qwen/Qwen1.5-72B-Chat-GPTQ-Int4',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5', 'transformers>=4.37'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 4},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen1.5-72B-Chat-GPTQ-Int4')
-@register_model(
-    ModelType.qwen1half_72b_chat_int8,
-    'qwen/Qwen1.5-72B-Chat-GPTQ-Int8',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5', 'transformers>=4.37'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 8},
-    support_flash_attn=True,
-    hf_model_id='Qwen/Qwen1.5-72B-Chat-GPTQ-Int8')
-@register_model(
-    ModelType.qwen1half_moe_a2_7b_chat_int4,
-    'qwen/Qwen1.5-MoE-A2.7B-Chat-GPTQ-Int4',
-    LoRATM.qwen1half,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5', 'transformers>=4.40'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 4},
-    support_flash_attn=True,
-    hf_model_id='Qwen/Qwen1.5-MoE-A2.7B-Chat-GPTQ-Int4')
-def get_model_tokenizer_qwen1half_intx(model_dir: str,
-                                       torch_dtype: Dtype,
-                                       model_kwargs: Dict[str, Any],
-                                       load_model: bool = True,
-                                       **kwargs):
-    kwargs['get_qwen_function'] = get_model_tokenizer_qwen1half
-    return get_model_tokenizer_qwen_intx(model_dir, torch_dtype, model_kwargs,
-                                         load_model, **kwargs)
+class _FlashAttnModels(ModelFamily):
+    get_function = get_model_tokenizer_with_flash_attn
+    entries = (
+        ModelEntry(
+            ModelType.phi3_4b_128k_instruct,
+            'LLM-Research/Phi-3-mini-128k-instruct',
+            LoRATM.phi3,
+            TemplateType.phi3,
+            dict(
+                requires=['transformers>=4.36'],
+                support_flash_attn=True,
+                # https://github.com/vllm-project/vllm/pull/4298
+                support_vllm=False,
+                tags=['general'],
+                hf_model_id='microsoft/Phi-3-mini-128k-instruct')),
+        ModelEntry(
+            ModelType.phi3_4b_4k_instruct,
+            'LLM-Research/Phi-3-mini-4k-instruct', LoRATM.phi3,
+            TemplateType.phi3,
+            dict(
+                requires=['transformers>=4.36'],
+                support_flash_attn=True,
+                support_vllm=False,
+                tags=['general'],
+                hf_model_id='microsoft/Phi-3-mini-4k-instruct')),
+        ModelEntry(
+            ModelType.wizardlm2_8x22b, 'AI-ModelScope/WizardLM-2-8x22B',
+            LoRATM.llama2, TemplateType.wizardlm2,
+            dict(
+                requires=['transformers>=4.36'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='alpindale/WizardLM-2-8x22B')),
+        ModelEntry(
+            ModelType.wizardlm2_7b_awq, 'AI-ModelScope/WizardLM-2-7B-AWQ',
+            LoRATM.llama2, TemplateType.wizardlm2_awq,
+            dict(
+                requires=['transformers>=4.34'],
+                torch_dtype=torch.float16,
+                support_flash_attn=True,
+                support_vllm=True,
+                function_kwargs={'is_awq': True},
+                hf_model_id='MaziyarPanahi/WizardLM-2-7B-AWQ')),
+        ModelEntry(
+            ModelType.gemma_2b, 'AI-ModelScope/gemma-2b', LoRATM.llama2,
+            TemplateType.default_generation_bos,
+            dict(
+                requires=['transformers>=4.38'],
+                ignore_file_pattern=[r'.+\.gguf$'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='google/gemma-2b')),
+        ModelEntry(
+            ModelType.gemma_7b, 'AI-ModelScope/gemma-7b', LoRATM.llama2,
+            TemplateType.default_generation_bos,
+            dict(
+                requires=['transformers>=4.38'],
+                ignore_file_pattern=[r'.+\.gguf$'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='google/gemma-7b')),
+        ModelEntry(
+            ModelType.gemma_2b_instruct, 'AI-ModelScope/gemma-2b-it',
+            LoRATM.llama2, TemplateType.gemma,
+            dict(
+                requires=['transformers>=4.38'],
+                ignore_file_pattern=[r'.+\.gguf$'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='google/gemma-2b-it')),
+        ModelEntry(
+            ModelType.gemma_7b_instruct, 'AI-ModelScope/gemma-7b-it',
+            LoRATM.llama2, TemplateType.gemma,
+            dict(
+                requires=['transformers>=4.38'],
+                ignore_file_pattern=[r'.+\.gguf$'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='google/gemma-7b-it')),
+        ModelEntry(
+            ModelType.deepseek_math_7b_instruct,
+            'deepseek-ai/deepseek-math-7b-instruct', LoRATM.llama2,
+            TemplateType.deepseek,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['math'],
+                hf_model_id='deepseek-ai/deepseek-math-7b-instruct')),
+        ModelEntry(
+            ModelType.deepseek_math_7b_chat, 'deepseek-ai/deepseek-math-7b-rl',
+            LoRATM.llama2, TemplateType.deepseek,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['math'],
+                hf_model_id='deepseek-ai/deepseek-math-7b-rl')),
+        ModelEntry(
+            ModelType.deepseek_math_7b, 'deepseek-ai/deepseek-math-7b-base',
+            LoRATM.llama2, TemplateType.default_generation_bos,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['math'],
+                hf_model_id='deepseek-ai/deepseek-math-7b-base')),
+        ModelEntry(
+            ModelType.qwen1half_0_5b, 'qwen/Qwen1.5-0.5B', LoRATM.qwen1half,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/Qwen1.5-0.5B')),
+        ModelEntry(
+            ModelType.qwen1half_1_8b, 'qwen/Qwen1.5-1.8B', LoRATM.qwen1half,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/Qwen1.5-1.8B')),
+        ModelEntry(
+            ModelType.qwen1half_4b, 'qwen/Qwen1.5-4B', LoRATM.qwen1half,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/Qwen1.5-4B')),
+        ModelEntry(
+            ModelType.qwen1half_7b, 'qwen/Qwen1.5-7B', LoRATM.qwen1half,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/Qwen1.5-7B')),
+        ModelEntry(
+            ModelType.qwen1half_14b, 'qwen/Qwen1.5-14B', LoRATM.qwen1half,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/Qwen1.5-14B')),
+        ModelEntry(
+            ModelType.qwen1half_32b, 'qwen/Qwen1.5-32B', LoRATM.qwen1half,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/Qwen1.5-32B')),
+        ModelEntry(
+            ModelType.qwen1half_72b, 'qwen/Qwen1.5-72B', LoRATM.qwen1half,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/Qwen1.5-72B')),
+        ModelEntry(
+            ModelType.codeqwen1half_7b, 'qwen/CodeQwen1.5-7B',
+            LoRATM.qwen1half, TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/CodeQwen1.5-7B')),
+        ModelEntry(
+            ModelType.qwen1half_moe_a2_7b, 'qwen/Qwen1.5-MoE-A2.7B',
+            LoRATM.qwen1half, TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.40'],
+                hf_model_id='Qwen/Qwen1.5-MoE-A2.7B')),
+        ModelEntry(
+            ModelType.deepseek_coder_1_3b,
+            'deepseek-ai/deepseek-coder-1.3b-base', LoRATM.llama2,
+            TemplateType.default_generation_bos,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['coding'],
+                hf_model_id='deepseek-ai/deepseek-coder-1.3b-base')),
+        ModelEntry(
+            ModelType.deepseek_coder_6_7b,
+            'deepseek-ai/deepseek-coder-6.7b-base', LoRATM.llama2,
+            TemplateType.default_generation_bos,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['coding'],
+                hf_model_id='deepseek-ai/deepseek-coder-6.7b-base')),
+        ModelEntry(
+            ModelType.deepseek_coder_33b,
+            'deepseek-ai/deepseek-coder-33b-base', LoRATM.llama2,
+            TemplateType.default_generation_bos,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['coding'],
+                hf_model_id='deepseek-ai/deepseek-coder-33b-base')),
+        ModelEntry(
+            ModelType.deepseek_coder_1_3b_instruct,
+            'deepseek-ai/deepseek-coder-1.3b-instruct', LoRATM.llama2,
+            TemplateType.deepseek_coder,
+            dict(
+                eos_token='<|EOT|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['coding'],
+                hf_model_id='deepseek-ai/deepseek-coder-1.3b-instruct')),
+        ModelEntry(
+            ModelType.deepseek_coder_6_7b_instruct,
+            'deepseek-ai/deepseek-coder-6.7b-instruct', LoRATM.llama2,
+            TemplateType.deepseek_coder,
+            dict(
+                eos_token='<|EOT|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['coding'],
+                hf_model_id='deepseek-ai/deepseek-coder-6.7b-instruct')),
+        ModelEntry(
+            ModelType.deepseek_coder_33b_instruct,
+            'deepseek-ai/deepseek-coder-33b-instruct', LoRATM.llama2,
+            TemplateType.deepseek_coder,
+            dict(
+                eos_token='<|EOT|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['coding'],
+                hf_model_id='deepseek-ai/deepseek-coder-33b-instruct')),
+        ModelEntry(
+            ModelType.openbuddy_deepseek_67b_chat,
+            'OpenBuddy/openbuddy-deepseek-67b-v15.2', LoRATM.llama2,
+            TemplateType.openbuddy,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='OpenBuddy/openbuddy-deepseek-67b-v15.2')),
+        ModelEntry(
+            ModelType.deepseek_67b_chat, 'deepseek-ai/deepseek-llm-67b-chat',
+            LoRATM.llama2, TemplateType.deepseek,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='deepseek-ai/deepseek-llm-67b-chat')),
+        ModelEntry(
+            ModelType.deepseek_67b, 'deepseek-ai/deepseek-llm-67b-base',
+            LoRATM.llama2, TemplateType.default_generation_bos,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='deepseek-ai/deepseek-llm-67b-base')),
+        ModelEntry(
+            ModelType.deepseek_7b_chat, 'deepseek-ai/deepseek-llm-7b-chat',
+            LoRATM.llama2, TemplateType.deepseek,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='deepseek-ai/deepseek-llm-7b-chat')),
+        ModelEntry(
+            ModelType.deepseek_7b, 'deepseek-ai/deepseek-llm-7b-base',
+            LoRATM.llama2, TemplateType.default_generation_bos,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='deepseek-ai/deepseek-llm-7b-base')),
+        ModelEntry(
+            ModelType.sus_34b_chat, 'SUSTC/SUS-Chat-34B', LoRATM.llama2,
+            TemplateType.sus,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='SUSTech/SUS-Chat-34B')),
+        ModelEntry(
+            ModelType.openbuddy_zephyr_7b_chat,
+            'OpenBuddy/openbuddy-zephyr-7b-v14.1', LoRATM.llama2,
+            TemplateType.openbuddy,
+            dict(
+                requires=['transformers>=4.34'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='OpenBuddy/openbuddy-zephyr-7b-v14.1')),
+        ModelEntry(
+            ModelType.zephyr_7b_beta_chat, 'modelscope/zephyr-7b-beta',
+            LoRATM.llama2, TemplateType.zephyr,
+            dict(
+                requires=['transformers>=4.34'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='HuggingFaceH4/zephyr-7b-beta')),
+        ModelEntry(
+            ModelType.yi_6b_chat, '01ai/Yi-6B-Chat', LoRATM.llama2,
+            TemplateType.yi,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='01-ai/Yi-6B-Chat')),
+        ModelEntry(
+            ModelType.yi_6b_chat_awq, '01ai/Yi-6B-Chat-4bits', LoRATM.llama2,
+            TemplateType.yi,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['autoawq'],
+                torch_dtype=torch.float16,
+                function_kwargs={'is_awq': True},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='01-ai/Yi-6B-Chat-4bits')),
+        ModelEntry(
+            ModelType.yi_6b_chat_int8, '01ai/Yi-6B-Chat-8bits', LoRATM.llama2,
+            TemplateType.yi,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 8},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='01-ai/Yi-6B-Chat-8bits')),
+        ModelEntry(
+            ModelType.yi_34b_chat, '01ai/Yi-34B-Chat', LoRATM.llama2,
+            TemplateType.yi,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='01-ai/Yi-34B-Chat')),
+        ModelEntry(
+            ModelType.yi_34b_chat_awq, '01ai/Yi-34B-Chat-4bits', LoRATM.llama2,
+            TemplateType.yi,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['autoawq'],
+                torch_dtype=torch.float16,
+                function_kwargs={'is_awq': True},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='01-ai/Yi-34B-Chat-4bits')),
+        ModelEntry(
+            ModelType.yi_34b_chat_int8, '01ai/Yi-34B-Chat-8bits',
+            LoRATM.llama2, TemplateType.yi,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 8},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='01-ai/Yi-34B-Chat-8bits')),
+        ModelEntry(
+            ModelType.yi_34b_200k, '01ai/Yi-34B-200K', LoRATM.llama2,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='01-ai/Yi-34B-200K')),
+        ModelEntry(
+            ModelType.yi_34b, '01ai/Yi-34B', LoRATM.llama2,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='01-ai/Yi-34B')),
+        ModelEntry(
+            ModelType.yi_6b_200k, '01ai/Yi-6B-200K', LoRATM.llama2,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='01-ai/Yi-6B-200K')),
+        ModelEntry(
+            ModelType.yi_9b, '01ai/Yi-9B', LoRATM.llama2,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='01-ai/Yi-9B')),
+        ModelEntry(
+            ModelType.yi_9b_200k, '01ai/Yi-9B-200K', LoRATM.llama2,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='01-ai/Yi-9B-200K')),
+        ModelEntry(
+            ModelType.yi_6b, '01ai/Yi-6B', LoRATM.llama2,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='01-ai/Yi-6B')),
+        ModelEntry(
+            ModelType.ziya2_13b_chat, 'Fengshenbang/Ziya2-13B-Chat',
+            LoRATM.llama2, TemplateType.ziya,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='IDEA-CCNL/Ziya2-13B-Chat')),
+        ModelEntry(
+            ModelType.ziya2_13b, 'Fengshenbang/Ziya2-13B-Base', LoRATM.llama2,
+            TemplateType.default_generation_bos,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='IDEA-CCNL/Ziya2-13B-Base')),
+        ModelEntry(
+            ModelType.openbuddy_mixtral_moe_7b_chat,
+            'OpenBuddy/openbuddy-mixtral-7bx8-v18.1-32k', LoRATM.llama2,
+            TemplateType.openbuddy,
+            dict(
+                requires=['transformers>=4.36'],
+                support_flash_attn=True,
+                support_vllm=True,
+                support_gradient_checkpointing=False,
+                hf_model_id='OpenBuddy/openbuddy-mixtral-7bx8-v18.1-32k')),
+        ModelEntry(
+            ModelType.openbuddy_mistral_7b_chat,
+            'OpenBuddy/openbuddy-mistral-7b-v17.1-32k', LoRATM.llama2,
+            TemplateType.openbuddy,
+            dict(
+                requires=['transformers>=4.34'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='OpenBuddy/openbuddy-mistral-7b-v17.1-32k')),
+        ModelEntry(
+            ModelType.openbuddy_llama2_70b_chat,
+            'OpenBuddy/openbuddy-llama2-70b-v10.1-bf16', LoRATM.llama2,
+            TemplateType.openbuddy,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='OpenBuddy/openbuddy-llama2-70b-v10.1-bf16')),
+        ModelEntry(
+            ModelType.openbuddy_llama2_65b_chat,
+            'OpenBuddy/openbuddy-llama-65b-v8-bf16', LoRATM.llama2,
+            TemplateType.openbuddy,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='OpenBuddy/openbuddy-llama-65b-v8-bf16')),
+        ModelEntry(
+            ModelType.openbuddy_llama3_8b_chat,
+            'OpenBuddy/openbuddy-llama3-8b-v21.1-8k', LoRATM.llama2,
+            TemplateType.openbuddy2,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='OpenBuddy/openbuddy-llama3-8b-v21.1-8k')),
+        ModelEntry(
+            ModelType.openbuddy_llama2_13b_chat,
+            'OpenBuddy/openbuddy-llama2-13b-v8.1-fp16', LoRATM.llama2,
+            TemplateType.openbuddy,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='OpenBuddy/openbuddy-llama2-13b-v8.1-fp16')),
+        ModelEntry(
+            ModelType.mistral_7b_instruct,
+            'AI-ModelScope/Mistral-7B-Instruct-v0.1', LoRATM.llama2,
+            TemplateType.llama,
+            dict(
+                requires=['transformers>=4.34'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='mistralai/Mistral-7B-Instruct-v0.1')),
+        ModelEntry(
+            ModelType.mistral_7b_instruct_v2,
+            'AI-ModelScope/Mistral-7B-Instruct-v0.2', LoRATM.llama2,
+            TemplateType.llama,
+            dict(
+                requires=['transformers>=4.34'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='mistralai/Mistral-7B-Instruct-v0.2')),
+        ModelEntry(
+            ModelType.mistral_7b, 'AI-ModelScope/Mistral-7B-v0.1',
+            LoRATM.llama2, TemplateType.default_generation_bos,
+            dict(
+                requires=['transformers>=4.34'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='mistralai/Mistral-7B-v0.1')),
+        ModelEntry(
+            ModelType.mistral_7b_v2, 'AI-ModelScope/Mistral-7B-v0.2-hf',
+            LoRATM.llama2, TemplateType.default_generation_bos,
+            dict(
+                requires=['transformers>=4.34'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='alpindale/Mistral-7B-v0.2-hf')),
+        ModelEntry(
+            ModelType.mixtral_moe_7b, 'AI-ModelScope/Mixtral-8x7B-v0.1',
+            LoRATM.llama2, TemplateType.default_generation_bos,
+            dict(
+                requires=['transformers>=4.36'],
+                ignore_file_pattern=[r'.+\.pt$'],
+                support_flash_attn=True,
+                support_vllm=True,
+                support_gradient_checkpointing=False,
+                hf_model_id='mistralai/Mixtral-8x7B-v0.1')),
+        ModelEntry(
+            ModelType.mixtral_moe_7b_instruct,
+            'AI-ModelScope/Mixtral-8x7B-Instruct-v0.1', LoRATM.llama2,
+            TemplateType.llama,
+            dict(
+                requires=['transformers>=4.36'],
+                ignore_file_pattern=[r'.+\.pt$'],
+                support_flash_attn=True,
+                support_vllm=True,
+                support_gradient_checkpointing=False,
+                hf_model_id='mistralai/Mixtral-8x7B-Instruct-v0.1')),
+        ModelEntry(
+            ModelType.mixtral_moe_8x22b_v1, 'AI-ModelScope/Mixtral-8x22B-v0.1',
+            LoRATM.llama2, TemplateType.default_generation_bos,
+            dict(
+                requires=['transformers>=4.36'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='mistral-community/Mixtral-8x22B-v0.1')),
+        ModelEntry(
+            ModelType.dbrx_base, 'AI-ModelScope/dbrx-base', LoRATM.dbrx,
+            TemplateType.dbrx,
+            dict(
+                requires=['transformers>=4.36'],
+                support_flash_attn=True,
+                support_vllm=True,
+                support_gradient_checkpointing=False,
+                hf_model_id='databricks/dbrx-base')),
+        ModelEntry(
+            ModelType.dbrx_instruct, 'AI-ModelScope/dbrx-instruct',
+            LoRATM.dbrx, TemplateType.dbrx,
+            dict(
+                requires=['transformers>=4.36'],
+                support_flash_attn=True,
+                support_vllm=True,
+                support_gradient_checkpointing=False,
+                hf_model_id='databricks/dbrx-instruct')),
+    )
+
+
+class _Qwen1halfModels(ModelFamily):
+    get_function = get_model_tokenizer_with_flash_attn
+    entries = (
+        ModelEntry(
+            ModelType.qwen1half_0_5b_chat_awq, 'qwen/Qwen1.5-0.5B-Chat-AWQ',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                function_kwargs={'is_awq': True},
+                requires=['transformers>=4.37', 'autoawq'],
+                torch_dtype=torch.float16,
+                hf_model_id='Qwen/Qwen1.5-0.5B-Chat-AWQ')),
+        ModelEntry(
+            ModelType.qwen1half_1_8b_chat_awq, 'qwen/Qwen1.5-1.8B-Chat-AWQ',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                function_kwargs={'is_awq': True},
+                requires=['transformers>=4.37', 'autoawq'],
+                torch_dtype=torch.float16,
+                hf_model_id='Qwen/Qwen1.5-1.8B-Chat-AWQ')),
+        ModelEntry(
+            ModelType.qwen1half_4b_chat_awq, 'qwen/Qwen1.5-4B-Chat-AWQ',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                function_kwargs={'is_awq': True},
+                requires=['transformers>=4.37', 'autoawq'],
+                torch_dtype=torch.float16,
+                hf_model_id='Qwen/Qwen1.5-4B-Chat-AWQ')),
+        ModelEntry(
+            ModelType.qwen1half_7b_chat_awq, 'qwen/Qwen1.5-7B-Chat-AWQ',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                function_kwargs={'is_awq': True},
+                requires=['transformers>=4.37', 'autoawq'],
+                torch_dtype=torch.float16,
+                hf_model_id='Qwen/Qwen1.5-7B-Chat-AWQ')),
+        ModelEntry(
+            ModelType.qwen1half_14b_chat_awq, 'qwen/Qwen1.5-14B-Chat-AWQ',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                function_kwargs={'is_awq': True},
+                requires=['transformers>=4.37', 'autoawq'],
+                torch_dtype=torch.float16,
+                hf_model_id='Qwen/Qwen1.5-14B-Chat-AWQ')),
+        ModelEntry(
+            ModelType.qwen1half_32b_chat_awq, 'qwen/Qwen1.5-32B-Chat-AWQ',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                function_kwargs={'is_awq': True},
+                requires=['transformers>=4.37', 'autoawq'],
+                torch_dtype=torch.float16,
+                hf_model_id='Qwen/Qwen1.5-32B-Chat-AWQ')),
+        ModelEntry(
+            ModelType.qwen1half_72b_chat_awq, 'qwen/Qwen1.5-72B-Chat-AWQ',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                function_kwargs={'is_awq': True},
+                requires=['transformers>=4.37', 'autoawq'],
+                torch_dtype=torch.float16,
+                hf_model_id='Qwen/Qwen1.5-72B-Chat-AWQ')),
+        ModelEntry(
+            ModelType.codeqwen1half_7b_chat_awq,
+            'qwen/CodeQwen1.5-7B-Chat-AWQ', LoRATM.qwen1half,
+            TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                function_kwargs={'is_awq': True},
+                requires=['transformers>=4.37', 'autoawq'],
+                torch_dtype=torch.float16,
+                hf_model_id='Qwen/CodeQwen1.5-7B-Chat-AWQ')),
+        ModelEntry(
+            ModelType.qwen1half_0_5b_chat, 'qwen/Qwen1.5-0.5B-Chat',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/Qwen1.5-0.5B-Chat')),
+        ModelEntry(
+            ModelType.qwen1half_1_8b_chat, 'qwen/Qwen1.5-1.8B-Chat',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/Qwen1.5-1.8B-Chat')),
+        ModelEntry(
+            ModelType.qwen1half_4b_chat, 'qwen/Qwen1.5-4B-Chat',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/Qwen1.5-4B-Chat')),
+        ModelEntry(
+            ModelType.qwen1half_7b_chat, 'qwen/Qwen1.5-7B-Chat',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/Qwen1.5-7B-Chat')),
+        ModelEntry(
+            ModelType.qwen1half_14b_chat, 'qwen/Qwen1.5-14B-Chat',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/Qwen1.5-14B-Chat')),
+        ModelEntry(
+            ModelType.qwen1half_32b_chat, 'qwen/Qwen1.5-32B-Chat',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/Qwen1.5-32B-Chat')),
+        ModelEntry(
+            ModelType.qwen1half_72b_chat, 'qwen/Qwen1.5-72B-Chat',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/Qwen1.5-72B-Chat')),
+        ModelEntry(
+            ModelType.qwen1half_moe_a2_7b_chat, 'qwen/Qwen1.5-MoE-A2.7B-Chat',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.40'],
+                hf_model_id='Qwen/Qwen1.5-MoE-A2.7B-Chat')),
+        ModelEntry(
+            ModelType.codeqwen1half_7b_chat, 'qwen/CodeQwen1.5-7B-Chat',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                support_vllm=True,
+                requires=['transformers>=4.37'],
+                hf_model_id='Qwen/CodeQwen1.5-7B-Chat')),
+    )
+
+
+class _Qwen1halfIntxModels(ModelFamily):
+    get_function = get_model_tokenizer_with_flash_attn
+    entries = (
+        ModelEntry(
+            ModelType.qwen1half_0_5b_chat_int4,
+            'qwen/Qwen1.5-0.5B-Chat-GPTQ-Int4', LoRATM.qwen1half,
+            TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq>=0.5', 'transformers>=4.37'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 4},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen1.5-0.5B-Chat-GPTQ-Int4')),
+        ModelEntry(
+            ModelType.qwen1half_0_5b_chat_int8,
+            'qwen/Qwen1.5-0.5B-Chat-GPTQ-Int8', LoRATM.qwen1half,
+            TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq>=0.5', 'transformers>=4.37'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 8},
+                support_flash_attn=True,
+                hf_model_id='Qwen/Qwen1.5-0.5B-Chat-GPTQ-Int8')),
+        ModelEntry(
+            ModelType.qwen1half_1_8b_chat_int4,
+            'qwen/Qwen1.5-1.8B-Chat-GPTQ-Int4', LoRATM.qwen1half,
+            TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq>=0.5', 'transformers>=4.37'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 4},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen1.5-1.8B-Chat-GPTQ-Int4')),
+        ModelEntry(
+            ModelType.qwen1half_1_8b_chat_int8,
+            'qwen/Qwen1.5-1.8B-Chat-GPTQ-Int8', LoRATM.qwen1half,
+            TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq>=0.5', 'transformers>=4.37'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 8},
+                support_flash_attn=True,
+                hf_model_id='Qwen/Qwen1.5-1.8B-Chat-GPTQ-Int8')),
+        ModelEntry(
+            ModelType.qwen1half_4b_chat_int4, 'qwen/Qwen1.5-4B-Chat-GPTQ-Int4',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq>=0.5', 'transformers>=4.37'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 4},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen1.5-4B-Chat-GPTQ-Int4')),
+        ModelEntry(
+            ModelType.qwen1half_4b_chat_int8, 'qwen/Qwen1.5-4B-Chat-GPTQ-Int8',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq>=0.5', 'transformers>=4.37'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 8},
+                support_flash_attn=True,
+                hf_model_id='Qwen/Qwen1.5-4B-Chat-GPTQ-Int8')),
+        ModelEntry(
+            ModelType.qwen1half_7b_chat_int4, 'qwen/Qwen1.5-7B-Chat-GPTQ-Int4',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq>=0.5', 'transformers>=4.37'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 4},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen1.5-7B-Chat-GPTQ-Int4')),
+        ModelEntry(
+            ModelType.qwen1half_7b_chat_int8, 'qwen/Qwen1.5-7B-Chat-GPTQ-Int8',
+            LoRATM.qwen1half, TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq>=0.5', 'transformers>=4.37'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 8},
+                support_flash_attn=True,
+                hf_model_id='Qwen/Qwen1.5-7B-Chat-GPTQ-Int8')),
+        ModelEntry(
+            ModelType.qwen1half_14b_chat_int4,
+            'qwen/Qwen1.5-14B-Chat-GPTQ-Int4', LoRATM.qwen1half,
+            TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq>=0.5', 'transformers>=4.37'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 4},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen1.5-14B-Chat-GPTQ-Int4')),
+        ModelEntry(
+            ModelType.qwen1half_14b_chat_int8,
+            'qwen/Qwen1.5-14B-Chat-GPTQ-Int8', LoRATM.qwen1half,
+            TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq>=0.5', 'transformers>=4.37'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 8},
+                support_flash_attn=True,
+                hf_model_id='Qwen/Qwen1.5-14B-Chat-GPTQ-Int8')),
+        ModelEntry(
+            ModelType.qwen1half_32b_chat_int4,
+            'qwen/Qwen1.5-32B-Chat-GPTQ-Int4', LoRATM.qwen1half,
+            TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq>=0.5', 'transformers>=4.37'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 4},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen1.5-32B-Chat-GPTQ-Int4')),
+        ModelEntry(
+            ModelType.qwen1half_72b_chat_int4,
+            'qwen/Qwen1.5-72B-Chat-GPTQ-Int4', LoRATM.qwen1half,
+            TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq>=0.5', 'transformers>=4.37'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 4},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen1.5-72B-Chat-GPTQ-Int4')),
+        ModelEntry(
+            ModelType.qwen1half_72b_chat_int8,
+            'qwen/Qwen1.5-72B-Chat-GPTQ-Int8', LoRATM.qwen1half,
+            TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq>=0.5', 'transformers>=4.37'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 8},
+                support_flash_attn=True,
+                hf_model_id='Qwen/Qwen1.5-72B-Chat-GPTQ-Int8')),
+        ModelEntry(
+            ModelType.qwen1half_moe_a2_7b_chat_int4,
+            'qwen/Qwen1.5-MoE-A2.7B-Chat-GPTQ-Int4', LoRATM.qwen1half,
+            TemplateType.qwen,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['auto_gptq>=0.5', 'transformers>=4.40'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 4},
+                support_flash_attn=True,
+                hf_model_id='Qwen/Qwen1.5-MoE-A2.7B-Chat-GPTQ-Int4')),
+    )
 
 
-@register_model(
-    ModelType.internlm2_1_8b,
-    'Shanghai_AI_Laboratory/internlm2-1_8b',
-    LoRATM.internlm2,
-    TemplateType.default_generation_bos,
-    requires=['transformers>=4.35'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='internlm/internlm2-1_8b')
-@register_model(
-    ModelType.internlm2_1_8b_sft_chat,
-    'Shanghai_AI_Laboratory/internlm2-chat-1_8b-sft',
-    LoRATM.internlm2,
-    TemplateType.internlm2,
-    eos_token='<|im_end|>',
-    requires=['transformers>=4.35'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='internlm/internlm2-chat-1_8b-sft')
-@register_model(
-    ModelType.internlm2_1_8b_chat,
-    'Shanghai_AI_Laboratory/internlm2-chat-1_8b',
-    LoRATM.internlm2,
-    TemplateType.internlm2,
-    eos_token='<|im_end|>',
-    requires=['transformers>=4.35'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='internlm/internlm2-chat-1_8b')
-@register_model(
-    ModelType.internlm2_math_7b,
-    'Shanghai_AI_Laboratory/internlm2-math-base-7b',
-    LoRATM.internlm2,
-    TemplateType.default_generation_bos,
-    requires=['transformers>=4.35'],
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['math'],
-    hf_model_id='internlm/internlm2-math-base-7b')
-@register_model(
-    ModelType.internlm2_math_20b,
-    'Shanghai_AI_Laboratory/internlm2-math-base-20b',
-    LoRATM.internlm2,
-    TemplateType.default_generation_bos,
-    requires=['transformers>=4.35'],
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['math'],
-    hf_model_id='internlm/internlm2-math-base-20b')
-@register_model(
-    ModelType.internlm2_math_7b_chat,
-    'Shanghai_AI_Laboratory/internlm2-math-7b',
-    LoRATM.internlm2,
-    TemplateType.internlm2,
-    eos_token='<|im_end|>',
-    requires=['transformers>=4.35'],
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['math'],
-    hf_model_id='internlm/internlm2-math-7b')
-@register_model(
-    ModelType.internlm2_math_20b_chat,
-    'Shanghai_AI_Laboratory/internlm2-math-20b',
-    LoRATM.internlm2,
-    TemplateType.internlm2,
-    eos_token='<|im_end|>',
-    requires=['transformers>=4.35'],
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['math'],
-    hf_model_id='internlm/internlm2-math-20b')
-@register_model(
-    ModelType.internlm2_7b_sft_chat,
-    'Shanghai_AI_Laboratory/internlm2-chat-7b-sft',
-    LoRATM.internlm2,
-    TemplateType.internlm2,
-    eos_token='<|im_end|>',
-    requires=['transformers>=4.35'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='internlm/internlm2-chat-7b-sft')
-@register_model(
-    ModelType.internlm2_7b_chat,
-    'Shanghai_AI_Laboratory/internlm2-chat-7b',
-    LoRATM.internlm2,
-    TemplateType.internlm2,
-    eos_token='<|im_end|>',
-    requires=['transformers>=4.35'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='internlm/internlm2-chat-7b')
-@register_model(
-    ModelType.internlm2_20b_sft_chat,
-    'Shanghai_AI_Laboratory/internlm2-chat-20b-sft',
-    LoRATM.internlm2,
-    TemplateType.internlm2,
-    eos_token='<|im_end|>',
-    requires=['transformers>=4.35'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='internlm/internlm2-chat-20b-sft')
-@register_model(
-    ModelType.internlm2_20b_chat,
-    'Shanghai_AI_Laboratory/internlm2-chat-20b',
-    LoRATM.internlm2,
-    TemplateType.internlm2,
-    eos_token='<|im_end|>',
-    requires=['transformers>=4.35'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='internlm/internlm2-chat-20b')
-@register_model(
-    ModelType.internlm2_7b,
-    'Shanghai_AI_Laboratory/internlm2-7b',
-    LoRATM.internlm2,
-    TemplateType.default_generation_bos,
-    requires=['transformers>=4.35'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='internlm/internlm2-7b')
-@register_model(
-    ModelType.internlm2_7b_base,
-    'Shanghai_AI_Laboratory/internlm2-base-7b',
-    LoRATM.internlm2,
-    TemplateType.default_generation_bos,
-    requires=['transformers>=4.35'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='internlm/internlm2-base-7b')
-@register_model(
-    ModelType.internlm2_20b,
-    'Shanghai_AI_Laboratory/internlm2-20b',
-    LoRATM.internlm2,
-    TemplateType.default_generation_bos,
-    requires=['transformers>=4.35'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='internlm/internlm2-20b')
-@register_model(
-    ModelType.internlm2_20b_base,
-    'Shanghai_AI_Laboratory/internlm2-base-20b',
-    LoRATM.internlm2,
-    TemplateType.default_generation_bos,
-    requires=['transformers>=4.35'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='internlm/internlm2-base-20b')
 def get_model_tokenizer_internlm2(model_dir: str,
                                   torch_dtype: Dtype,
                                   model_kwargs: Dict[str, Any],
                                   load_model: bool = True,
                                   **kwargs):
-    model_config = AutoConfig.from_pretrained(
-        model_dir, trust_remote_code=True)
+    model_config = _get_cached_config(model_dir)
     use_flash_attn = kwargs.pop('use_flash_attn', False)
     if use_flash_attn:
         model_config.attn_implementation = 'flash_attention_2'
@@ -2360,29 +2607,167 @@ def get_model_tokenizer_internlm2(model_dir: str,
         model_config=model_config,
         **kwargs)
     if eos_token is not None:
-        if getattr(tokenizer.__class__.eos_token_id, 'fset', None) is None:
-            del tokenizer.__class__.eos_token_id
-        tokenizer.eos_token = eos_token
+        _set_eos_token(tokenizer, eos_token)
 
     return model, tokenizer
 
 
-@register_model(
-    ModelType.internlm_xcomposer2_7b_chat,
-    'Shanghai_AI_Laboratory/internlm-xcomposer2-7b',
-    LoRATM.internlm2,
-    TemplateType.internlm_xcomposer2,
-    eos_token='[UNUSED_TOKEN_145]',
-    support_flash_attn=True,
-    tags=['multi-modal', 'vision'],
-    hf_model_id='internlm/internlm-xcomposer2-7b')
+class _InternLM2Models(ModelFamily):
+    get_function = get_model_tokenizer_internlm2
+    entries = (
+        ModelEntry(
+            ModelType.internlm2_1_8b, 'Shanghai_AI_Laboratory/internlm2-1_8b',
+            LoRATM.internlm2, TemplateType.default_generation_bos,
+            dict(
+                requires=['transformers>=4.35'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='internlm/internlm2-1_8b')),
+        ModelEntry(
+            ModelType.internlm2_1_8b_sft_chat,
+            'Shanghai_AI_Laboratory/internlm2-chat-1_8b-sft', LoRATM.internlm2,
+            TemplateType.internlm2,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['transformers>=4.35'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='internlm/internlm2-chat-1_8b-sft')),
+        ModelEntry(
+            ModelType.internlm2_1_8b_chat,
+            'Shanghai_AI_Laboratory/internlm2-chat-1_8b', LoRATM.internlm2,
+            TemplateType.internlm2,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['transformers>=4.35'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='internlm/internlm2-chat-1_8b')),
+        ModelEntry(
+            ModelType.internlm2_math_7b,
+            'Shanghai_AI_Laboratory/internlm2-math-base-7b', LoRATM.internlm2,
+            TemplateType.default_generation_bos,
+            dict(
+                requires=['transformers>=4.35'],
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['math'],
+                hf_model_id='internlm/internlm2-math-base-7b')),
+        ModelEntry(
+            ModelType.internlm2_math_20b,
+            'Shanghai_AI_Laboratory/internlm2-math-base-20b', LoRATM.internlm2,
+            TemplateType.default_generation_bos,
+            dict(
+                requires=['transformers>=4.35'],
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['math'],
+                hf_model_id='internlm/internlm2-math-base-20b')),
+        ModelEntry(
+            ModelType.internlm2_math_7b_chat,
+            'Shanghai_AI_Laboratory/internlm2-math-7b', LoRATM.internlm2,
+            TemplateType.internlm2,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['transformers>=4.35'],
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['math'],
+                hf_model_id='internlm/internlm2-math-7b')),
+        ModelEntry(
+            ModelType.internlm2_math_20b_chat,
+            'Shanghai_AI_Laboratory/internlm2-math-20b', LoRATM.internlm2,
+            TemplateType.internlm2,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['transformers>=4.35'],
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['math'],
+                hf_model_id='internlm/internlm2-math-20b')),
+        ModelEntry(
+            ModelType.internlm2_7b_sft_chat,
+            'Shanghai_AI_Laboratory/internlm2-chat-7b-sft', LoRATM.internlm2,
+            TemplateType.internlm2,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['transformers>=4.35'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='internlm/internlm2-chat-7b-sft')),
+        ModelEntry(
+            ModelType.internlm2_7b_chat,
+            'Shanghai_AI_Laboratory/internlm2-chat-7b', LoRATM.internlm2,
+            TemplateType.internlm2,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['transformers>=4.35'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='internlm/internlm2-chat-7b')),
+        ModelEntry(
+            ModelType.internlm2_20b_sft_chat,
+            'Shanghai_AI_Laboratory/internlm2-chat-20b-sft', LoRATM.internlm2,
+            TemplateType.internlm2,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['transformers>=4.35'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='internlm/internlm2-chat-20b-sft')),
+        ModelEntry(
+            ModelType.internlm2_20b_chat,
+            'Shanghai_AI_Laboratory/internlm2-chat-20b', LoRATM.internlm2,
+            TemplateType.internlm2,
+            dict(
+                eos_token='<|im_end|>',
+                requires=['transformers>=4.35'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='internlm/internlm2-chat-20b')),
+        ModelEntry(
+            ModelType.internlm2_7b, 'Shanghai_AI_Laboratory/internlm2-7b',
+            LoRATM.internlm2, TemplateType.default_generation_bos,
+            dict(
+                requires=['transformers>=4.35'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='internlm/internlm2-7b')),
+        ModelEntry(
+            ModelType.internlm2_7b_base,
+            'Shanghai_AI_Laboratory/internlm2-base-7b', LoRATM.internlm2,
+            TemplateType.default_generation_bos,
+            dict(
+                requires=['transformers>=4.35'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='internlm/internlm2-base-7b')),
+        ModelEntry(
+            ModelType.internlm2_20b, 'Shanghai_AI_Laboratory/internlm2-20b',
+            LoRATM.internlm2, TemplateType.default_generation_bos,
+            dict(
+                requires=['transformers>=4.35'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='internlm/internlm2-20b')),
+        ModelEntry(
+            ModelType.internlm2_20b_base,
+            'Shanghai_AI_Laboratory/internlm2-base-20b', LoRATM.internlm2,
+            TemplateType.default_generation_bos,
+            dict(
+                requires=['transformers>=4.35'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='internlm/internlm2-base-20b')),
+    )
+
+
 def get_model_tokenizer_internlm_xcomposer2(model_dir: str,
                                             torch_dtype: Dtype,
                                             model_kwargs: Dict[str, Any],
                                             load_model: bool = True,
                                             **kwargs):
-    model_config = AutoConfig.from_pretrained(
-        model_dir, trust_remote_code=True)
+    model_config = _get_cached_config(model_dir)
     use_flash_attn = kwargs.pop('use_flash_attn', False)
     model_config._flash_attn_2_enabled = use_flash_attn
 
@@ -2395,17 +2780,37 @@ def get_model_tokenizer_internlm_xcomposer2(model_dir: str,
         model_config=model_config,
         **kwargs)
     if eos_token is not None:
-        if getattr(tokenizer.__class__.eos_token_id, 'fset', None) is None:
-            del tokenizer.__class__.eos_token_id
-        tokenizer.eos_token = eos_token
+        _set_eos_token(tokenizer, eos_token)
     if model is not None and use_flash_attn:
         # fix AttributeError: no attribute 'attention_dropout'
         model.model.layers[0].attention.__class__.attention_dropout = 0.
     return model, tokenizer
 
 
+class _XComposer2Models(ModelFamily):
+    get_function = get_model_tokenizer_internlm_xcomposer2
+    entries = (ModelEntry(
+        ModelType.internlm_xcomposer2_7b_chat,
+        'Shanghai_AI_Laboratory/internlm-xcomposer2-7b', LoRATM.internlm2,
+        TemplateType.internlm_xcomposer2,
+        dict(
+            eos_token='[UNUSED_TOKEN_145]',
+            support_flash_attn=True,
+            tags=['multi-modal', 'vision'],
+            hf_model_id='internlm/internlm-xcomposer2-7b')), )
+
+
+# (github_url, local_repo_name) -> local_repo_path
+_CLONED_GITHUB_REPOS: Dict[Tuple[str, Optional[str]], str] = {}
+
+
 def _git_clone_github(github_url: str,
                       local_repo_name: Optional[str] = None) -> str:
+    key = (github_url, local_repo_name)
+    local_repo_path = _CLONED_GITHUB_REPOS.get(key)
+    if local_repo_path is not None:
+        return local_repo_path
+    from modelscope.hub.utils.utils import get_cache_dir
     git_cache_dir = os.path.join(get_cache_dir(), '_github')
     os.makedirs(git_cache_dir, exist_ok=True)
     if local_repo_name is None:
@@ -2416,14 +2821,16 @@ def _git_clone_github(github_url: str,
         if not os.path.exists(local_repo_path):
             if not github_url.endswith('.git'):
                 github_url = f'{github_url}.git'
+            # the history is not needed at runtime
             command = [
-                'git', '-C', git_cache_dir, 'clone', github_url,
+                'git', '-C', git_cache_dir, 'clone', '--depth=1', github_url,
                 local_repo_name
             ]
-            command_str = f"git -C '{git_cache_dir}' clone '{github_url}' {local_repo_name}"
+            command_str = f"git -C '{git_cache_dir}' clone --depth=1 '{github_url}' {local_repo_name}"
             logger.info(f'Run the command: `{command_str}`')
             subprocess_run(command)
         logger.info(f'local_repo_path: {local_repo_path}')
+    _CLONED_GITHUB_REPOS[key] = local_repo_path
     return local_repo_path
 
 
@@ -2436,24 +2843,27 @@ def __prepare_inputs_embeds(
     **kwargs,
 ):
     # for patching deepseek-vl
-    from einops import rearrange
+    if pixel_values.numel() == 0:  # text-only batch
+        input_ids.clamp_(min=0)
+        return self.language_model.get_input_embeddings()(input_ids)
     bs, n = pixel_values.shape[0:2]
-    images = rearrange(pixel_values, 'b n c h w -> (b n) c h w')
+    # [b, n, C, H, W] -> [b x n, C, H, W]
+    images = pixel_values.reshape(bs * n, *pixel_values.shape[2:])
     # [b x n, T2, D]
     images_embeds = self.aligner(self.vision_model(images))
 
     # [b x n, T2, D] -> [b, n x T2, D]
-    images_embeds = rearrange(
-        images_embeds, '(b n) t d -> b (n t) d', b=bs, n=n)
+    images_embeds = images_embeds.reshape(bs, -1, images_embeds.shape[-1])
     # [b, n, T2] -> [b, n x T2]
-    images_emb_mask = rearrange(images_emb_mask, 'b n t -> b (n t)')
+    images_emb_mask = images_emb_mask.reshape(bs, -1)
 
     # [b, T, D]
-    input_ids[input_ids < 0] = 0  # ignore the image embeddings
+    input_ids.clamp_(min=0)  # ignore the image embeddings
     inputs_embeds = self.language_model.get_input_embeddings()(input_ids)
 
     # replace with the image embeddings (FIX)
-    inputs_embeds.data[images_seq_mask] = images_embeds[images_emb_mask]
+    inputs_embeds.data.masked_scatter_(
+        images_seq_mask.unsqueeze(-1), images_embeds[images_emb_mask])
 
     return inputs_embeds
 
@@ -2461,22 +2871,19 @@ def __prepare_inputs_embeds(
 def _use_submodel_func(model, submodel_name: str,
                        func_list: List[str]) -> None:
     submodel = getattr(model, submodel_name)
+    # the bound methods of the submodel, without a pass-through wrapper
+    for key in func_list:
+        setattr(model, key, getattr(submodel, key))
 
-    def _get_new_func(func_name: str):
-        _old_func = getattr(submodel, func_name)
-
-        @wraps(_old_func)
-        def _new_func(*args, **kwargs):
-            return _old_func(*args, **kwargs)
-
-        return _new_func
 
-    for key in func_list:
-        setattr(model, key, _get_new_func(key))
+_PATCHED_DEEPSEEK_VL_CLASSES: 'WeakSet[Type]' = WeakSet()
 
 
 def _patch_deepseek_vl(model) -> None:
-    model.prepare_inputs_embeds = MethodType(__prepare_inputs_embeds, model)
+    model_cls = model.__class__
+    if model_cls not in _PATCHED_DEEPSEEK_VL_CLASSES:
+        model_cls.prepare_inputs_embeds = __prepare_inputs_embeds
+        _PATCHED_DEEPSEEK_VL_CLASSES.add(model_cls)
     func_list = [
         'generate', 'get_input_embeddings', 'gradient_checkpointing_enable',
         'forward'
@@ -2485,49 +2892,35 @@ def _patch_deepseek_vl(model) -> None:
     model.generation_config = model.language_model.generation_config
 
 
-@register_model(
-    ModelType.deepseek_vl_7b_chat,
-    'deepseek-ai/deepseek-vl-7b-chat',
-    LoRATM.llama2,
-    TemplateType.deepseek_vl,
-    support_flash_attn=True,
-    tags=['multi-modal', 'vision'],
-    hf_model_id='deepseek-ai/deepseek-vl-7b-chat')
-@register_model(
-    ModelType.deepseek_vl_1_3b_chat,
-    'deepseek-ai/deepseek-vl-1.3b-chat',
-    LoRATM.llama2,
-    TemplateType.deepseek_vl,
-    support_flash_attn=True,
-    tags=['multi-modal', 'vision'],
-    hf_model_id='deepseek-ai/deepseek-vl-1.3b-chat')
+@lru_cache()
+def _patch_collections_abc() -> None:
+    # compat with python==3.10: the deepseek-vl code uses `collections.Xxx`
+    if sys.version_info.minor >= 10:
+        import collections
+        import collections.abc
+        vars(collections).update({
+            type_name: getattr(collections.abc, type_name)
+            for type_name in collections.abc.__all__
+        })
+
+
 def get_model_tokenizer_deepseek_vl(model_dir: str,
                                     torch_dtype: Dtype,
                                     model_kwargs: Dict[str, Any],
                                     load_model: bool = True,
                                     **kwargs):
-    # compat with python==3.10
-    if sys.version_info.minor >= 10:
-        import collections
-        import collections.abc
-        for type_name in collections.abc.__all__:
-            setattr(collections, type_name, getattr(collections.abc,
-                                                    type_name))
+    _patch_collections_abc()
     local_repo_path = _git_clone_github(
         'https://github.com/deepseek-ai/DeepSeek-VL')
-    sys.path.append(os.path.join(local_repo_path))
+    if local_repo_path not in sys.path:
+        sys.path.append(local_repo_path)
     from deepseek_vl.models import VLChatProcessor, MultiModalityCausalLM
     vl_chat_processor = VLChatProcessor.from_pretrained(model_dir)
     tokenizer = vl_chat_processor.tokenizer
     # flash_attn
-    model_config = AutoConfig.from_pretrained(
-        model_dir, trust_remote_code=True)
-    use_flash_attn = kwargs.pop('use_flash_attn', False)
-    if version.parse(transformers.__version__) >= version.parse('4.36'):
-        if use_flash_attn:
-            model_config.language_config._attn_implementation = 'flash_attention_2'
-    else:
-        model_config.language_config._flash_attn_2_enabled = use_flash_attn
+    model_config = _get_cached_config(model_dir)
+    _set_flash_attn(model_config.language_config,
+                    kwargs.pop('use_flash_attn', False))
     model, tokenizer = get_model_tokenizer_from_repo(
         model_dir,
         torch_dtype,
@@ -2542,187 +2935,33 @@ def get_model_tokenizer_deepseek_vl(model_dir: str,
     return model, tokenizer
 
 
-@register_model(
-    ModelType.llama3_70b_instruct_awq,
-    'huangjintao/Meta-Llama-3-70B-Instruct-AWQ',
-    LoRATM.llama2,
-    TemplateType.llama3,
-    requires=['autoawq'],
-    torch_dtype=torch.float16,
-    function_kwargs={'is_awq': True},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='study-hjt/Meta-Llama-3-70B-Instruct-AWQ')
-@register_model(
-    ModelType.llama3_70b_instruct_int8,
-    'huangjintao/Meta-Llama-3-70b-Instruct-GPTQ-Int8',
-    LoRATM.llama2,
-    TemplateType.llama3,
-    requires=['auto_gptq'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 8},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='study-hjt/Meta-Llama-3-70B-Instruct-GPTQ-Int8')
-@register_model(
-    ModelType.llama3_70b_instruct_int4,
-    'huangjintao/Meta-Llama-3-70B-Instruct-GPTQ-Int4',
-    LoRATM.llama2,
-    TemplateType.llama3,
-    requires=['auto_gptq'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 4},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='study-hjt/Meta-Llama-3-70B-Instruct-GPTQ-Int4')
-@register_model(
-    ModelType.llama3_8b_instruct_awq,
-    'huangjintao/Meta-Llama-3-8B-Instruct-AWQ',
-    LoRATM.llama2,
-    TemplateType.llama3,
-    requires=['autoawq'],
-    torch_dtype=torch.float16,
-    function_kwargs={'is_awq': True},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='study-hjt/Meta-Llama-3-8B-Instruct-AWQ')
-@register_model(
-    ModelType.llama3_8b_instruct_int8,
-    'huangjintao/Meta-Llama-3-8B-Instruct-GPTQ-Int8',
-    LoRATM.llama2,
-    TemplateType.llama3,
-    requires=['auto_gptq'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 8},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='study-hjt/Meta-Llama-3-8B-Instruct-GPTQ-Int8')
-@register_model(
-    ModelType.llama3_8b_instruct_int4,
-    'huangjintao/Meta-Llama-3-8B-Instruct-GPTQ-Int4',
-    LoRATM.llama2,
-    TemplateType.llama3,
-    requires=['auto_gptq'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 4},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='study-hjt/Meta-Llama-3-8B-Instruct-GPTQ-Int4')
-@register_model(
-    ModelType.llama3_70b_instruct,
-    'LLM-Research/Meta-Llama-3-70B-Instruct',
-    LoRATM.llama2,
-    TemplateType.llama3,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='meta-llama/Meta-Llama-3-70B-Instruct')
-@register_model(
-    ModelType.llama3_70b,
-    'LLM-Research/Meta-Llama-3-70B',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='meta-llama/Meta-Llama-3-70B')
-@register_model(
-    ModelType.llama3_8b_instruct,
-    'LLM-Research/Meta-Llama-3-8B-Instruct',
-    LoRATM.llama2,
-    TemplateType.llama3,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='meta-llama/Meta-Llama-3-8B-Instruct')
-@register_model(
-    ModelType.llama3_8b,
-    'LLM-Research/Meta-Llama-3-8B',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='meta-llama/Meta-Llama-3-8B')
-@register_model(
-    ModelType.llama2_7b_aqlm_2bit_1x16,
-    'AI-ModelScope/Llama-2-7b-AQLM-2Bit-1x16-hf',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    ignore_file_pattern=[r'.+\.bin$'],
-    support_flash_attn=True,
-    requires=['transformers>=4.38', 'aqlm', 'torch>=2.2.0'],
-    support_vllm=False,
-    function_kwargs={'is_aqlm': True},
-    hf_model_id='ISTA-DASLab/Llama-2-7b-AQLM-2Bit-1x16-hf')
-@register_model(
-    ModelType.mixtral_moe_7b_aqlm_2bit_1x16,
-    'AI-ModelScope/Mixtral-8x7b-AQLM-2Bit-1x16-hf',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    requires=['transformers>=4.38', 'aqlm', 'torch>=2.2.0'],
-    support_flash_attn=True,
-    support_vllm=False,
-    support_gradient_checkpointing=False,
-    function_kwargs={'is_aqlm': True},
-    hf_model_id='ISTA-DASLab/Mixtral-8x7b-AQLM-2Bit-1x16-hf')
-@register_model(
-    ModelType.llama2_7b,
-    'modelscope/Llama-2-7b-ms',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    ignore_file_pattern=[r'.+\.bin$'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='meta-llama/Llama-2-7b-hf')
-@register_model(
-    ModelType.llama2_13b,
-    'modelscope/Llama-2-13b-ms',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    ignore_file_pattern=[r'.+\.bin$'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='meta-llama/Llama-2-13b-hf')
-@register_model(
-    ModelType.llama2_70b,
-    'modelscope/Llama-2-70b-ms',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    ignore_file_pattern=[r'.+\.bin$'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='meta-llama/Llama-2-70b-hf')
-@register_model(
-    ModelType.llama2_7b_chat,
-    'modelscope/Llama-2-7b-chat-ms',
-    LoRATM.llama2,
-    TemplateType.llama,
-    ignore_file_pattern=[r'.+\.bin$'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='meta-llama/Llama-2-7b-chat-hf')
-@register_model(
-    ModelType.llama2_13b_chat,
-    'modelscope/Llama-2-13b-chat-ms',
-    LoRATM.llama2,
-    TemplateType.llama,
-    ignore_file_pattern=[r'.+\.bin$'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='meta-llama/Llama-2-13b-chat-hf')
-@register_model(
-    ModelType.llama2_70b_chat,
-    'modelscope/Llama-2-70b-chat-ms',
-    LoRATM.llama2,
-    TemplateType.llama,
-    ignore_file_pattern=[r'.+\.bin$'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='meta-llama/Llama-2-70b-chat-hf')
+class _DeepseekVLModels(ModelFamily):
+    get_function = get_model_tokenizer_deepseek_vl
+    entries = (
+        ModelEntry(
+            ModelType.deepseek_vl_7b_chat, 'deepseek-ai/deepseek-vl-7b-chat',
+            LoRATM.llama2, TemplateType.deepseek_vl,
+            dict(
+                support_flash_attn=True,
+                tags=['multi-modal', 'vision'],
+                hf_model_id='deepseek-ai/deepseek-vl-7b-chat')),
+        ModelEntry(
+            ModelType.deepseek_vl_1_3b_chat,
+            'deepseek-ai/deepseek-vl-1.3b-chat', LoRATM.llama2,
+            TemplateType.deepseek_vl,
+            dict(
+                support_flash_attn=True,
+                tags=['multi-modal', 'vision'],
+                hf_model_id='deepseek-ai/deepseek-vl-1.3b-chat')),
+    )
+
+
 def get_model_tokenizer_llama2(model_dir: str,
                                torch_dtype: Dtype,
                                model_kwargs: Dict[str, Any],
                                load_model: bool = True,
                                **kwargs):
-    model_config = AutoConfig.from_pretrained(
-        model_dir, trust_remote_code=True)
+    model_config = _get_cached_config(model_dir)
     model_config.pretraining_tp = 1
     return get_model_tokenizer_with_flash_attn(
         model_dir,
@@ -2733,17 +2972,184 @@ def get_model_tokenizer_llama2(model_dir: str,
         **kwargs)
 
 
-@register_model(
-    ModelType.polylm_13b,
-    'damo/nlp_polylm_13b_text_generation',
-    LoRATM.polylm,
-    TemplateType.default_generation,
-    hf_model_id='DAMO-NLP-MT/polylm-13b')
+class _Llama2Models(ModelFamily):
+    get_function = get_model_tokenizer_llama2
+    entries = (
+        ModelEntry(
+            ModelType.llama3_70b_instruct_awq,
+            'huangjintao/Meta-Llama-3-70B-Instruct-AWQ', LoRATM.llama2,
+            TemplateType.llama3,
+            dict(
+                requires=['autoawq'],
+                torch_dtype=torch.float16,
+                function_kwargs={'is_awq': True},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='study-hjt/Meta-Llama-3-70B-Instruct-AWQ')),
+        ModelEntry(
+            ModelType.llama3_70b_instruct_int8,
+            'huangjintao/Meta-Llama-3-70b-Instruct-GPTQ-Int8', LoRATM.llama2,
+            TemplateType.llama3,
+            dict(
+                requires=['auto_gptq'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 8},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='study-hjt/Meta-Llama-3-70B-Instruct-GPTQ-Int8')),
+        ModelEntry(
+            ModelType.llama3_70b_instruct_int4,
+            'huangjintao/Meta-Llama-3-70B-Instruct-GPTQ-Int4', LoRATM.llama2,
+            TemplateType.llama3,
+            dict(
+                requires=['auto_gptq'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 4},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='study-hjt/Meta-Llama-3-70B-Instruct-GPTQ-Int4')),
+        ModelEntry(
+            ModelType.llama3_8b_instruct_awq,
+            'huangjintao/Meta-Llama-3-8B-Instruct-AWQ', LoRATM.llama2,
+            TemplateType.llama3,
+            dict(
+                requires=['autoawq'],
+                torch_dtype=torch.float16,
+                function_kwargs={'is_awq': True},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='study-hjt/Meta-Llama-3-8B-Instruct-AWQ')),
+        ModelEntry(
+            ModelType.llama3_8b_instruct_int8,
+            'huangjintao/Meta-Llama-3-8B-Instruct-GPTQ-Int8', LoRATM.llama2,
+            TemplateType.llama3,
+            dict(
+                requires=['auto_gptq'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 8},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='study-hjt/Meta-Llama-3-8B-Instruct-GPTQ-Int8')),
+        ModelEntry(
+            ModelType.llama3_8b_instruct_int4,
+            'huangjintao/Meta-Llama-3-8B-Instruct-GPTQ-Int4', LoRATM.llama2,
+            TemplateType.llama3,
+            dict(
+                requires=['auto_gptq'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 4},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='study-hjt/Meta-Llama-3-8B-Instruct-GPTQ-Int4')),
+        ModelEntry(
+            ModelType.llama3_70b_instruct,
+            'LLM-Research/Meta-Llama-3-70B-Instruct', LoRATM.llama2,
+            TemplateType.llama3,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='meta-llama/Meta-Llama-3-70B-Instruct')),
+        ModelEntry(
+            ModelType.llama3_70b, 'LLM-Research/Meta-Llama-3-70B',
+            LoRATM.llama2, TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='meta-llama/Meta-Llama-3-70B')),
+        ModelEntry(
+            ModelType.llama3_8b_instruct,
+            'LLM-Research/Meta-Llama-3-8B-Instruct', LoRATM.llama2,
+            TemplateType.llama3,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='meta-llama/Meta-Llama-3-8B-Instruct')),
+        ModelEntry(
+            ModelType.llama3_8b, 'LLM-Research/Meta-Llama-3-8B', LoRATM.llama2,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='meta-llama/Meta-Llama-3-8B')),
+        ModelEntry(
+            ModelType.llama2_7b_aqlm_2bit_1x16,
+            'AI-ModelScope/Llama-2-7b-AQLM-2Bit-1x16-hf', LoRATM.llama2,
+            TemplateType.default_generation_bos,
+            dict(
+                ignore_file_pattern=[r'.+\.bin$'],
+                support_flash_attn=True,
+                requires=['transformers>=4.38', 'aqlm', 'torch>=2.2.0'],
+                support_vllm=False,
+                function_kwargs={'is_aqlm': True},
+                hf_model_id='ISTA-DASLab/Llama-2-7b-AQLM-2Bit-1x16-hf')),
+        ModelEntry(
+            ModelType.mixtral_moe_7b_aqlm_2bit_1x16,
+            'AI-ModelScope/Mixtral-8x7b-AQLM-2Bit-1x16-hf', LoRATM.llama2,
+            TemplateType.default_generation_bos,
+            dict(
+                requires=['transformers>=4.38', 'aqlm', 'torch>=2.2.0'],
+                support_flash_attn=True,
+                support_vllm=False,
+                support_gradient_checkpointing=False,
+                function_kwargs={'is_aqlm': True},
+                hf_model_id='ISTA-DASLab/Mixtral-8x7b-AQLM-2Bit-1x16-hf')),
+        ModelEntry(
+            ModelType.llama2_7b, 'modelscope/Llama-2-7b-ms', LoRATM.llama2,
+            TemplateType.default_generation_bos,
+            dict(
+                ignore_file_pattern=[r'.+\.bin$'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='meta-llama/Llama-2-7b-hf')),
+        ModelEntry(
+            ModelType.llama2_13b, 'modelscope/Llama-2-13b-ms', LoRATM.llama2,
+            TemplateType.default_generation_bos,
+            dict(
+                ignore_file_pattern=[r'.+\.bin$'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='meta-llama/Llama-2-13b-hf')),
+        ModelEntry(
+            ModelType.llama2_70b, 'modelscope/Llama-2-70b-ms', LoRATM.llama2,
+            TemplateType.default_generation_bos,
+            dict(
+                ignore_file_pattern=[r'.+\.bin$'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='meta-llama/Llama-2-70b-hf')),
+        ModelEntry(
+            ModelType.llama2_7b_chat, 'modelscope/Llama-2-7b-chat-ms',
+            LoRATM.llama2, TemplateType.llama,
+            dict(
+                ignore_file_pattern=[r'.+\.bin$'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='meta-llama/Llama-2-7b-chat-hf')),
+        ModelEntry(
+            ModelType.llama2_13b_chat, 'modelscope/Llama-2-13b-chat-ms',
+            LoRATM.llama2, TemplateType.llama,
+            dict(
+                ignore_file_pattern=[r'.+\.bin$'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='meta-llama/Llama-2-13b-chat-hf')),
+        ModelEntry(
+            ModelType.llama2_70b_chat, 'modelscope/Llama-2-70b-chat-ms',
+            LoRATM.llama2, TemplateType.llama,
+            dict(
+                ignore_file_pattern=[r'.+\.bin$'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='meta-llama/Llama-2-70b-chat-hf')),
+    )
+
+
 def get_model_tokenizer_polylm(model_dir: str,
                                torch_dtype: Dtype,
                                model_kwargs: Dict[str, Any],
                                load_model: bool = True,
                                **kwargs):
+    from modelscope import AutoTokenizer
     tokenizer = AutoTokenizer.from_pretrained(
         model_dir, trust_remote_code=True, use_fast=False, legacy=True)
     return get_model_tokenizer_from_repo(
@@ -2755,11 +3161,24 @@ def get_model_tokenizer_polylm(model_dir: str,
         **kwargs)
 
 
+class _PolyLMModels(ModelFamily):
+    get_function = get_model_tokenizer_polylm
+    entries = (ModelEntry(ModelType.polylm_13b,
+                          'damo/nlp_polylm_13b_text_generation', LoRATM.polylm,
+                          TemplateType.default_generation,
+                          dict(hf_model_id='DAMO-NLP-MT/polylm-13b')), )
+
+
 dtype_mapping = {
     torch.float16: 'fp16',
     torch.bfloat16: 'bf16',
     torch.float32: 'fp32'
 }
+_qwen_dtype_flags = {
+    torch_dtype: {k: k == k_true
+                  for k in dtype_mapping.values()}
+    for torch_dtype, k_true in dtype_mapping.items()
+}
 
 
 def get_model_tokenizer_qwen(model_dir: str,
@@ -2768,15 +3187,11 @@ def get_model_tokenizer_qwen(model_dir: str,
                              load_model: bool = True,
                              model_config=None,
                              **kwargs):
+    from modelscope import BitsAndBytesConfig
     if model_config is None:
-        model_config = AutoConfig.from_pretrained(
-            model_dir, trust_remote_code=True)
+        model_config = _get_cached_config(model_dir)
     if torch_dtype is not None:
-        k_true = dtype_mapping[torch_dtype]
-        for k in dtype_mapping.values():
-            v = False
-            if k == k_true:
-                v = True
+        for k, v in _qwen_dtype_flags[torch_dtype].items():
             setattr(model_config, k, v)
 
     if model_kwargs.get('quantization_config') is None or not isinstance(
@@ -2795,131 +3210,126 @@ def get_model_tokenizer_qwen(model_dir: str,
         model_config=model_config,
         **kwargs)
     try:
-        # fix mp+ddp bug
-        model.transformer.registered_causal_mask = model.transformer.registered_causal_mask.cuda(
-        )
-        logger.info('registered_causal_mask to cuda')
+        # fix mp+ddp bug: follow the device of the embeddings of this rank
+        transformer = model.transformer
+        device = transformer.wte.weight.device
+        transformer.registered_causal_mask = transformer.registered_causal_mask.to(
+            device)
+        logger.info(f'registered_causal_mask to {device}')
     except AttributeError:
         pass
     return model, tokenizer
 
 
-@register_model(
-    ModelType.modelscope_agent_7b,
-    'iic/ModelScope-Agent-7B',
-    LoRATM.qwen,
-    TemplateType.modelscope_agent,
-    support_flash_attn=True,
-    support_vllm=False)
-@register_model(
-    ModelType.modelscope_agent_14b,
-    'iic/ModelScope-Agent-14B',
-    LoRATM.qwen,
-    TemplateType.modelscope_agent,
-    support_flash_attn=True,
-    support_vllm=False)
-@register_model(
-    ModelType.codefuse_qwen_14b_chat,
-    'codefuse-ai/CodeFuse-QWen-14B',
-    LoRATM.qwen,
-    TemplateType.codefuse,
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['coding'],
-    hf_model_id='codefuse-ai/CodeFuse-QWen-14B')
-@register_model(
-    ModelType.qwen_1_8b,
-    'qwen/Qwen-1_8B',
-    LoRATM.qwen,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen1.5-1.8B')
-@register_model(
-    ModelType.qwen_72b,
-    'qwen/Qwen-72B',
-    LoRATM.qwen,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen-72B')
-@register_model(
-    ModelType.tongyi_finance_14b,
-    'TongyiFinance/Tongyi-Finance-14B',
-    LoRATM.qwen,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['financial'])
-@register_model(
-    ModelType.qwen_14b,
-    'qwen/Qwen-14B',
-    LoRATM.qwen,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen-14B')
-@register_model(
-    ModelType.qwen_7b,
-    'qwen/Qwen-7B',
-    LoRATM.qwen,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen-7B')
 def get_model_tokenizer_qwen_base(*args, **kwargs):
     model, tokenizer = get_model_tokenizer_qwen(*args, **kwargs)
     tokenizer.eos_token_id = tokenizer.eod_id
     return model, tokenizer
 
 
-@register_model(
-    ModelType.qwen_1_8b_chat,
-    'qwen/Qwen-1_8B-Chat',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen-1_8B-Chat')
-@register_model(
-    ModelType.qwen_72b_chat,
-    'qwen/Qwen-72B-Chat',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen-72B-Chat')
-@register_model(
-    ModelType.tongyi_finance_14b_chat,
-    'TongyiFinance/Tongyi-Finance-14B-Chat',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['financial'],
-    hf_model_id='jxy/Tongyi-Finance-14B-Chat')
-@register_model(
-    ModelType.qwen_14b_chat,
-    'qwen/Qwen-14B-Chat',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen-14B-Chat')
-@register_model(
-    ModelType.qwen_7b_chat,
-    'qwen/Qwen-7B-Chat',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen-7B-Chat')
+class _QwenBaseModels(ModelFamily):
+    get_function = get_model_tokenizer_qwen_base
+    entries = (
+        ModelEntry(ModelType.modelscope_agent_7b, 'iic/ModelScope-Agent-7B',
+                   LoRATM.qwen, TemplateType.modelscope_agent,
+                   dict(support_flash_attn=True, support_vllm=False)),
+        ModelEntry(ModelType.modelscope_agent_14b, 'iic/ModelScope-Agent-14B',
+                   LoRATM.qwen, TemplateType.modelscope_agent,
+                   dict(support_flash_attn=True, support_vllm=False)),
+        ModelEntry(
+            ModelType.codefuse_qwen_14b_chat, 'codefuse-ai/CodeFuse-QWen-14B',
+            LoRATM.qwen, TemplateType.codefuse,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['coding'],
+                hf_model_id='codefuse-ai/CodeFuse-QWen-14B')),
+        ModelEntry(
+            ModelType.qwen_1_8b, 'qwen/Qwen-1_8B', LoRATM.qwen,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen1.5-1.8B')),
+        ModelEntry(
+            ModelType.qwen_72b, 'qwen/Qwen-72B', LoRATM.qwen,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen-72B')),
+        ModelEntry(
+            ModelType.tongyi_finance_14b, 'TongyiFinance/Tongyi-Finance-14B',
+            LoRATM.qwen, TemplateType.default_generation,
+            dict(
+                support_flash_attn=True, support_vllm=True,
+                tags=['financial'])),
+        ModelEntry(
+            ModelType.qwen_14b, 'qwen/Qwen-14B', LoRATM.qwen,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen-14B')),
+        ModelEntry(
+            ModelType.qwen_7b, 'qwen/Qwen-7B', LoRATM.qwen,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen-7B')),
+    )
+
+
 def get_model_tokenizer_qwen_chat(*args, **kwargs):
     model, tokenizer = get_model_tokenizer_qwen(*args, **kwargs)
     tokenizer.eos_token_id = tokenizer.im_end_id
     return model, tokenizer
 
 
+class _QwenChatModels(ModelFamily):
+    get_function = get_model_tokenizer_qwen_chat
+    entries = (
+        ModelEntry(
+            ModelType.qwen_1_8b_chat, 'qwen/Qwen-1_8B-Chat', LoRATM.qwen,
+            TemplateType.qwen,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen-1_8B-Chat')),
+        ModelEntry(
+            ModelType.qwen_72b_chat, 'qwen/Qwen-72B-Chat', LoRATM.qwen,
+            TemplateType.qwen,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen-72B-Chat')),
+        ModelEntry(
+            ModelType.tongyi_finance_14b_chat,
+            'TongyiFinance/Tongyi-Finance-14B-Chat', LoRATM.qwen,
+            TemplateType.qwen,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['financial'],
+                hf_model_id='jxy/Tongyi-Finance-14B-Chat')),
+        ModelEntry(
+            ModelType.qwen_14b_chat, 'qwen/Qwen-14B-Chat', LoRATM.qwen,
+            TemplateType.qwen,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen-14B-Chat')),
+        ModelEntry(
+            ModelType.qwen_7b_chat, 'qwen/Qwen-7B-Chat', LoRATM.qwen,
+            TemplateType.qwen,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen-7B-Chat')),
+    )
+
+
 def _qwen_vl_visual_block_forward(
     self,
     q_x: torch.Tensor,
@@ -2956,48 +3366,38 @@ def fix_qwen_inplace_bug(model) -> None:
             first_drop.__old_forward = __old_forward
 
 
+# <|im_end|>, <|endoftext|>
+_QWEN_EOS_TOKEN_IDS = frozenset({151645, 151643})
+
+
 def _qwen_vl_audio_decode(self,
                           *args,
                           skip_special_tokens=False,
                           **kwargs) -> str:
     if skip_special_tokens:
         token_ids = kwargs['token_ids']
-        while len(token_ids) > 0 and token_ids[-1] in {151645, 151643}:
-            token_ids.pop()
+        i = len(token_ids)
+        while i > 0 and token_ids[i - 1] in _QWEN_EOS_TOKEN_IDS:
+            i -= 1
+        del token_ids[i:]
         return self._old_decode(*args, skip_special_tokens=False, **kwargs)
     else:
         return self._old_decode(*args, skip_special_tokens=False, **kwargs)
 
 
-@register_model(
-    ModelType.qwen_vl_chat,
-    'qwen/Qwen-VL-Chat',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    support_flash_attn=True,
-    tags=['multi-modal', 'vision'],
-    hf_model_id='Qwen/Qwen-VL-Chat')
-@register_model(
-    ModelType.qwen_vl,
-    'qwen/Qwen-VL',
-    LoRATM.qwen,
-    TemplateType.default_generation,
-    function_kwargs={'get_qwen_function': get_model_tokenizer_qwen_base},
-    support_flash_attn=True,
-    tags=['multi-modal', 'vision'],
-    hf_model_id='Qwen/Qwen-VL')
 def get_model_tokenizer_qwen_vl(model_dir: str,
                                 torch_dtype: Dtype,
                                 model_kwargs: Dict[str, Any],
                                 load_model: bool = True,
                                 **kwargs):
+    from modelscope import BitsAndBytesConfig
     if (model_kwargs.get('quantization_config') is not None and isinstance(
             model_kwargs['quantization_config'], BitsAndBytesConfig)):
         # https://github.com/pytorch/pytorch/issues/58969
         model_kwargs['quantization_config'].llm_int8_skip_modules = [
             'lm_head', 'attn_pool.attn'
         ]
-        _TransformerBlock = get_class_from_dynamic_module(
+        _TransformerBlock = _get_cached_dynamic_class(
             'visual.TransformerBlock', model_dir)
 
         def _get_cast_dtype(self) -> torch.dtype:
@@ -3008,9 +3408,9 @@ def get_model_tokenizer_qwen_vl(model_dir: str,
 
     get_qwen_function = kwargs.pop('get_qwen_function',
                                    get_model_tokenizer_qwen_chat)
-    tokenizer_config = get_tokenizer_config(model_dir)
+    tokenizer_config = _get_cached_tokenizer_config(model_dir)
     class_ref = tokenizer_config['auto_map']['AutoTokenizer'][0]
-    tokenizer_cls = get_class_from_dynamic_module(class_ref, model_dir)
+    tokenizer_cls = _get_cached_dynamic_class(class_ref, model_dir)
     tokenizer_cls._auto_class = 'AutoTokenizer'
     tokenizer_cls.IMAGE_ST = ()  # fix no attr `self.IMAGE_ST` bug
     if not hasattr(tokenizer_cls, '_old_decode'):  # avoid double patching
@@ -3020,7 +3420,7 @@ def get_model_tokenizer_qwen_vl(model_dir: str,
     n_gpu = torch.cuda.device_count()
     local_world_size = get_dist_setting()[3]
     if n_gpu // local_world_size >= 4:
-        visual_block_cls = get_class_from_dynamic_module(
+        visual_block_cls = _get_cached_dynamic_class(
             'visual.VisualAttentionBlock', model_dir)
         if not hasattr(visual_block_cls,
                        '__old_forward'):  # avoid double patching
@@ -3035,48 +3435,54 @@ def get_model_tokenizer_qwen_vl(model_dir: str,
         fix_qwen_inplace_bug(model)
         # fix device_map is 4
         if n_gpu // local_world_size >= 4:
-            model.transformer.visual.proj.data = model.transformer.visual.proj.to(
-                model.transformer.visual.ln_post.bias.device)
+            visual = model.transformer.visual
+            device = visual.ln_post.bias.device
+            if visual.proj.device != device:
+                visual.proj.data = visual.proj.data.to(device)
         # fix images cuda:1 bug
         vision_transformer = model.transformer.visual
-        if not hasattr(vision_transformer, '__old_forward'):
-            _old_forward = vision_transformer.forward
 
-            def _new_forward(x: torch.Tensor):
-                return _old_forward(x).to(device=f'{x.device.type}:0')
+        def _move_images_hook(module, args, output: Tensor) -> Tensor:
+            # no copy if the output is already on device 0
+            return output.to(
+                torch.device(output.device.type, 0), non_blocking=True)
 
-            vision_transformer.__old_forward = _old_forward
-            vision_transformer.forward = _new_forward
+        vision_transformer.register_forward_hook(_move_images_hook)
     return model, tokenizer
 
 
-@register_model(
-    ModelType.qwen_audio_chat,
-    'qwen/Qwen-Audio-Chat',
-    LoRATM.qwen,
-    TemplateType.qwen_audio,
-    support_flash_attn=True,
-    function_kwargs={'get_qwen_function': get_model_tokenizer_qwen_chat},
-    tags=['multi-modal', 'audio'],
-    hf_model_id='Qwen/Qwen-Audio-Chat')
-@register_model(
-    ModelType.qwen_audio,
-    'qwen/Qwen-Audio',
-    LoRATM.qwen,
-    TemplateType.qwen_audio_generation,
-    support_flash_attn=True,
-    function_kwargs={'get_qwen_function': get_model_tokenizer_qwen_base},
-    tags=['multi-modal', 'audio'],
-    hf_model_id='Qwen/Qwen-Audio')
+class _QwenVLModels(ModelFamily):
+    get_function = get_model_tokenizer_qwen_vl
+    entries = (
+        ModelEntry(
+            ModelType.qwen_vl_chat, 'qwen/Qwen-VL-Chat', LoRATM.qwen,
+            TemplateType.qwen,
+            dict(
+                support_flash_attn=True,
+                tags=['multi-modal', 'vision'],
+                hf_model_id='Qwen/Qwen-VL-Chat')),
+        ModelEntry(
+            ModelType.qwen_vl, 'qwen/Qwen-VL', LoRATM.qwen,
+            TemplateType.default_generation,
+            dict(
+                function_kwargs={
+                    'get_qwen_function': get_model_tokenizer_qwen_base
+                },
+                support_flash_attn=True,
+                tags=['multi-modal', 'vision'],
+                hf_model_id='Qwen/Qwen-VL')),
+    )
+
+
 def get_model_tokenizer_qwen_audio(model_dir: str,
                                    torch_dtype: Dtype,
                                    model_kwargs: Dict[str, Any],
                                    load_model: bool = True,
                                    **kwargs):
     get_qwen_function = kwargs.pop('get_qwen_function')
-    tokenizer_config = get_tokenizer_config(model_dir)
+    tokenizer_config = _get_cached_tokenizer_config(model_dir)
     class_ref = tokenizer_config['auto_map']['AutoTokenizer'][0]
-    tokenizer_cls = get_class_from_dynamic_module(class_ref, model_dir)
+    tokenizer_cls = _get_cached_dynamic_class(class_ref, model_dir)
     tokenizer_cls._auto_class = 'AutoTokenizer'
     tokenizer_cls.AUDIO_ST = ()  # fix no attr `self.AUDIO_ST` bug
     if not hasattr(tokenizer_cls, '_old_decode'):  # avoid double patching
@@ -3092,116 +3498,32 @@ def get_model_tokenizer_qwen_audio(model_dir: str,
     return model, tokenizer
 
 
-@register_model(
-    ModelType.qwen_1_8b_chat_int8,
-    'qwen/Qwen-1_8B-Chat-Int8',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 8},
-    support_flash_attn=True,
-    hf_model_id='Qwen/Qwen-1_8B-Chat-Int8')
-@register_model(
-    ModelType.qwen_1_8b_chat_int4,
-    'qwen/Qwen-1_8B-Chat-Int4',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 4},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen-1_8B-Chat-Int4')
-@register_model(
-    ModelType.qwen_72b_chat_int8,
-    'qwen/Qwen-72B-Chat-Int8',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 8},
-    support_flash_attn=True,
-    hf_model_id='Qwen/Qwen-72B-Chat-Int8')
-@register_model(
-    ModelType.qwen_72b_chat_int4,
-    'qwen/Qwen-72B-Chat-Int4',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 4},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen-72B-Chat-Int4')
-@register_model(
-    ModelType.tongyi_finance_14b_chat_int4,
-    'TongyiFinance/Tongyi-Finance-14B-Chat-Int4',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 4},
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['financial'],
-    hf_model_id='jxy/Tongyi-Finance-14B-Chat-Int4')
-@register_model(
-    ModelType.qwen_vl_chat_int4,
-    'qwen/Qwen-VL-Chat-Int4',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5'],
-    torch_dtype=torch.float16,
-    function_kwargs={
-        'get_qwen_function': get_model_tokenizer_qwen_vl,
-        'gptq_bits': 4
-    },
-    support_flash_attn=True,
-    tags=['multi-modal', 'vision'],
-    hf_model_id='Qwen/Qwen-VL-Chat-Int4')
-@register_model(
-    ModelType.qwen_14b_chat_int8,
-    'qwen/Qwen-14B-Chat-Int8',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 8},
-    support_flash_attn=True,
-    hf_model_id='Qwen/Qwen-14B-Chat-Int8')
-@register_model(
-    ModelType.qwen_7b_chat_int8,
-    'qwen/Qwen-7B-Chat-Int8',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 8},
-    support_flash_attn=True,
-    hf_model_id='Qwen/Qwen-7B-Chat-Int8')
-@register_model(
-    ModelType.qwen_14b_chat_int4,
-    'qwen/Qwen-14B-Chat-Int4',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 4},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen-14B-Chat-Int4')
-@register_model(
-    ModelType.qwen_7b_chat_int4,
-    'qwen/Qwen-7B-Chat-Int4',
-    LoRATM.qwen,
-    TemplateType.qwen,
-    requires=['auto_gptq>=0.5'],
-    torch_dtype=torch.float16,
-    function_kwargs={'gptq_bits': 4},
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='Qwen/Qwen-7B-Chat-Int4')
+class _QwenAudioModels(ModelFamily):
+    get_function = get_model_tokenizer_qwen_audio
+    entries = (
+        ModelEntry(
+            ModelType.qwen_audio_chat, 'qwen/Qwen-Audio-Chat', LoRATM.qwen,
+            TemplateType.qwen_audio,
+            dict(
+                support_flash_attn=True,
+                function_kwargs={
+                    'get_qwen_function': get_model_tokenizer_qwen_chat
+                },
+                tags=['multi-modal', 'audio'],
+                hf_model_id='Qwen/Qwen-Audio-Chat')),
+        ModelEntry(
+            ModelType.qwen_audio, 'qwen/Qwen-Audio', LoRATM.qwen,
+            TemplateType.qwen_audio_generation,
+            dict(
+                support_flash_attn=True,
+                function_kwargs={
+                    'get_qwen_function': get_model_tokenizer_qwen_base
+                },
+                tags=['multi-modal', 'audio'],
+                hf_model_id='Qwen/Qwen-Audio')),
+    )
+
+
 def get_model_tokenizer_qwen_intx(model_dir: str,
                                   torch_dtype: Dtype,
                                   model_kwargs: Dict[str, Any],
@@ -3214,6 +3536,113 @@ def get_model_tokenizer_qwen_intx(model_dir: str,
     return model, tokenizer
 
 
+class _QwenIntxModels(ModelFamily):
+    get_function = get_model_tokenizer_qwen_intx
+    entries = (
+        ModelEntry(
+            ModelType.qwen_1_8b_chat_int8, 'qwen/Qwen-1_8B-Chat-Int8',
+            LoRATM.qwen, TemplateType.qwen,
+            dict(
+                requires=['auto_gptq>=0.5'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 8},
+                support_flash_attn=True,
+                hf_model_id='Qwen/Qwen-1_8B-Chat-Int8')),
+        ModelEntry(
+            ModelType.qwen_1_8b_chat_int4, 'qwen/Qwen-1_8B-Chat-Int4',
+            LoRATM.qwen, TemplateType.qwen,
+            dict(
+                requires=['auto_gptq>=0.5'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 4},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen-1_8B-Chat-Int4')),
+        ModelEntry(
+            ModelType.qwen_72b_chat_int8, 'qwen/Qwen-72B-Chat-Int8',
+            LoRATM.qwen, TemplateType.qwen,
+            dict(
+                requires=['auto_gptq>=0.5'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 8},
+                support_flash_attn=True,
+                hf_model_id='Qwen/Qwen-72B-Chat-Int8')),
+        ModelEntry(
+            ModelType.qwen_72b_chat_int4, 'qwen/Qwen-72B-Chat-Int4',
+            LoRATM.qwen, TemplateType.qwen,
+            dict(
+                requires=['auto_gptq>=0.5'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 4},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen-72B-Chat-Int4')),
+        ModelEntry(
+            ModelType.tongyi_finance_14b_chat_int4,
+            'TongyiFinance/Tongyi-Finance-14B-Chat-Int4', LoRATM.qwen,
+            TemplateType.qwen,
+            dict(
+                requires=['auto_gptq>=0.5'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 4},
+                support_flash_attn=True,
+                support_vllm=True,
+                tags=['financial'],
+                hf_model_id='jxy/Tongyi-Finance-14B-Chat-Int4')),
+        ModelEntry(
+            ModelType.qwen_vl_chat_int4, 'qwen/Qwen-VL-Chat-Int4', LoRATM.qwen,
+            TemplateType.qwen,
+            dict(
+                requires=['auto_gptq>=0.5'],
+                torch_dtype=torch.float16,
+                function_kwargs={
+                    'get_qwen_function': get_model_tokenizer_qwen_vl,
+                    'gptq_bits': 4
+                },
+                support_flash_attn=True,
+                tags=['multi-modal', 'vision'],
+                hf_model_id='Qwen/Qwen-VL-Chat-Int4')),
+        ModelEntry(
+            ModelType.qwen_14b_chat_int8, 'qwen/Qwen-14B-Chat-Int8',
+            LoRATM.qwen, TemplateType.qwen,
+            dict(
+                requires=['auto_gptq>=0.5'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 8},
+                support_flash_attn=True,
+                hf_model_id='Qwen/Qwen-14B-Chat-Int8')),
+        ModelEntry(
+            ModelType.qwen_7b_chat_int8, 'qwen/Qwen-7B-Chat-Int8', LoRATM.qwen,
+            TemplateType.qwen,
+            dict(
+                requires=['auto_gptq>=0.5'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 8},
+                support_flash_attn=True,
+                hf_model_id='Qwen/Qwen-7B-Chat-Int8')),
+        ModelEntry(
+            ModelType.qwen_14b_chat_int4, 'qwen/Qwen-14B-Chat-Int4',
+            LoRATM.qwen, TemplateType.qwen,
+            dict(
+                requires=['auto_gptq>=0.5'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 4},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen-14B-Chat-Int4')),
+        ModelEntry(
+            ModelType.qwen_7b_chat_int4, 'qwen/Qwen-7B-Chat-Int4', LoRATM.qwen,
+            TemplateType.qwen,
+            dict(
+                requires=['auto_gptq>=0.5'],
+                torch_dtype=torch.float16,
+                function_kwargs={'gptq_bits': 4},
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='Qwen/Qwen-7B-Chat-Int4')),
+    )
+
+
 register_model(
     ModelType.skywork_13b,
     'skywork/Skywork-13B-base',
@@ -3223,36 +3652,37 @@ register_model(
     hf_model_id='Skywork/Skywork-13B-base')
 
 
-@register_model(ModelType.skywork_13b_chat, 'skywork/Skywork-13B-chat',
-                LoRATM.llama2, TemplateType.skywork)
 def get_skywork_model_tokenizer(model_dir: str,
                                 torch_dtype: Dtype,
                                 model_kwargs: Dict[str, Any],
                                 load_model: bool = True,
                                 **kwargs):
-    model, tokenizer = get_model_tokenizer_from_repo(model_dir, torch_dtype,
-                                                     model_kwargs, load_model,
-                                                     **kwargs)
-    tokenizer.add_tokens('[USER]')
-    tokenizer.add_tokens('[BOT]')
-    tokenizer.add_tokens('[SEP]')
+    # add_tokens modifies the backend, which is shared with the cached tokenizer.
+    tokenizer = deepcopy(_get_cached_tokenizer(model_dir))
+    model, tokenizer = get_model_tokenizer_from_repo(
+        model_dir,
+        torch_dtype,
+        model_kwargs,
+        load_model,
+        tokenizer=tokenizer,
+        **kwargs)
+    tokenizer.add_tokens(['[USER]', '[BOT]', '[SEP]'])
     return model, tokenizer
 
 
-@register_model(
-    ModelType.codefuse_codellama_34b_chat,
-    'codefuse-ai/CodeFuse-CodeLlama-34B',
-    LoRATM.llama2,
-    TemplateType.codefuse_codellama,
-    support_flash_attn=True,
-    support_vllm=True,
-    tags=['coding'],
-    hf_model_id='codefuse-ai/CodeFuse-CodeLlama-34B')
+class _SkyworkModels(ModelFamily):
+    get_function = get_skywork_model_tokenizer
+    entries = (ModelEntry(ModelType.skywork_13b_chat,
+                          'skywork/Skywork-13B-chat', LoRATM.llama2,
+                          TemplateType.skywork, dict()), )
+
+
 def get_model_tokenizer_codellama(model_dir: str,
                                   torch_dtype: Dtype,
                                   model_kwargs: Dict[str, Any],
                                   load_model: bool = True,
                                   **kwargs):
+    from modelscope import AutoTokenizer
     tokenizer = AutoTokenizer.from_pretrained(
         model_dir, trust_remote_code=True, use_fast=False, legacy=False)
     return get_model_tokenizer_with_flash_attn(
@@ -3264,32 +3694,33 @@ def get_model_tokenizer_codellama(model_dir: str,
         **kwargs)
 
 
-@register_model(
-    ModelType.phi2_3b,
-    'AI-ModelScope/phi-2',
-    LoRATM.phi,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    support_vllm=True,
-    support_gradient_checkpointing=False,
-    tags=['coding'],
-    hf_model_id='microsoft/phi-2')
-@register_model(
-    ModelType.telechat_12b,
-    'TeleAI/TeleChat-12B',
-    LoRATM.telechat,
-    TemplateType.telechat,
-    support_flash_attn=True,
-    hf_model_id='Tele-AI/TeleChat-12B')
+class _CodeLlamaModels(ModelFamily):
+    get_function = get_model_tokenizer_codellama
+    entries = (ModelEntry(
+        ModelType.codefuse_codellama_34b_chat,
+        'codefuse-ai/CodeFuse-CodeLlama-34B', LoRATM.llama2,
+        TemplateType.codefuse_codellama,
+        dict(
+            support_flash_attn=True,
+            support_vllm=True,
+            tags=['coding'],
+            hf_model_id='codefuse-ai/CodeFuse-CodeLlama-34B')), )
+
+
+def _get_flash_attn_config(model_dir: str, attr_name: str,
+                           kwargs: Dict[str, Any]) -> PretrainedConfig:
+    # remote-code models that read the flash-attn switch from their own config attribute
+    model_config = _get_cached_config(model_dir)
+    setattr(model_config, attr_name, kwargs.pop('use_flash_attn', False))
+    return model_config
+
+
 def get_model_tokenizer_phi(model_dir: str,
                             torch_dtype: Dtype,
                             model_kwargs: Dict[str, Any],
                             load_model: bool = True,
                             **kwargs):
-    model_config = AutoConfig.from_pretrained(
-        model_dir, trust_remote_code=True)
-    use_flash_attn = kwargs.pop('use_flash_attn', False)
-    model_config.flash_attn = use_flash_attn
+    model_config = _get_flash_attn_config(model_dir, 'flash_attn', kwargs)
     return get_model_tokenizer_from_repo(
         model_dir,
         torch_dtype,
@@ -3299,13 +3730,25 @@ def get_model_tokenizer_phi(model_dir: str,
         **kwargs)
 
 
-@register_model(
-    ModelType.telechat_7b,
-    'TeleAI/TeleChat-7B',
-    LoRATM.telechat,
-    TemplateType.telechat,
-    support_flash_attn=True,
-    hf_model_id='Tele-AI/telechat-7B')
+class _PhiModels(ModelFamily):
+    get_function = get_model_tokenizer_phi
+    entries = (
+        ModelEntry(
+            ModelType.phi2_3b, 'AI-ModelScope/phi-2', LoRATM.phi,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                support_gradient_checkpointing=False,
+                tags=['coding'],
+                hf_model_id='microsoft/phi-2')),
+        ModelEntry(
+            ModelType.telechat_12b, 'TeleAI/TeleChat-12B', LoRATM.telechat,
+            TemplateType.telechat,
+            dict(support_flash_attn=True, hf_model_id='Tele-AI/TeleChat-12B')),
+    )
+
+
 def get_model_tokenizer_telechat(model_dir: str,
                                  torch_dtype: Dtype,
                                  model_kwargs: Dict[str, Any],
@@ -3316,10 +3759,7 @@ def get_model_tokenizer_telechat(model_dir: str,
             'telechat-7b does not support the bf16 dtype; the dtype is converted to fp16.'
         )
         torch_dtype = torch.float16
-    model_config = AutoConfig.from_pretrained(
-        model_dir, trust_remote_code=True)
-    use_flash_attn = kwargs.pop('use_flash_attn', False)
-    model_config.flash_attn = use_flash_attn
+    model_config = _get_flash_attn_config(model_dir, 'flash_attn', kwargs)
     return get_model_tokenizer_from_repo(
         model_dir,
         torch_dtype,
@@ -3329,31 +3769,14 @@ def get_model_tokenizer_telechat(model_dir: str,
         **kwargs)
 
 
-@register_model(
-    ModelType.deepseek_moe_16b_chat,
-    'deepseek-ai/deepseek-moe-16b-chat',
-    LoRATM.llama2,
-    TemplateType.deepseek,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='deepseek-ai/deepseek-moe-16b-chat')
-@register_model(
-    ModelType.deepseek_moe_16b,
-    'deepseek-ai/deepseek-moe-16b-base',
-    LoRATM.llama2,
-    TemplateType.default_generation_bos,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='deepseek-ai/deepseek-moe-16b-base')
-@register_model(
-    ModelType.minicpm_moe_8x2b,
-    'OpenBMB/MiniCPM-MoE-8x2B',
-    LoRATM.llama2,
-    TemplateType.minicpm,
-    requires=['transformers>=4.36.0'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='openbmb/MiniCPM-MoE-8x2B')
+class _TeleChatModels(ModelFamily):
+    get_function = get_model_tokenizer_telechat
+    entries = (ModelEntry(
+        ModelType.telechat_7b, 'TeleAI/TeleChat-7B', LoRATM.telechat,
+        TemplateType.telechat,
+        dict(support_flash_attn=True, hf_model_id='Tele-AI/telechat-7B')), )
+
+
 def get_model_tokenizer_deepseek_moe(model_dir: str,
                                      torch_dtype: Dtype,
                                      model_kwargs: Dict[str, Any],
@@ -3386,50 +3809,65 @@ def get_model_tokenizer_deepseek_moe(model_dir: str,
     return model, tokenizer
 
 
-@register_model(
-    ModelType.yuan2_2b_instruct,
-    'YuanLLM/Yuan2.0-2B-hf',
-    LoRATM.llama2,
-    TemplateType.yuan,
-    support_flash_attn=True,
-    hf_model_id='IEITYuan/Yuan2-2B-hf')
-@register_model(
-    ModelType.yuan2_51b_instruct,
-    'YuanLLM/Yuan2.0-51B-hf',
-    LoRATM.llama2,
-    TemplateType.yuan,
-    support_flash_attn=True,
-    hf_model_id='IEITYuan/Yuan2-51B-hf')
-@register_model(
-    ModelType.yuan2_102b_instruct,
-    'YuanLLM/Yuan2.0-102B-hf',
-    LoRATM.llama2,
-    TemplateType.yuan,
-    support_flash_attn=True,
-    hf_model_id='IEITYuan/Yuan2-102B-hf')
-@register_model(
-    ModelType.yuan2_2b_janus_instruct,
-    'YuanLLM/Yuan2-2B-Janus-hf',
-    LoRATM.llama2,
-    TemplateType.yuan,
-    support_flash_attn=True,
-    hf_model_id='IEITYuan/Yuan2-2B-Janus-hf')
+class _DeepseekMoeModels(ModelFamily):
+    get_function = get_model_tokenizer_deepseek_moe
+    entries = (
+        ModelEntry(
+            ModelType.deepseek_moe_16b_chat,
+            'deepseek-ai/deepseek-moe-16b-chat', LoRATM.llama2,
+            TemplateType.deepseek,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='deepseek-ai/deepseek-moe-16b-chat')),
+        ModelEntry(
+            ModelType.deepseek_moe_16b, 'deepseek-ai/deepseek-moe-16b-base',
+            LoRATM.llama2, TemplateType.default_generation_bos,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='deepseek-ai/deepseek-moe-16b-base')),
+        ModelEntry(
+            ModelType.minicpm_moe_8x2b, 'OpenBMB/MiniCPM-MoE-8x2B',
+            LoRATM.llama2, TemplateType.minicpm,
+            dict(
+                requires=['transformers>=4.36.0'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='openbmb/MiniCPM-MoE-8x2B')),
+    )
+
+
 def get_model_tokenizer_yuan(model_dir: str,
                              torch_dtype: Dtype,
                              model_kwargs: Dict[str, Any],
                              load_model: bool = True,
                              **kwargs):
+    from modelscope import AutoTokenizer
     model_folder, model_name = os.path.split(model_dir)
-    need_rename = '.' in model_name
-    if need_rename:
+    if '.' in model_name:
         model_name = model_name.replace('.', '_')  # fix transformers_modules
         new_model_dir = os.path.join(model_folder, model_name)
         logger.info(f'Using new_model_dir: {new_model_dir}')
-        os.rename(model_dir, new_model_dir)
-    model_config = AutoConfig.from_pretrained(
-        model_dir, trust_remote_code=True)
-    use_flash_attention = kwargs.pop('use_flash_attn', False)
-    model_config.use_flash_attention = use_flash_attention
+        # a symlink leaves the original directory untouched
+        with safe_ddp_context():
+            if os.path.islink(new_model_dir):
+                # a dangling link, or one to another snapshot
+                if os.path.realpath(new_model_dir) != os.path.realpath(
+                        model_dir):
+                    logger.info(f'Relinking {new_model_dir} to {model_dir}')
+                    os.remove(new_model_dir)
+                    os.symlink(model_dir, new_model_dir)
+            elif os.path.exists(new_model_dir):
+                # e.g. left behind by the former rename of the model_dir
+                raise FileExistsError(
+                    f'{new_model_dir} already exists and is not a link to {model_dir}. '
+                    'Please remove it.')
+            else:
+                os.symlink(model_dir, new_model_dir)
+        model_dir = new_model_dir
+    model_config = _get_flash_attn_config(model_dir, 'use_flash_attention',
+                                          kwargs)
     tokenizer = AutoTokenizer.from_pretrained(
         model_dir,
         add_eos_token=False,
@@ -3451,33 +3889,43 @@ def get_model_tokenizer_yuan(model_dir: str,
         model_config=model_config,
         tokenizer=tokenizer,
         **kwargs)
-    if need_rename:
-        os.rename(new_model_dir, model_dir)
     return model, tokenizer
 
 
-@register_model(
-    ModelType.orion_14b,
-    'OrionStarAI/Orion-14B-Base',
-    LoRATM.llama2,
-    TemplateType.default_generation,
-    support_flash_attn=True,
-    hf_model_id='OrionStarAI/Orion-14B-Base')
-@register_model(
-    ModelType.orion_14b_chat,
-    'OrionStarAI/Orion-14B-Chat',
-    LoRATM.llama2,
-    TemplateType.orion,
-    support_flash_attn=True,
-    hf_model_id='OrionStarAI/Orion-14B-Chat')
+class _YuanModels(ModelFamily):
+    get_function = get_model_tokenizer_yuan
+    entries = (
+        ModelEntry(
+            ModelType.yuan2_2b_instruct, 'YuanLLM/Yuan2.0-2B-hf',
+            LoRATM.llama2, TemplateType.yuan,
+            dict(support_flash_attn=True, hf_model_id='IEITYuan/Yuan2-2B-hf')),
+        ModelEntry(
+            ModelType.yuan2_51b_instruct, 'YuanLLM/Yuan2.0-51B-hf',
+            LoRATM.llama2, TemplateType.yuan,
+            dict(support_flash_attn=True,
+                 hf_model_id='IEITYuan/Yuan2-51B-hf')),
+        ModelEntry(
+            ModelType.yuan2_102b_instruct, 'YuanLLM/Yuan2.0-102B-hf',
+            LoRATM.llama2, TemplateType.yuan,
+            dict(
+                support_flash_attn=True,
+                hf_model_id='IEITYuan/Yuan2-102B-hf')),
+        ModelEntry(
+            ModelType.yuan2_2b_janus_instruct, 'YuanLLM/Yuan2-2B-Janus-hf',
+            LoRATM.llama2, TemplateType.yuan,
+            dict(
+                support_flash_attn=True,
+                hf_model_id='IEITYuan/Yuan2-2B-Janus-hf')),
+    )
+
+
 def get_model_tokenizer_orion(model_dir: str,
                               torch_dtype: Dtype,
                               model_kwargs: Dict[str, Any],
                               load_model: bool = True,
                               **kwargs):
-    model_config = AutoConfig.from_pretrained(
-        model_dir, trust_remote_code=True)
-    model_config._flash_attn_2_enabled = kwargs.pop('use_flash_attn', False)
+    model_config = _get_flash_attn_config(model_dir, '_flash_attn_2_enabled',
+                                          kwargs)
     return get_model_tokenizer_from_repo(
         model_dir,
         torch_dtype,
@@ -3487,31 +3935,33 @@ def get_model_tokenizer_orion(model_dir: str,
         **kwargs)
 
 
-@register_model(
-    ModelType.yi_vl_34b_chat,
-    '01ai/Yi-VL-34B',
-    LoRATM.llama2,
-    TemplateType.yi_vl,
-    support_flash_attn=True,
-    requires=['transformers>=4.34'],
-    tags=['multi-modal', 'vision'],
-    hf_model_id='01-ai/Yi-VL-34B')
-@register_model(
-    ModelType.yi_vl_6b_chat,
-    '01ai/Yi-VL-6B',
-    LoRATM.llama2,
-    TemplateType.yi_vl,
-    support_flash_attn=True,
-    requires=['transformers>=4.34'],
-    tags=['multi-modal', 'vision'],
-    hf_model_id='01-ai/Yi-VL-6B')
+class _OrionModels(ModelFamily):
+    get_function = get_model_tokenizer_orion
+    entries = (
+        ModelEntry(
+            ModelType.orion_14b, 'OrionStarAI/Orion-14B-Base', LoRATM.llama2,
+            TemplateType.default_generation,
+            dict(
+                support_flash_attn=True,
+                hf_model_id='OrionStarAI/Orion-14B-Base')),
+        ModelEntry(
+            ModelType.orion_14b_chat, 'OrionStarAI/Orion-14B-Chat',
+            LoRATM.llama2, TemplateType.orion,
+            dict(
+                support_flash_attn=True,
+                hf_model_id='OrionStarAI/Orion-14B-Chat')),
+    )
+
+
 def get_model_tokenizer_yi_vl(model_dir: str,
                               torch_dtype: Dtype,
                               model_kwargs: Dict[str, Any],
                               load_model: bool = True,
                               **kwargs):
     local_repo_path = _git_clone_github('https://github.com/01-ai/Yi')
-    sys.path.append(os.path.join(local_repo_path, 'VL'))
+    local_repo_path = os.path.join(local_repo_path, 'VL')
+    if local_repo_path not in sys.path:
+        sys.path.append(local_repo_path)
     from llava.model import LlavaLlamaForCausalLM, LlavaConfig
     from llava.model.constants import key_info
 
@@ -3541,50 +3991,35 @@ def get_model_tokenizer_yi_vl(model_dir: str,
     return model, tokenizer
 
 
-@register_model(
-    ModelType.minicpm_2b_sft_chat,
-    'OpenBMB/MiniCPM-2B-sft-fp32',
-    LoRATM.llama2,
-    TemplateType.minicpm,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='openbmb/MiniCPM-2B-sft-fp32')
-@register_model(
-    ModelType.minicpm_2b_chat,
-    'OpenBMB/MiniCPM-2B-dpo-fp32',
-    LoRATM.llama2,
-    TemplateType.minicpm,
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='openbmb/MiniCPM-2B-dpo-fp32')
-@register_model(
-    ModelType.minicpm_1b_sft_chat,
-    'OpenBMB/MiniCPM-1B-sft-bf16',
-    LoRATM.llama2,
-    TemplateType.minicpm,
-    requires=['transformers>=4.36.0'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='openbmb/MiniCPM-1B-sft-bf16')
-@register_model(
-    ModelType.minicpm_2b_128k,
-    'OpenBMB/MiniCPM-2B-128k',
-    LoRATM.llama2,
-    TemplateType.chatml,
-    requires=['transformers>=4.36.0'],
-    support_flash_attn=True,
-    support_vllm=True,
-    hf_model_id='openbmb/MiniCPM-2B-128k')
+class _YiVLModels(ModelFamily):
+    get_function = get_model_tokenizer_yi_vl
+    entries = (
+        ModelEntry(
+            ModelType.yi_vl_34b_chat, '01ai/Yi-VL-34B', LoRATM.llama2,
+            TemplateType.yi_vl,
+            dict(
+                support_flash_attn=True,
+                requires=['transformers>=4.34'],
+                tags=['multi-modal', 'vision'],
+                hf_model_id='01-ai/Yi-VL-34B')),
+        ModelEntry(
+            ModelType.yi_vl_6b_chat, '01ai/Yi-VL-6B', LoRATM.llama2,
+            TemplateType.yi_vl,
+            dict(
+                support_flash_attn=True,
+                requires=['transformers>=4.34'],
+                tags=['multi-modal', 'vision'],
+                hf_model_id='01-ai/Yi-VL-6B')),
+    )
+
+
 def get_model_tokenizer_minicpm(model_dir: str,
                                 torch_dtype: Dtype,
                                 model_kwargs: Dict[str, Any],
                                 load_model: bool = True,
                                 **kwargs):
-    model_config = AutoConfig.from_pretrained(
-        model_dir, trust_remote_code=True)
-    use_flash_attn = kwargs.pop('use_flash_attn', False)
-    if use_flash_attn:
-        model_config._attn_implementation = 'flash_attention_2'
+    model_config = _get_cached_config(model_dir)
+    _set_flash_attn(model_config, kwargs.pop('use_flash_attn', False))
     return get_model_tokenizer_from_repo(
         model_dir,
         torch_dtype,
@@ -3594,20 +4029,42 @@ def get_model_tokenizer_minicpm(model_dir: str,
         **kwargs)
 
 
-@register_model(
-    ModelType.minicpm_v_3b_chat,
-    'OpenBMB/MiniCPM-V',
-    LoRATM.llama2,
-    TemplateType.minicpm_v,
-    support_flash_attn=True,
-    hf_model_id='openbmb/MiniCPM-V')
-@register_model(
-    ModelType.minicpm_v_v2,
-    'OpenBMB/MiniCPM-V-2',
-    LoRATM.llama2,
-    TemplateType.minicpm_v,
-    support_flash_attn=True,
-    hf_model_id='openbmb/MiniCPM-V-2')
+class _MiniCPMModels(ModelFamily):
+    get_function = get_model_tokenizer_minicpm
+    entries = (
+        ModelEntry(
+            ModelType.minicpm_2b_sft_chat, 'OpenBMB/MiniCPM-2B-sft-fp32',
+            LoRATM.llama2, TemplateType.minicpm,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='openbmb/MiniCPM-2B-sft-fp32')),
+        ModelEntry(
+            ModelType.minicpm_2b_chat, 'OpenBMB/MiniCPM-2B-dpo-fp32',
+            LoRATM.llama2, TemplateType.minicpm,
+            dict(
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='openbmb/MiniCPM-2B-dpo-fp32')),
+        ModelEntry(
+            ModelType.minicpm_1b_sft_chat, 'OpenBMB/MiniCPM-1B-sft-bf16',
+            LoRATM.llama2, TemplateType.minicpm,
+            dict(
+                requires=['transformers>=4.36.0'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='openbmb/MiniCPM-1B-sft-bf16')),
+        ModelEntry(
+            ModelType.minicpm_2b_128k, 'OpenBMB/MiniCPM-2B-128k',
+            LoRATM.llama2, TemplateType.chatml,
+            dict(
+                requires=['transformers>=4.36.0'],
+                support_flash_attn=True,
+                support_vllm=True,
+                hf_model_id='openbmb/MiniCPM-2B-128k')),
+    )
+
+
 def get_model_tokenizer_minicpm_v(model_dir: str,
                                   torch_dtype: Dtype,
                                   model_kwargs: Dict[str, Any],
@@ -3623,6 +4080,27 @@ def get_model_tokenizer_minicpm_v(model_dir: str,
     return model, tokenizer
 
 
+class _MiniCPMVModels(ModelFamily):
+    get_function = get_model_tokenizer_minicpm_v
+    entries = (
+        ModelEntry(
+            ModelType.minicpm_v_3b_chat, 'OpenBMB/MiniCPM-V', LoRATM.llama2,
+            TemplateType.minicpm_v,
+            dict(support_flash_attn=True, hf_model_id='openbmb/MiniCPM-V')),
+        ModelEntry(
+            ModelType.minicpm_v_v2, 'OpenBMB/MiniCPM-V-2', LoRATM.llama2,
+            TemplateType.minicpm_v,
+            dict(support_flash_attn=True, hf_model_id='openbmb/MiniCPM-V-2')),
+    )
+
+
+@lru_cache()
+def _snapshot_download_once(model_id: str) -> str:
+    # shared assets (e.g. the clip vision tower) of several model types
+    from modelscope import snapshot_download
+    return snapshot_download(model_id)
+
+
 def _patch_llava(model):
     if hasattr(model, '__old_generate'):
         return
@@ -3639,26 +4117,6 @@ def _patch_llava(model):
     model.generate = _new_generate
 
 
-@register_model(
-    ModelType.llava1d6_yi_34b_instruct,
-    'AI-ModelScope/llava-v1.6-34b',
-    LoRATM.llama2,
-    TemplateType.llava_yi_instruct,
-    eos_token='<|im_end|>',
-    support_flash_attn=True,
-    function_kwargs={'llm_model_type': 'llama'},
-    tags=['multi-modal', 'vision'],
-    hf_model_id='liuhaotian/llava-v1.6-34b')
-@register_model(
-    ModelType.llava1d6_mistral_7b_instruct,
-    'AI-ModelScope/llava-v1.6-mistral-7b',
-    LoRATM.llama2,
-    TemplateType.llava_mistral_instruct,
-    requires=['transformers>=4.34'],
-    support_flash_attn=True,
-    function_kwargs={'llm_model_type': 'mistral'},
-    tags=['multi-modal', 'vision'],
-    hf_model_id='liuhaotian/llava-v1.6-mistral-7b')
 def get_model_tokenizer_llava(model_dir: str,
                               torch_dtype: Dtype,
                               model_kwargs: Dict[str, Any],
@@ -3666,7 +4124,8 @@ def get_model_tokenizer_llava(model_dir: str,
                               **kwargs):
     local_repo_path = _git_clone_github(
         'https://github.com/haotian-liu/LLaVA.git')
-    sys.path.append(os.path.join(local_repo_path))
+    if local_repo_path not in sys.path:
+        sys.path.append(local_repo_path)
 
     llm_model_type = kwargs.pop('llm_model_type')
     if llm_model_type == 'mistral':
@@ -3688,7 +4147,7 @@ def get_model_tokenizer_llava(model_dir: str,
             LlavaLlamaForCausalLM.forward = _new_forward
         model_config = LlavaConfig.from_pretrained(model_dir)
         automodel_class = LlavaLlamaForCausalLM
-    model_config.mm_vision_tower = snapshot_download(
+    model_config.mm_vision_tower = _snapshot_download_once(
         'AI-ModelScope/clip-vit-large-patch14-336')
     model, tokenizer = get_model_tokenizer_with_flash_attn(
         model_dir,
@@ -3700,7 +4159,8 @@ def get_model_tokenizer_llava(model_dir: str,
         **kwargs)
 
     if model is not None:
-        model.resize_token_embeddings(len(tokenizer))
+        if model.get_input_embeddings().weight.shape[0] != len(tokenizer):
+            model.resize_token_embeddings(len(tokenizer))
         vision_tower = model.get_vision_tower()
         device_map = str(model_kwargs.get('device_map', str(model.device)))
         if not vision_tower.is_loaded:
@@ -3711,31 +4171,31 @@ def get_model_tokenizer_llava(model_dir: str,
     return model, tokenizer
 
 
-@register_model(
-    ModelType.mplug_owl2_chat,
-    'iic/mPLUG-Owl2',
-    LoRATM.mplug_owl2,
-    TemplateType.mplug_owl2,
-    requires=['transformers<4.35', 'icecream'],
-    eos_token='</s>',
-    function_kwargs={
-        'get_model_tokenizer_function': get_model_tokenizer_with_flash_attn
-    },
-    support_flash_attn=True,
-    hf_model_id='MAGAer13/mplug-owl2-llama2-7b')
-@register_model(
-    ModelType.mplug_owl2d1_chat,
-    'iic/mPLUG-Owl2.1',
-    LoRATM.mplug_owl2d1,
-    TemplateType.mplug_owl2,
-    requires=['transformers<4.35', 'icecream'],
-    eos_token='<|endoftext|>',
-    function_kwargs={
-        'vocab_size': 151851,
-        'get_model_tokenizer_function': get_model_tokenizer_qwen
-    },
-    support_flash_attn=True,
-    hf_model_id='Mizukiluke/mplug_owl_2_1')
+class _LlavaModels(ModelFamily):
+    get_function = get_model_tokenizer_llava
+    entries = (
+        ModelEntry(
+            ModelType.llava1d6_yi_34b_instruct, 'AI-ModelScope/llava-v1.6-34b',
+            LoRATM.llama2, TemplateType.llava_yi_instruct,
+            dict(
+                eos_token='<|im_end|>',
+                support_flash_attn=True,
+                function_kwargs={'llm_model_type': 'llama'},
+                tags=['multi-modal', 'vision'],
+                hf_model_id='liuhaotian/llava-v1.6-34b')),
+        ModelEntry(
+            ModelType.llava1d6_mistral_7b_instruct,
+            'AI-ModelScope/llava-v1.6-mistral-7b', LoRATM.llama2,
+            TemplateType.llava_mistral_instruct,
+            dict(
+                requires=['transformers>=4.34'],
+                support_flash_attn=True,
+                function_kwargs={'llm_model_type': 'mistral'},
+                tags=['multi-modal', 'vision'],
+                hf_model_id='liuhaotian/llava-v1.6-mistral-7b')),
+    )
+
+
 def get_model_tokenizer_mplug_owl2(model_dir: str,
                                    torch_dtype: Dtype,
                                    model_kwargs: Dict[str, Any],
@@ -3743,14 +4203,14 @@ def get_model_tokenizer_mplug_owl2(model_dir: str,
                                    **kwargs):
     local_repo_path = _git_clone_github('https://github.com/X-PLUG/mPLUG-Owl')
     local_repo_path = os.path.join(local_repo_path, 'mPLUG-Owl2')
-    sys.path.append(os.path.join(local_repo_path))
+    if local_repo_path not in sys.path:
+        sys.path.append(local_repo_path)
 
     # register
     # https://github.com/X-PLUG/mPLUG-Owl/blob/main/mPLUG-Owl2/mplug_owl2/model/modeling_mplug_owl2.py#L447
     from mplug_owl2 import MPLUGOwl2LlamaForCausalLM
     from transformers.models.clip.image_processing_clip import CLIPImageProcessor
-    model_config = AutoConfig.from_pretrained(
-        model_dir, trust_remote_code=True)
+    model_config = _get_cached_config(model_dir)
     vocab_size = kwargs.pop('vocab_size', None)
     if vocab_size is not None:
         model_config.vocab_size = vocab_size
@@ -3768,20 +4228,61 @@ def get_model_tokenizer_mplug_owl2(model_dir: str,
     return model, tokenizer
 
 
+class _MPlugOwl2Models(ModelFamily):
+    get_function = get_model_tokenizer_mplug_owl2
+    entries = (
+        ModelEntry(
+            ModelType.mplug_owl2_chat, 'iic/mPLUG-Owl2', LoRATM.mplug_owl2,
+            TemplateType.mplug_owl2,
+            dict(
+                requires=['transformers<4.35', 'icecream'],
+                eos_token='</s>',
+                function_kwargs={
+                    'get_model_tokenizer_function':
+                    get_model_tokenizer_with_flash_attn
+                },
+                support_flash_attn=True,
+                hf_model_id='MAGAer13/mplug-owl2-llama2-7b')),
+        ModelEntry(
+            ModelType.mplug_owl2d1_chat, 'iic/mPLUG-Owl2.1',
+            LoRATM.mplug_owl2d1, TemplateType.mplug_owl2,
+            dict(
+                requires=['transformers<4.35', 'icecream'],
+                eos_token='<|endoftext|>',
+                function_kwargs={
+                    'vocab_size': 151851,
+                    'get_model_tokenizer_function': get_model_tokenizer_qwen
+                },
+                support_flash_attn=True,
+                hf_model_id='Mizukiluke/mplug_owl_2_1')),
+    )
+
+
+# model class -> whether its `_set_gradient_checkpointing` still takes `value`
+_OLD_SET_GC_CLASSES: 'WeakKeyDictionary[Type, bool]' = WeakKeyDictionary()
+
+
 def fix_transformers_upgrade(module: PreTrainedModel) -> None:
     # from 4.35, transformers changes its arguments of _set_gradient_checkpointing
-    if version.parse(transformers.__version__) >= version.parse('4.35'):
-        if isinstance(module, PreTrainedModel) and hasattr(module, '_set_gradient_checkpointing') \
-                and 'value' in inspect.signature(module._set_gradient_checkpointing).parameters.keys():
-            module._set_gradient_checkpointing = MethodType(
-                PreTrainedModel._set_gradient_checkpointing, module)
+    if not _transformers_version_ge('4.35') or not isinstance(
+            module, PreTrainedModel):
+        return
+    module_cls = module.__class__
+    is_old = _OLD_SET_GC_CLASSES.get(module_cls)
+    if is_old is None:  # inspect.signature is slow, check once per class
+        set_gc = getattr(module_cls, '_set_gradient_checkpointing', None)
+        is_old = set_gc is not None and 'value' in inspect.signature(
+            set_gc).parameters
+        _OLD_SET_GC_CLASSES[module_cls] = is_old
+    if is_old:
+        module._set_gradient_checkpointing = MethodType(
+            PreTrainedModel._set_gradient_checkpointing, module)
 
 
 def fix_gradient_checkpointing_warning() -> None:
-    torch_version = version.parse(torch.__version__)
-    if torch_version < version.parse('2'):
+    if not _torch_version_ge('2'):
         return
-    elif torch_version < version.parse('2.1'):
+    elif not _torch_version_ge('2.1'):
         # fix https://github.com/Dao-AILab/flash-attention/issues/341
         use_reentrant = True
     else:
@@ -3791,25 +4292,74 @@ def fix_gradient_checkpointing_warning() -> None:
                    '_old_checkpoint'):  # avoid double patching
 
         torch.utils.checkpoint._old_checkpoint = _old_checkpoint
+        # an explicit `use_reentrant` passed by the caller still wins
         torch.utils.checkpoint.checkpoint = update_wrapper(
-            lambda *args, use_reentrant=use_reentrant, **kwargs:
-            _old_checkpoint(*args, use_reentrant=use_reentrant, **kwargs),
+            partial(_old_checkpoint, use_reentrant=use_reentrant),
             _old_checkpoint)
     try:
         import transformers.modeling_utils
         if hasattr(transformers.modeling_utils, 'checkpoint'):
-            transformers.modeling_utils.checkpoint = (
-                lambda *args, use_reentrant=use_reentrant, **kwargs:
-                _old_checkpoint(*args, use_reentrant=use_reentrant, **kwargs))
+            transformers.modeling_utils.checkpoint = partial(
+                _old_checkpoint, use_reentrant=use_reentrant)
     except ImportError:
         pass
 
 
+def _hf_download_weight_shards(model_id: str, revision: str,
+                               ignore_patterns: Optional[List[str]]) -> None:
+    """Split the weight shards of a multi-shard hf repo across the local ranks,
+    so that they are fetched in parallel into the shared cache before the
+    snapshot_download of the local master."""
+    from huggingface_hub import (HfApi, hf_hub_download, snapshot_download,
+                                 try_to_load_from_cache)
+    from huggingface_hub.utils import filter_repo_objects
+    _, local_rank, _, local_world_size = get_dist_setting()
+    try:
+        # the hub errors (offline, http, not cached) are all OSError
+        snapshot_download(
+            model_id,
+            revision=revision,
+            ignore_patterns=ignore_patterns,
+            local_files_only=True)
+        is_cached = True
+    except OSError:
+        is_cached = False
+    if not is_cached:
+        try:
+            files = HfApi().list_repo_files(model_id, revision=revision)
+        except OSError as e:
+            # leave it to the snapshot_download of the local master
+            logger.warning(f'Cannot list the files of {model_id}: {e}')
+            files = []
+        files = list(
+            filter_repo_objects(files, ignore_patterns=ignore_patterns))
+        weight_files = [f for f in files if f.endswith('.safetensors')]
+        if len(weight_files) == 0:  # prefer safetensors, fall back to bin
+            weight_files = [f for f in files if f.endswith('.bin')]
+        # only the missing shards
+        weight_files = [
+            f for f in weight_files if not isinstance(
+                try_to_load_from_cache(model_id, f, revision=revision), str)
+        ]
+        for fname in weight_files[local_rank::local_world_size]:
+            try:
+                hf_hub_download(model_id, fname, revision=revision)
+            except OSError as e:  # every rank has to reach the barrier
+                logger.warning(f'Cannot download {fname}: {e}')
+                break
+    dist.barrier()
+
+
+# (model_id, revision, use_hf) -> model_dir of a finished hub download
+_DOWNLOADED_MODEL_DIRS: Dict[Tuple[str, Optional[str], bool], str] = {}
+
+
 def safe_snapshot_download(model_type: str,
                            model_id_or_path: Optional[str] = None,
                            revision: Optional[str] = None,
                            **kwargs) -> str:
     # Perform snapshot_download (ms or hf) based on model_type and model_id_or_path.
+    from modelscope import snapshot_download
     model_info = MODEL_MAPPING[model_type]
     use_hf = strtobool(os.environ.get('USE_HF', 'False'))
     if model_id_or_path is None:
@@ -3819,7 +4369,18 @@ def safe_snapshot_download(model_type: str,
         else:
             model_id_or_path = model_info[
                 'hf_model_id' if use_hf else 'model_id_or_path']
-
+    key = (model_id_or_path, revision, use_hf)
+    model_dir = _DOWNLOADED_MODEL_DIRS.get(key)
+    if model_dir is not None:
+        # every rank resolves the same models in the same order, so all of
+        # them skip the barriers in safe_ddp_context together
+        return model_dir
+
+    if (use_hf and is_dist() and get_dist_setting()[3] > 1
+            and model_id_or_path is not None
+            and not os.path.exists(model_id_or_path)):
+        _hf_download_weight_shards(model_id_or_path, revision or 'main',
+                                   model_info['ignore_file_pattern'])
     with safe_ddp_context():
         if model_id_or_path is not None and not os.path.exists(
                 model_id_or_path):
@@ -3851,25 +4412,52 @@ def safe_snapshot_download(model_type: str,
                     model_id_or_path,
                     revision,
                     ignore_file_pattern=ignore_file_pattern)
+            downloaded = True
         else:
             model_dir = model_id_or_path
+            downloaded = False
         logger.info(f'Loading the model using model_dir: {model_dir}')
 
     model_dir = os.path.expanduser(model_dir)
     assert os.path.isdir(model_dir), f'model_dir: {model_dir}'
+    if downloaded:
+        _DOWNLOADED_MODEL_DIRS[key] = model_dir
     return model_dir
 
 
-def get_torch_dtype(model_dir: str) -> Dtype:
+@lru_cache(maxsize=32)
+def _load_torch_dtype(model_dir: str, mtime: Optional[int]) -> Optional[Dtype]:
     model_config = PretrainedConfig.get_config_dict(model_dir)[0]
-    torch_dtype = model_config.get('torch_dtype', None)
-    if isinstance(torch_dtype, str):
-        torch_dtype = eval(f'torch.{torch_dtype}')
+    return _to_torch_dtype(model_config.get('torch_dtype', None))
+
+
+def get_torch_dtype(model_dir: str) -> Dtype:
+    torch_dtype = _load_torch_dtype(model_dir,
+                                    _get_mtime(model_dir, 'config.json'))
     if torch_dtype == torch.float32:
-        torch_dtype = torch.float16
+        # bf16 has the range of fp32, so it is preferred where it is supported
+        torch_dtype = (
+            torch.bfloat16 if is_torch_bf16_gpu_available() else torch.float16)
     return torch_dtype
 
 
+@lru_cache()
+def _is_flash_attn_2_usable(torch_dtype: Optional[Dtype]) -> bool:
+    # Used when `use_flash_attn` is not specified: flash-attn 2 needs
+    # fp16/bf16 and an Ampere or newer GPU.
+    if torch_dtype not in {torch.float16, torch.bfloat16}:
+        return False
+    if not torch.cuda.is_available():
+        return False
+    if torch.cuda.get_device_capability()[0] < 8:
+        return False
+    try:
+        from transformers.utils import is_flash_attn_2_available
+    except ImportError:  # transformers<4.36
+        return False
+    return is_flash_attn_2_available()
+
+
 def get_model_tokenizer(
         model_type: str,
         torch_dtype: Optional[Dtype] = None,
@@ -3881,8 +4469,9 @@ def get_model_tokenizer(
         **kwargs) -> Tuple[Optional[PreTrainedModel], PreTrainedTokenizerBase]:
     """
     torch_dtype: If you use None, it will retrieve the torch_dtype from the config.json file.
-        However, if torch.float32 is retrieved, torch.float16 will be used.
+        However, if torch.float32 is retrieved, torch.bfloat16 will be used (torch.float16 if bf16 is not supported).
     """
+    from modelscope import BitsAndBytesConfig, GenerationConfig
     model_dir = kwargs.pop('model_dir', None)  # compat with swift<1.7
     model_dir = safe_snapshot_download(
         model_type, model_id_or_path, revision=revision, model_dir=model_dir)
@@ -3890,8 +4479,12 @@ def get_model_tokenizer(
     model_info = MODEL_MAPPING[model_type]
     requires = model_info['requires']
     for require in requires:
-        require_version(require)
+        _require_version(require)
     get_function = model_info['get_function']
+    function_kwargs = model_info.get('function_kwargs')
+    if function_kwargs:
+        # kwargs passed by the caller take precedence over the registered ones
+        kwargs = {**function_kwargs, **kwargs}
     if model_kwargs is None:
         model_kwargs = {}
     if 'device_map' not in model_kwargs and not use_torchacc():
@@ -3915,6 +4508,11 @@ def get_model_tokenizer(
                 logger.info(
                     f'Setting quantization_config.bnb_4bit_compute_dtype: {torch_dtype}'
                 )
+    if (kwargs.get('use_flash_attn') is None
+            and model_info.get('support_flash_attn', False)
+            and _is_flash_attn_2_usable(torch_dtype)):
+        kwargs['use_flash_attn'] = True
+        logger.info('Setting use_flash_attn: True')
     kwargs['eos_token'] = model_info['eos_token']
     if 'is_training' not in kwargs:
         kwargs['is_training'] = False
@@ -3947,6 +4545,16 @@ def get_model_tokenizer(
                 and generation_config.do_sample is False):
             model.generation_config.do_sample = True
             logger.warning('Setting model.generation_config.do_sample: True')
+        if not kwargs['is_training']:
+            model_config = model.config
+            if getattr(model_config, 'use_cache', None) is False:
+                # the kv cache is what makes decoding fast
+                model_config.use_cache = True
+                logger.info('Setting model.config.use_cache: True')
+            if getattr(model_config, 'pretraining_tp', 1) > 1:
+                # >1 splits each linear layer into slices (llama)
+                model_config.pretraining_tp = 1
+                logger.info('Setting model.config.pretraining_tp: 1')
     return model, tokenizer
 
 
@@ -3966,5 +4574,6 @@ def get_default_template_type(model_type: str) -> Optional[str]:
     return MODEL_MAPPING[model_type].get('template')
 
 
-def get_default_lora_target_modules(model_type: str) -> Optional[List[str]]:
+def get_default_lora_target_modules(
+        model_type: str) -> Optional[Tuple[str, ...]]:
     return MODEL_MAPPING[model_type].get('lora_target_modules')
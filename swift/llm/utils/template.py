@@ -100,24 +100,34 @@ class StopWordsCriteria(StoppingCriteria):
         self.stop_words = stop_words
         self.tokenizer_kwargs = tokenizer_kwargs
         self.start_idx = -1
+        self.is_stopped = None  # batch inference
 
-    def __call__(self, input_ids: Tensor, scores: Tensor) -> bool:
-        if self.start_idx == -1:
-            self.start_idx = len(input_ids[0]) - 1
+    def _is_stop(self, input_ids: Tensor) -> bool:
         tokenizer = self.tokenizer
         stop_words = self.stop_words
-        text = tokenizer.decode(input_ids[0, self.start_idx:],
+        text = tokenizer.decode(input_ids[self.start_idx:],
                                 **self.tokenizer_kwargs)
         for stop_word in stop_words:
             if isinstance(stop_word, str):
                 if stop_word in text:
                     return True
             else:  # list
-                if len(stop_word) > 0 and input_ids[0].tolist(
+                if len(stop_word) > 0 and input_ids.tolist(
                 )[-len(stop_word):] == stop_word:
                     return True
         return False
 
+    def __call__(self, input_ids: Tensor, scores: Tensor) -> bool:
+        if self.start_idx == -1:
+            self.start_idx = len(input_ids[0]) - 1
+            self.is_stopped = [False] * input_ids.shape[0]
+        is_stopped = self.is_stopped
+        for i in range(input_ids.shape[0]):
+            if not is_stopped[i]:
+                is_stopped[i] = self._is_stop(input_ids[i])
+        # The batch stops once all the sequences have stopped.
+        return all(is_stopped)
+
 
 def _has_system(prefix: Prompt) -> bool:
     for p in prefix:
@@ -453,6 +453,7 @@ class TokenListIteratorStreamer(BaseStreamer):
             return value
 
 
+@torch.no_grad()
 def inference_stream(model: PreTrainedModel,
                      template: Template,
                      query: str,
@@ -546,12 +547,11 @@ def inference_stream(model: PreTrainedModel,
         'stopping_criteria': stopping_criteria,
         **inputs
     }
-    _model_generate = model.generate
-    if is_torch_npu_available():
 
-        def _model_generate(*args, **kwargs):
+    def _model_generate(*args, **kwargs):
+        if is_torch_npu_available():
             torch.npu.set_device(model.device)
-            return model.generate(*args, **kwargs)
+        return model.generate(*args, **kwargs)
 
     thread = Thread(target=_model_generate, kwargs=generation_kwargs)
     thread.start()
@@ -587,6 +587,7 @@ def inference_stream(model: PreTrainedModel,
         yield response, history
 
 
+@torch.no_grad()
 def inference(model: PreTrainedModel,
               template: Template,
               query: str,
@@ -600,9 +601,12 @@ def inference(model: PreTrainedModel,
               prompt_prefix: str = '[PROMPT]',
               output_prefix: str = '[OUTPUT]',
               generation_info: Optional[Dict[str, int]] = None,
+              encoded_inputs: Optional[Tuple[Dict[str, Any],
+                                             Dict[str, Any]]] = None,
               **kwargs) -> Tuple[str, History]:
     """
     generation_config: Priority: generation_config > model.generation_config.
+    encoded_inputs: The result of `template.encode` for the same example, e.g. prefetched in another thread.
     """
     if stop_words is None:
         stop_words = []
@@ -624,7 +628,9 @@ def inference(model: PreTrainedModel,
         'images': kwargs.pop('images', None)  # for vl. str.
     }
     template.model = model
-    inputs, tokenizer_kwargs = template.encode(example)
+    if encoded_inputs is None or is_observation:
+        encoded_inputs = template.encode(example)
+    inputs, tokenizer_kwargs = encoded_inputs
     if len(inputs) == 0:
         raise ValueError(
             'input_ids exceeds `max_length`. Please increase the value of `max_length`.'
@@ -709,6 +715,158 @@ def inference(model: PreTrainedModel,
     return response, history
 
 
+# The remote code of these models builds `position_ids` with a plain arange per row
+# instead of from the attention_mask, so the left-padded rows would be shifted (chatglm2/3, codegeex2).
+_LEFT_PADDING_UNSUPPORTED_MODEL_TYPES = {'chatglm'}
+
+
+def _support_batch_inference(model: PreTrainedModel, template: Template,
+                             request_list: List[Dict[str, Any]]) -> bool:
+    template_cls = type(template)
+    # The overridden `encode` may return more than `input_ids` (audio_info, token_type_ids, images, ...).
+    if (template_cls.encode is not Template.encode
+            or template_cls.get_generate_ids is not Template.get_generate_ids):
+        return False
+    model_type = getattr(model.config, 'model_type', None)
+    if model_type in _LEFT_PADDING_UNSUPPORTED_MODEL_TYPES:
+        return False
+    for request in request_list:
+        if request.get('images') is not None:
+            return False
+        history = request.get('history')
+        if history and history[-1][-1] and history[-1][-1].endswith(
+                'Observation:'):
+            return False
+    return True
+
+
+def _find_stop_idx(generate_ids: List[int], stop_words: StopWords,
+                   eos_token_id: Optional[int]) -> int:
+    """return: the length of generate_ids to keep (including the stop token)."""
+    stop_idx = len(generate_ids)
+    if eos_token_id is not None and eos_token_id in generate_ids:
+        stop_idx = generate_ids.index(eos_token_id) + 1
+    for stop_word in stop_words:
+        if isinstance(stop_word, str) or len(stop_word) == 0:
+            continue
+        n = len(stop_word)
+        for i in range(min(stop_idx, len(generate_ids) - n + 1)):
+            if generate_ids[i:i + n] == stop_word:
+                stop_idx = i + n
+                break
+    return stop_idx
+
+
+@torch.no_grad()
+def inference_batch(model: PreTrainedModel,
+                    template: Template,
+                    request_list: List[Dict[str, Any]],
+                    *,
+                    generation_config: Optional[GenerationConfig] = None,
+                    stop_words: Optional[StopWords] = None,
+                    **kwargs) -> List[Dict[str, Any]]:
+    """
+    request_list: e.g. [{'query': 'hello!'}].
+        The keys that can be included are: 'query', 'history', 'system'.
+    generation_config: Priority: generation_config > model.generation_config.
+    return: e.g. [{'response': 'hi!', 'history': [('hello!', 'hi!')]}].
+        The keys to be included will be: 'response', 'history'.
+    """
+    if stop_words is None:
+        stop_words = []
+    else:
+        stop_words = stop_words.copy()
+    if not _support_batch_inference(model, template, request_list):
+        # multi-modal, agent or chatglm requests: fallback to one-by-one inference.
+        resp_list = []
+        for request in request_list:
+            response, history = inference(
+                model,
+                template,
+                generation_config=generation_config,
+                stop_words=stop_words,
+                **request)
+            resp_list.append({'response': response, 'history': history})
+        return resp_list
+
+    template.model = model
+    tokenizer = template.tokenizer
+    input_ids_list, history_list = [], []
+    tokenizer_kwargs = {}
+    for request in request_list:
+        history = request.get('history')
+        history = [] if history is None else deepcopy(history)
+        example = {
+            'query': request.get('query'),
+            'history': history,
+            'system': request.get('system')
+        }
+        inputs, tokenizer_kwargs = template.encode(example)
+        if len(inputs) == 0:
+            raise ValueError(
+                'input_ids exceeds `max_length`. Please increase the value of `max_length`.'
+            )
+        input_ids_list.append(inputs['input_ids'])
+        history_list.append(history)
+    pad_token_id = tokenizer.pad_token_id
+    if pad_token_id is None:
+        pad_token_id = tokenizer.eos_token_id
+    # left padding
+    token_len = max(len(input_ids) for input_ids in input_ids_list)
+    input_ids = torch.tensor([[pad_token_id] *
+                              (token_len - len(input_ids)) + input_ids
+                              for input_ids in input_ids_list])
+    attention_mask = torch.tensor([[0] * (token_len - len(input_ids))
+                                   + [1] * len(input_ids)
+                                   for input_ids in input_ids_list])
+    model.eval()
+    if generation_config is None:
+        generation_config = getattr(model, 'generation_config', None)
+    generation_config = deepcopy(generation_config)
+    if tokenizer.eos_token_id is not None:
+        generation_config.eos_token_id = tokenizer.eos_token_id
+    generation_config.pad_token_id = pad_token_id
+    if tokenizer.bos_token_id is not None:
+        generation_config.bos_token_id = tokenizer.bos_token_id
+    if generation_config.max_new_tokens is not None:
+        generation_config.max_length = 20  # fix max_length, max_new_tokens warning
+        max_length = get_max_model_len(model.config)
+        if max_length and token_len + generation_config.max_new_tokens > max_length:
+            generation_config.max_new_tokens = max_length - token_len
+            if generation_config.max_new_tokens <= 0:
+                raise AssertionError('Current sentence length exceeds'
+                                     f'the model max_length: {max_length}')
+    if template.suffix[-1] not in stop_words:
+        stop_words.append(template.suffix[-1])
+    stopping_criteria = StoppingCriteriaList(
+        [StopWordsCriteria(tokenizer, stop_words, **tokenizer_kwargs)])
+    device = next(model.parameters()).device
+    generate_ids = model.generate(
+        input_ids=input_ids.to(device),
+        attention_mask=attention_mask.to(device),
+        generation_config=generation_config,
+        stopping_criteria=stopping_criteria)
+    generate_ids = generate_ids[:, token_len:].tolist()
+
+    resp_list = []
+    for request, history, gen_ids in zip(request_list, history_list,
+                                         generate_ids):
+        # The finished sequences are still padded until the whole batch stops.
+        gen_ids = gen_ids[:_find_stop_idx(gen_ids, stop_words, tokenizer.
+                                          eos_token_id)]
+        response = template.generate_ids_to_response(
+            gen_ids, tokenizer_kwargs=tokenizer_kwargs)
+        for stop_word in stop_words:
+            if isinstance(stop_word, str) and stop_word in response:
+                response = response[:response.find(stop_word) + len(stop_word)]
+        suffix = template.suffix[-1]
+        if isinstance(suffix, str) and response.endswith(suffix):
+            response = response[:-len(suffix)]
+        history.append([request.get('query'), response])
+        resp_list.append({'response': response, 'history': history})
+    return resp_list
+
+
 def limit_history_length(template: Template, query: str,
                          history: Optional[History],
                          max_length: Optional[int]) -> Tuple[History, History]:
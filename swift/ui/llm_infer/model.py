@@ -95,7 +95,8 @@ class Model(BaseUI):
             model_type = gr.Dropdown(
                 elem_id='model_type',
                 choices=[base_tab.locale('checkpoint', cls.lang)['value']]
-                + ModelType.get_model_name_list() + cls.get_custom_name_list(),
+                + list(ModelType.get_model_name_list())
+                + cls.get_custom_name_list(),
                 value=base_tab.locale('checkpoint', cls.lang)['value'],
                 scale=20)
             model_id_or_path = gr.Textbox(
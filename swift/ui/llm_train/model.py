@@ -63,7 +63,7 @@ class Model(BaseUI):
         with gr.Row():
             model_type = gr.Dropdown(
                 elem_id='model_type',
-                choices=ModelType.get_model_name_list()
+                choices=list(ModelType.get_model_name_list())
                 + cls.get_custom_name_list(),
                 scale=20)
             model_id_or_path = gr.Textbox(
@@ -1,9 +1,14 @@
 import os
+import tempfile
 import unittest
+from copy import copy
+
+import torch
 
 from swift.llm import (ModelType, get_default_template_type,
                        get_model_tokenizer, get_template, inference,
-                       inference_stream, limit_history_length, print_example)
+                       inference_batch, inference_stream, limit_history_length,
+                       print_example)
 from swift.utils import lower_bound, seed_everything
 
 
@@ -50,6 +55,199 @@ class TestLlmUtils(unittest.TestCase):
             self.assertTrue(gen_text_stream == gen_text_stream2 == gen_text)
             self.assertTrue(history == history2 == history3)
 
+    def test_inference_batch(self):
+        model_type = ModelType.qwen1half_0_5b_chat
+        model, tokenizer = get_model_tokenizer(model_type)
+        template_type = get_default_template_type(model_type)
+        template = get_template(template_type, tokenizer)
+        model.generation_config.max_new_tokens = 64
+        model.generation_config.do_sample = False
+        request_list = [{
+            'query': '你好'
+        }, {
+            'query': '浙江的省会在哪里？'
+        }, {
+            'query': '那它有什么好玩的？',
+            'history': [['浙江的省会在哪里？', '浙江的省会是杭州。']]
+        }]
+        resp_list = inference_batch(model, template, request_list)
+        for request, resp in zip(request_list, resp_list):
+            response, history = inference(model, template, **request)
+            print(f'[RESPONSE]: {resp["response"]}')
+            self.assertTrue(resp['response'] == response)
+            self.assertTrue(resp['history'] == history)
+
+    def test_support_batch_inference(self):
+        from types import SimpleNamespace
+        from swift.llm.utils.utils import _support_batch_inference
+        model_type = ModelType.qwen1half_0_5b_chat
+        _, tokenizer = get_model_tokenizer(model_type, load_model=False)
+        template = get_template(
+            get_default_template_type(model_type), tokenizer)
+        request_list = [{'query': 'hello'}]
+        qwen2 = SimpleNamespace(config=SimpleNamespace(model_type='qwen2'))
+        chatglm = SimpleNamespace(config=SimpleNamespace(model_type='chatglm'))
+        self.assertTrue(
+            _support_batch_inference(qwen2, template, request_list))
+        # chatglm2/3 build their position_ids without the attention_mask
+        self.assertFalse(
+            _support_batch_inference(chatglm, template, request_list))
+        self.assertFalse(
+            _support_batch_inference(qwen2, template, [{
+                'query': 'hello',
+                'images': ['cat.png']
+            }]))
+        # e.g. qwen-audio, yi-vl, cogagent, mplug-owl2
+        template_cls = type(template)
+        encode_template = copy(template)
+        encode_template.__class__ = type('EncodeTemplate', (template_cls, ), {
+            'encode':
+            lambda self, example: template_cls.encode(self, example)
+        })
+        self.assertFalse(
+            _support_batch_inference(qwen2, encode_template, request_list))
+        self.assertFalse(
+            _support_batch_inference(
+                qwen2, template,
+                [{
+                    'query': 'hello',
+                    'history': [['hi', 'Action: search\nObservation:']]
+                }]))
+
+    def test_find_stop_idx(self):
+        from swift.llm.utils.utils import _find_stop_idx
+        # eos: kept, and the padding after it is dropped
+        self.assertTrue(_find_stop_idx([5, 6, 2, 0, 0], [], 2) == 3)
+        # token stop words, the earliest match wins
+        self.assertTrue(_find_stop_idx([5, 7, 8, 6, 2], [[7, 8]], 2) == 3)
+        self.assertTrue(_find_stop_idx([5, 6, 2, 7, 8], [[7, 8]], 2) == 3)
+        # str stop words are handled on the decoded response
+        self.assertTrue(_find_stop_idx([5, 6, 7], ['abc', []], None) == 3)
+        self.assertTrue(_find_stop_idx([], [[7]], 2) == 0)
+
+    def test_stop_words_criteria(self):
+        from swift.llm.utils.template import StopWordsCriteria
+        _, tokenizer = get_model_tokenizer(
+            ModelType.qwen1half_0_5b_chat, load_model=False)
+        stop_word = tokenizer.encode('<|im_end|>')
+        criteria = StopWordsCriteria(tokenizer, [stop_word])
+        prompt = [[100, 200], [100, 200]]
+        row0 = [300] + stop_word
+        row1 = [300, 400]
+        input_ids = torch.tensor([prompt[0] + row0, prompt[1] + row1])
+        self.assertFalse(criteria(input_ids[:, :3], None))  # prompt + 1 token
+        self.assertFalse(criteria(input_ids, None))
+        self.assertTrue(criteria.is_stopped == [True, False])
+        # row 0 stays stopped, whatever it generates afterwards
+        input_ids = torch.tensor(
+            [prompt[0] + row0 + [500], prompt[1] + row1 + stop_word])
+        self.assertTrue(criteria(input_ids, None))
+        self.assertTrue(criteria.is_stopped == [True, True])
+
+    def test_prefetched_encode(self):
+        from swift.llm.infer import _iter_encoded_dataset
+        model_type = ModelType.qwen_7b_chat
+        model, tokenizer = get_model_tokenizer(model_type)
+        template_type = get_default_template_type(model_type)
+        template = get_template(template_type, tokenizer)
+        model.generation_config.max_new_tokens = 64
+        model.generation_config.do_sample = False
+        dataset = [{'query': query} for query in ['你好', 'hello', '浙江的省会在哪里？']]
+        for data, kwargs, encoded_future in _iter_encoded_dataset(
+                template, dataset, [], prefetch_factor=2):
+            self.assertTrue(encoded_future is not None)
+            response, _ = inference(
+                model,
+                template,
+                encoded_inputs=encoded_future.result(),
+                **kwargs)
+            response2, _ = inference(model, template, **kwargs)
+            print(f'[RESPONSE]: {response}')
+            self.assertTrue(response == response2)
+
+    def test_fast_load_round_trip(self):
+        from transformers import (AutoModelForCausalLM, GenerationConfig,
+                                  LlamaConfig)
+        from swift.llm.utils.model import (_fast_load_model,
+                                           _save_fast_load_cache)
+        config = LlamaConfig(
+            vocab_size=128,
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=2,
+            num_attention_heads=4,
+            num_key_value_heads=4)
+        model = AutoModelForCausalLM.from_config(config)
+        generation_config = GenerationConfig(
+            do_sample=True, temperature=0.6, top_p=0.9, eos_token_id=2)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model.save_pretrained(tmp_dir)
+            generation_config.save_pretrained(tmp_dir)
+            cache_path = os.path.join(tmp_dir, 'fast_load', 'model.pt')
+            _save_fast_load_cache(model, cache_path)
+            model2 = _fast_load_model(AutoModelForCausalLM, config,
+                                      torch.float32, cache_path, 'cpu',
+                                      tmp_dir)
+            state_dict, state_dict2 = model.state_dict(), model2.state_dict()
+            self.assertTrue(state_dict.keys() == state_dict2.keys())
+            for key, value in state_dict.items():
+                self.assertTrue(torch.equal(value, state_dict2[key]))
+            for key, value in model.named_buffers():
+                self.assertTrue(torch.equal(value, model2.get_buffer(key)))
+            self.assertTrue(model2.generation_config.to_dict(
+            ) == GenerationConfig.from_pretrained(tmp_dir).to_dict())
+            self.assertTrue(model2.generation_config.do_sample is True)
+
+    def test_norm_head_linear(self):
+        import torch.nn.functional as F
+        from swift.llm.utils.model import _NormHeadLinear
+
+        def norm_head_linear(hidden_states, weight):
+            rnorm = weight.detach().norm(dim=1).reciprocal()
+            return _NormHeadLinear.apply(hidden_states, weight, rnorm)
+
+        for weight_requires_grad in [True, False]:
+            hidden_states = torch.randn(
+                2, 3, 8, dtype=torch.float64, requires_grad=True)
+            weight = torch.randn(
+                16, 8, dtype=torch.float64, requires_grad=weight_requires_grad)
+            self.assertTrue(
+                torch.autograd.gradcheck(norm_head_linear,
+                                         (hidden_states, weight)))
+            # against autograd through the normalized weight
+            logits = norm_head_linear(hidden_states, weight)
+            logits2 = F.linear(hidden_states, F.normalize(weight))
+            self.assertTrue(torch.allclose(logits, logits2))
+            inputs = [hidden_states]
+            if weight_requires_grad:
+                inputs.append(weight)
+            grad_output = torch.randn_like(logits)
+            grads = torch.autograd.grad(logits, inputs, grad_output)
+            grads2 = torch.autograd.grad(logits2, inputs, grad_output)
+            for grad, grad2 in zip(grads, grads2):
+                self.assertTrue(torch.allclose(grad, grad2))
+
+    def test_lm_head_rnorm_cache(self):
+        from torch import nn
+        from swift.llm.utils.model import _get_lm_head_rnorm
+        lm_head = nn.Linear(8, 16, bias=False)
+        rnorm = _get_lm_head_rnorm(lm_head)
+        self.assertTrue(_get_lm_head_rnorm(lm_head) is rnorm)
+        self.assertTrue(
+            torch.allclose(rnorm, 1 / lm_head.weight.detach().norm(dim=1)))
+        # an in-place update, e.g. optimizer.step()
+        with torch.no_grad():
+            lm_head.weight.mul_(2)
+        rnorm2 = _get_lm_head_rnorm(lm_head)
+        self.assertTrue(rnorm2 is not rnorm)
+        self.assertTrue(torch.allclose(rnorm2, rnorm / 2))
+        lm_head.weight.grad = torch.ones_like(lm_head.weight)
+        torch.optim.SGD(lm_head.parameters(), lr=0.1).step()
+        self.assertTrue(
+            torch.allclose(
+                _get_lm_head_rnorm(lm_head),
+                1 / lm_head.weight.detach().norm(dim=1)))
+
     def test_print_example(self):
         input_ids = [1000, 2000, 3000, 4000, 5000, 6000]
         _, tokenizer = get_model_tokenizer(
@@ -1,3 +1,4 @@
+import math
 import os
 import shutil
 import tempfile
@@ -38,6 +39,25 @@ class TestIOUtils(unittest.TestCase):
         new_obj_list = read_from_jsonl(fpath)
         self.assertTrue(new_obj_list == obj_list)
 
+    def test_jsonl_format(self):
+        fpath = os.path.join(self.tmp_dir, '1.jsonl')
+        obj_list = [{
+            'query': '你好',
+            'value': float('nan')
+        }, {
+            'inf': [float('inf')]
+        }]
+        write_to_jsonl(fpath, obj_list[:1])
+        append_to_jsonl(fpath, obj_list[1])
+        with open(fpath, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertTrue(
+            lines == ['{"query": "你好", "value": NaN}', '{"inf": [Infinity]}'])
+        new_obj_list = read_from_jsonl(fpath)
+        self.assertTrue(new_obj_list[0]['query'] == '你好')
+        self.assertTrue(math.isnan(new_obj_list[0]['value']))
+        self.assertTrue(new_obj_list[1] == obj_list[1])
+
 
 if __name__ == '__main__':
     unittest.main()